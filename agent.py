@@ -1,16 +1,104 @@
-from typing import List, Dict, Tuple
+import threading
+import time
+from typing import List, Dict, Tuple, Iterator, Optional
 from pdf_processor import PDFProcessor
 from vector_store import VectorStore
-from llm_client import LLMClient
+from llm_client import LLMClient, OUT_OF_SCOPE_MARKER, is_error_response, is_out_of_scope_answer
 from config import Config
+from chunk_dedup import deduplicate_chunks, print_report as print_dedup_report
 from quick_action_cache import QuickActionCache
+from session_store import SessionStore, create_session_store
+from metrics import metrics
+from usage_tracker import usage_scope
+
+OUT_OF_SCOPE_MESSAGE = "抱歉，我仅支持线下店文档范围内的咨询。请询问关于教培机构运营、财务、风险处理等相关问题。"
+
+# 快捷操作 - 基于线下店文档关键词优化（静态数据，界面无需等待Agent加载即可展示）
+# section_keywords：可选，检索时只在标题含这些关键词的小节中查找（候选不足时退回全库检索）
+QUICK_ACTIONS = [
+    {
+        'title': '选址评估指南',
+        'description': '线下店选址标准与评估方法',
+        'query': '请说明线下店选址的具体标准、评估方法和注意事项，包括位置选择、人流分析、成本考虑、竞争环境评估等关键要素。'
+    },
+    {
+        'title': '成本控制策略',
+        'description': '租金、人力等成本控制标准',
+        'query': '请说明线下店成本控制的具体策略，包括租金比例控制（建议不超过15%）、人力成本管理（建议不超过40%）、运营费用优化等各项成本的最佳控制标准。',
+        'section_keywords': ['成本', '租金', '现金流']
+    },
+    {
+        'title': '运营管理体系',
+        'description': '日常运营管理流程与标准',
+        'query': '请说明线下店的运营管理体系，包括日常管理流程、标准化操作规范、效率提升方法、质量控制体系、学员管理流程等核心运营要素。'
+    },
+    {
+        'title': '财务管理规划',
+        'description': '现金流预测与财务指标',
+        'query': '请说明线下店的财务管理规划，包括现金流预测方法、财务指标监控体系、预警线设置标准、收入结构分析、支出控制策略等关键财务管理要素。',
+        'section_keywords': ['财务', '成本', '现金流', '营收']
+    },
+    {
+        'title': '盈利模式分析',
+        'description': '教培机构盈利模式与策略',
+        'query': '请分析线下教培机构的盈利模式，包括收入来源结构分析、利润结构优化、定价策略制定、成本控制方法、规模效应利用等盈利策略要素。'
+    },
+    {
+        'title': '装修设计方案',
+        'description': '线下店装修设计要点',
+        'query': '请说明线下店的装修设计方案，包括空间布局规划、装修标准制定、成本控制策略、安全规范要求、教学环境设计等装修设计要素。'
+    },
+    {
+        'title': '师资培训体系',
+        'description': '教师培训与管理方案',
+        'query': '请说明线下店的师资培训体系，包括教师招聘标准、培训方案设计、管理机制建立、绩效考核体系、职业发展规划等师资管理要素。'
+    },
+    {
+        'title': '营销推广策略',
+        'description': '招生营销与品牌推广',
+        'query': '请说明线下店的营销推广策略，包括招生方法设计、品牌推广策略、市场拓展计划、客户获取渠道、营销活动策划等营销推广要素。'
+    },
+    {
+        'title': '客户服务标准',
+        'description': '学员服务与满意度管理',
+        'query': '请说明线下店的客户服务标准，包括学员服务流程设计、满意度管理体系、投诉处理机制、客户关系维护、服务质量监控等客户服务要素。',
+        'section_keywords': ['服务', '投诉', '回访']
+    },
+    {
+        'title': '课程设计体系',
+        'description': '课程开发与教学设计',
+        'query': '请说明线下店的课程设计体系，包括课程开发流程、教学设计方法、质量保证体系、课程评估机制、教学资源管理等课程设计要素。'
+    },
+    {
+        'title': '团队建设方案',
+        'description': '团队管理与文化建设',
+        'query': '请说明线下店的团队建设方案，包括团队管理方法、文化建设策略、激励机制设计、沟通机制建立、团队协作模式等团队建设要素。'
+    },
+    {
+        'title': '风险控制体系',
+        'description': '风险识别与应对策略',
+        'query': '请说明线下店的风险控制体系，包括风险识别方法、预防措施制定、应对策略设计、应急预案建立、风险监控机制等风险控制要素。'
+    },
+    {
+        'title': '多店复制模型',
+        'description': '从单店到连锁的扩张策略',
+        'query': '请说明线下店的多店复制模型，包括扩张策略制定、标准化体系建设、管理复制方法、人才培养机制、品牌统一管理等多店复制要素。'
+    }
+]
 
 class IntelligentAgent:
-    def __init__(self):
-        self.vector_store = VectorStore()
-        self.llm_client = LLMClient()
+    def __init__(self, llm_client: LLMClient = None, session_store: SessionStore = None,
+                 vector_store: VectorStore = None):
+        # vector_store 可预先创建（如压测时先取其向量模型注入替身LLMClient），避免重复加载模型
+        self.vector_store = vector_store if vector_store is not None else VectorStore()
+        # 相关性判断复用知识库的向量模型（同一模型），启动时只加载一次
+        self.llm_client = llm_client or LLMClient(embedding_model=self.vector_store.model)
         self.conversation_history = []
+        # 按session_id保存的对话历史（SESSION_STORE=sqlite时多个工作进程共享）
+        self.sessions = session_store if session_store is not None else create_session_store()
         self.cache = QuickActionCache()  # 初始化缓存管理器
+        self._index_checked_at = time.monotonic()
+        self._swap_lock = threading.Lock()
         
         # 初始化知识库
         self._initialize_knowledge_base()
@@ -29,139 +117,231 @@ class IntelligentAgent:
         chunks = processor.process_document()
         
         if chunks:
-            # 添加到向量数据库
+            # 合并近似重复的文本块，减少向量化与检索开销
+            if Config.DEDUP_ENABLED:
+                chunks, report = deduplicate_chunks(chunks)
+                print_dedup_report(report)
+            
+            # 添加到向量数据库（写入新的版本目录）
             self.vector_store.add_chunks(chunks)
-            self.vector_store.save()
+            self.vector_store.publish()
             print("知识库构建完成")
         else:
             print("无法处理PDF文档，知识库构建失败")
     
-    def query(self, user_input: str) -> str:
-        """处理用户查询"""
-        # 检查查询相关性
-        if not self.llm_client.is_relevant_query(user_input):
-            return "抱歉，我仅支持线下店文档范围内的咨询。请询问关于教培机构运营、财务、风险处理等相关问题。"
+    def refresh_index(self, force: bool = False) -> bool:
+        """检测到新发布的知识库版本时切换索引，返回是否发生了切换
         
-        # 搜索相关文档
-        relevant_chunks = self.vector_store.search(user_input, top_k=5)  # 减少检索数量，提高响应速度
+        每隔 INDEX_RELOAD_CHECK_SECONDS 检查一次 CURRENT 指针；新索引加载完成后才替换引用，
+        进行中的查询仍持有旧索引直至结束。
+        """
+        now = time.monotonic()
+        if not force and now - self._index_checked_at < Config.INDEX_RELOAD_CHECK_SECONDS:
+            return False
+        self._index_checked_at = now
+        # 只有一个请求负责加载，其余请求继续使用旧索引
+        if not self._swap_lock.acquire(blocking=False):
+            return False
+        try:
+            old_store = self.vector_store
+            new_store = old_store.load_latest()
+            if new_store is None:
+                return False
+            self.vector_store = new_store
+            # 旧版本的回答缓存不再命中，释放内存
+            if self.llm_client.response_cache is not None and new_store.index_version != old_store.index_version:
+                self.llm_client.response_cache.clear()
+            metrics.inc('index_swaps')
+            print(f"🔄 知识库已切换到版本 {new_store.version_name}（{len(new_store.chunks)} 个文本块）")
+            return True
+        except Exception as e:
+            print(f"⚠️ 切换知识库版本失败，继续使用当前版本: {e}")
+            return False
+        finally:
+            self._swap_lock.release()
+    
+    def _load_history(self, conversation_history: Optional[List[Dict]], session_id: Optional[str]) -> List[Dict]:
+        """本次查询使用的对话历史：指定session_id时从会话存储读取"""
+        if session_id is not None:
+            return self.sessions.load(session_id)
+        return self.conversation_history if conversation_history is None else conversation_history
+    
+    def query(self, user_input: str, conversation_history: List[Dict] = None,
+              session_id: Optional[str] = None) -> str:
+        """处理用户查询
         
-        # 生成回答
-        response = self.llm_client.generate_response(
-            user_input, 
-            relevant_chunks, 
-            self.conversation_history
-        )
+        conversation_history: 指定会话的历史列表（原地更新），默认使用Agent自身的历史
+        session_id: 指定时从会话存储读取历史，回答后写回（优先于conversation_history）
+        """
+        history = self._load_history(conversation_history, session_id)
+        self.refresh_index()
+        store = self.vector_store  # 本次查询全程使用同一版本的索引
         
-        # 更新对话历史
-        self.conversation_history.append({
+        with metrics.span('query_total'):
+            # 检查查询相关性（单次往返模式下无法确定时为None，由生成时一并判断）
+            relevant = self._check_relevance(user_input)
+            if relevant is False:
+                return OUT_OF_SCOPE_MESSAGE
+            
+            # 搜索相关文档
+            relevant_chunks = self._search(store, user_input, top_k=5)  # 减少检索数量，提高响应速度
+            
+            # 生成回答
+            response = self.llm_client.generate_response(
+                user_input, 
+                relevant_chunks, 
+                history,
+                index_version=store.index_version,
+                judge_relevance=relevant is None
+            )
+            if relevant is None and self._judged_out_of_scope(user_input, response):
+                return OUT_OF_SCOPE_MESSAGE
+            
+            self._update_history(history, user_input, response, session_id)
+            return response
+    
+    def query_stream(self, user_input: str, conversation_history: List[Dict] = None,
+                     session_id: Optional[str] = None) -> Iterator[str]:
+        """流式处理用户查询，逐段返回回答文本"""
+        history = self._load_history(conversation_history, session_id)
+        self.refresh_index()
+        store = self.vector_store
+        
+        # 计时包含调用方消费各分片的时间，即从开始处理到最后一个分片交出为止
+        with metrics.span('query_total'):
+            relevant = self._check_relevance(user_input)
+            if relevant is False:
+                yield OUT_OF_SCOPE_MESSAGE
+                return
+            
+            relevant_chunks = self._search(store, user_input, top_k=5)
+            
+            stream = self.llm_client.generate_response_stream(
+                user_input, relevant_chunks, history, index_version=store.index_version,
+                judge_relevance=relevant is None
+            )
+            parts = []
+            if relevant is None:
+                # 先缓冲开头，直到能确定回答不是无关问题标记
+                for delta in stream:
+                    parts.append(delta)
+                    head = ''.join(parts).lstrip()
+                    if len(head) >= len(OUT_OF_SCOPE_MARKER) or not OUT_OF_SCOPE_MARKER.startswith(head):
+                        break
+                if self._judged_out_of_scope(user_input, ''.join(parts)):
+                    stream.close()
+                    yield OUT_OF_SCOPE_MESSAGE
+                    return
+                if parts:
+                    yield ''.join(parts)
+            
+            for delta in stream:
+                parts.append(delta)
+                yield delta
+            
+            self._update_history(history, user_input, ''.join(parts), session_id)
+    
+    def _check_relevance(self, user_input: str) -> Optional[bool]:
+        """相关性判断；单次往返模式下只看缓存与关键词，无法确定时返回None"""
+        if Config.SINGLE_ROUND_TRIP_ENABLED:
+            return self.llm_client.prejudge_relevance(user_input)
+        return self.llm_client.is_relevant_query(user_input)
+    
+    def _judged_out_of_scope(self, user_input: str, response: str) -> bool:
+        """单次往返模式：按回答记录相关性判断，返回模型是否判定为无关问题"""
+        if is_out_of_scope_answer(response):
+            metrics.inc('out_of_scope_marker_total')
+            self.llm_client.remember_relevance(user_input, False)
+            return True
+        if not is_error_response(response):
+            self.llm_client.remember_relevance(user_input, True)
+        return False
+    
+    def _update_history(self, history: List[Dict], user_input: str, response: str,
+                        session_id: Optional[str] = None):
+        """更新对话历史（原地修改，便于按会话传入的列表；指定session_id时写回会话存储）"""
+        history.append({
             'role': 'user',
             'content': user_input
         })
-        self.conversation_history.append({
+        history.append({
             'role': 'assistant',
             'content': response
         })
         
         # 保持对话历史在合理范围内
-        if len(self.conversation_history) > 6:  # 减少历史记录数量，提高响应速度
-            self.conversation_history = self.conversation_history[-6:]
+        if len(history) > 6:  # 减少历史记录数量，提高响应速度
+            del history[:-6]
         
-        return response
+        # 压缩历史回答，下次追问时只发送要点；会话存储序列化保存（如sqlite）时须在保存前完成，否则在后台计算
+        persist = session_id is not None and not self.sessions.shares_messages
+        self.llm_client.compact_history(history, wait=persist)
+        
+        if session_id is not None:
+            self.sessions.save(session_id, history)
     
-    def query_with_cache(self, user_input: str) -> str:
+    def query_with_cache(self, user_input: str, conversation_history: List[Dict] = None,
+                         cache_hit_delay: float = 5, session_id: Optional[str] = None) -> str:
         """处理用户查询（带缓存功能）"""
-        import time
+        self.refresh_index()
+        index_version = self.vector_store.index_version
         
-        # 首先检查缓存
-        cached_response = self.cache.get_cached_response(user_input)
+        # 首先检查缓存（知识库更新后，旧版本生成的缓存不再命中）
+        with metrics.span('cache_lookup'):
+            cached_response = self.cache.get_cached_response(user_input, index_version)
         if cached_response:
             print(f"📋 使用缓存响应: {user_input[:50]}...")
-            # 停5秒后返回缓存响应
-            time.sleep(5)
+            # 停顿片刻后返回缓存响应（界面默认5秒，API调用可设为0）
+            if cache_hit_delay:
+                time.sleep(cache_hit_delay)
             return cached_response
         
         # 如果没有缓存，调用大模型生成
         print(f"🤖 调用大模型生成: {user_input[:50]}...")
-        response = self.query(user_input)
+        # 快捷功能的token用量单独归类统计
+        action = self._quick_action(user_input)
+        with usage_scope(quick_action=action['title'] if action else None):
+            response = self.query(user_input, conversation_history, session_id)
         
-        # 缓存响应结果
-        self.cache.cache_response(user_input, response)
+        # 缓存响应结果（调用失败或服务繁忙的提示不缓存）
+        if not is_error_response(response):
+            with metrics.span('cache_write'):
+                self.cache.cache_response(user_input, response, index_version)
         
         return response
     
+    def _quick_action(self, user_input: str) -> Optional[Dict]:
+        """查询内容对应的快捷功能，非快捷功能返回None"""
+        for action in self.get_quick_actions():
+            if action['query'] == user_input:
+                return action
+        return None
+    
+    def _search_filters(self, store: VectorStore, user_input: str, top_k: int) -> Optional[Dict]:
+        """快捷功能限定检索的小节；匹配的文本块不足top_k时不过滤"""
+        action = self._quick_action(user_input)
+        if not action or not action.get('section_keywords'):
+            return None
+        filters = {'section_title': {'contains': action['section_keywords']}}
+        rows = store.chunks.filter_rows(filters)
+        if rows is None or len(rows) < top_k:
+            return None
+        return filters
+    
+    def _search(self, store: VectorStore, user_input: str, top_k: int = 5) -> List[Tuple[Dict, float]]:
+        """检索相关文档块（快捷功能按小节过滤后再计算相似度）"""
+        return store.search(user_input, top_k=top_k, filters=self._search_filters(store, user_input, top_k))
+    
     def get_quick_actions(self) -> List[Dict]:
         """获取快捷操作 - 基于线下店文档关键词优化"""
-        return [
-            {
-                'title': '选址评估指南',
-                'description': '线下店选址标准与评估方法',
-                'query': '请说明线下店选址的具体标准、评估方法和注意事项，包括位置选择、人流分析、成本考虑、竞争环境评估等关键要素。'
-            },
-            {
-                'title': '成本控制策略',
-                'description': '租金、人力等成本控制标准',
-                'query': '请说明线下店成本控制的具体策略，包括租金比例控制（建议不超过15%）、人力成本管理（建议不超过40%）、运营费用优化等各项成本的最佳控制标准。'
-            },
-            {
-                'title': '运营管理体系',
-                'description': '日常运营管理流程与标准',
-                'query': '请说明线下店的运营管理体系，包括日常管理流程、标准化操作规范、效率提升方法、质量控制体系、学员管理流程等核心运营要素。'
-            },
-            {
-                'title': '财务管理规划',
-                'description': '现金流预测与财务指标',
-                'query': '请说明线下店的财务管理规划，包括现金流预测方法、财务指标监控体系、预警线设置标准、收入结构分析、支出控制策略等关键财务管理要素。'
-            },
-            {
-                'title': '盈利模式分析',
-                'description': '教培机构盈利模式与策略',
-                'query': '请分析线下教培机构的盈利模式，包括收入来源结构分析、利润结构优化、定价策略制定、成本控制方法、规模效应利用等盈利策略要素。'
-            },
-            {
-                'title': '装修设计方案',
-                'description': '线下店装修设计要点',
-                'query': '请说明线下店的装修设计方案，包括空间布局规划、装修标准制定、成本控制策略、安全规范要求、教学环境设计等装修设计要素。'
-            },
-            {
-                'title': '师资培训体系',
-                'description': '教师培训与管理方案',
-                'query': '请说明线下店的师资培训体系，包括教师招聘标准、培训方案设计、管理机制建立、绩效考核体系、职业发展规划等师资管理要素。'
-            },
-            {
-                'title': '营销推广策略',
-                'description': '招生营销与品牌推广',
-                'query': '请说明线下店的营销推广策略，包括招生方法设计、品牌推广策略、市场拓展计划、客户获取渠道、营销活动策划等营销推广要素。'
-            },
-            {
-                'title': '客户服务标准',
-                'description': '学员服务与满意度管理',
-                'query': '请说明线下店的客户服务标准，包括学员服务流程设计、满意度管理体系、投诉处理机制、客户关系维护、服务质量监控等客户服务要素。'
-            },
-            {
-                'title': '课程设计体系',
-                'description': '课程开发与教学设计',
-                'query': '请说明线下店的课程设计体系，包括课程开发流程、教学设计方法、质量保证体系、课程评估机制、教学资源管理等课程设计要素。'
-            },
-            {
-                'title': '团队建设方案',
-                'description': '团队管理与文化建设',
-                'query': '请说明线下店的团队建设方案，包括团队管理方法、文化建设策略、激励机制设计、沟通机制建立、团队协作模式等团队建设要素。'
-            },
-            {
-                'title': '风险控制体系',
-                'description': '风险识别与应对策略',
-                'query': '请说明线下店的风险控制体系，包括风险识别方法、预防措施制定、应对策略设计、应急预案建立、风险监控机制等风险控制要素。'
-            },
-            {
-                'title': '多店复制模型',
-                'description': '从单店到连锁的扩张策略',
-                'query': '请说明线下店的多店复制模型，包括扩张策略制定、标准化体系建设、管理复制方法、人才培养机制、品牌统一管理等多店复制要素。'
-            }
-        ]
-    
-    def clear_history(self):
-        """清空对话历史"""
-        self.conversation_history = []
+        return QUICK_ACTIONS
+    
+    def clear_history(self, session_id: Optional[str] = None):
+        """清空对话历史（指定session_id时删除该会话）"""
+        if session_id is not None:
+            self.sessions.delete(session_id)
+        else:
+            self.conversation_history = []
 
 if __name__ == "__main__":
     # 测试智能客服Agent
@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+"""
+教培管家 - 无界面HTTP/JSON API服务
+
+基于asyncio标准库实现，不依赖额外Web框架。接口列表：
+  GET    /healthz                    存活检查
+  GET    /metrics                    Prometheus文本格式指标
+  GET    /v1/metrics                 指标JSON快照
+  GET    /readyz                     就绪检查（模型与知识库加载完成后返回200）
+  POST   /v1/query                   问答 {"query": "...", "session_id": "可选"}
+  POST   /v1/query/stream            流式问答（SSE）
+  GET    /v1/quick-actions           快捷功能列表
+  POST   /v1/quick-actions/<序号>     执行快捷功能（带缓存）
+  GET    /v1/cache/stats             缓存统计
+  GET    /v1/embedding/stats         查询向量批处理统计
+  GET    /v1/usage                   大模型token用量与费用统计
+  GET    /v1/llm/stats               大模型调用的熔断状态、对冲率与对冲前后的p99延迟
+  DELETE /v1/sessions/<session_id>   删除会话
+
+用法：
+  python api_server.py --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from metrics import metrics
+from usage_tracker import usage_scope, usage_tracker
+
+HTTP_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class HTTPError(Exception):
+    """请求处理过程中需要直接返回给客户端的错误"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class SessionManager:
+    """服务端会话管理：session_id -> 会话锁（LRU淘汰）
+
+    对话历史由 agent.sessions（会话存储）按session_id保存，SESSION_STORE=sqlite 时
+    同一会话的请求可落在任意工作进程；这里只保证本进程内同一会话的请求串行。
+    会话锁为 asyncio.Lock，在事件循环中排队，等待中的请求不占用线程池。
+    """
+
+    def __init__(self, max_sessions: int = Config.API_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Tuple[str, Dict]:
+        """获取会话，不存在时创建；返回 (session_id, session)"""
+        with self._lock:
+            if session_id and session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+                return session_id, self._sessions[session_id]
+
+            session_id = session_id or uuid.uuid4().hex
+            session = {
+                'lock': asyncio.Lock(),  # 同一会话的请求串行执行，保证历史顺序
+                'created_at': time.time(),
+            }
+            self._sessions[session_id] = session
+            self._evict_idle(keep=session_id)
+            return session_id, session
+
+    def _evict_idle(self, keep: str):
+        """从最久未用的会话起淘汰，直到不超过上限；跳过锁被持有（含排队等待）的会话
+
+        淘汰进行中的会话会使它的下一个请求拿到新锁，与进行中的请求并发执行，后写回的历史覆盖先写回的。
+        所有会话都在处理中时暂时超出上限；keep 为刚创建、即将使用的会话，不淘汰。
+        """
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions:
+                return
+            if session_id != keep and not self._sessions[session_id]['lock'].locked():
+                del self._sessions[session_id]
+
+    def delete(self, session_id: str) -> bool:
+        """删除本进程内的会话锁"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class AgentAPIServer:
+    """在IntelligentAgent之上提供HTTP/JSON接口"""
+
+    def __init__(self, agent=None, agent_factory=None,
+                 max_concurrency: int = Config.API_MAX_CONCURRENCY):
+        # agent可直接注入（测试时使用本地替身LLM），否则在后台线程中创建
+        self.agent = agent
+        self._agent_factory = agent_factory
+        self._load_error: Optional[str] = None
+        self._ready = threading.Event()
+        if agent is not None:
+            self._ready.set()
+
+        self.sessions = SessionManager()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='agent')
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._shutting_down = False
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+    def _load_agent(self):
+        """后台加载Agent（模型与知识库），完成后标记就绪"""
+        try:
+            if self._agent_factory is None:
+                from agent import IntelligentAgent
+                self._agent_factory = IntelligentAgent
+            self.agent = self._agent_factory()
+            self._ready.set()
+            print("✅ Agent已就绪")
+        except Exception as e:
+            self._load_error = str(e)
+            print(f"❌ Agent加载失败: {e}")
+
+    async def start(self, host: str = Config.API_HOST, port: int = Config.API_PORT,
+                    sock: Optional[socket.socket] = None):
+        """启动监听；Agent未注入时在后台线程加载"""
+        if not self._ready.is_set():
+            threading.Thread(target=self._load_agent, name='agent-loader', daemon=True).start()
+
+        if sock is not None:
+            self._server = await asyncio.start_server(self._handle_connection, sock=sock)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+
+        addresses = ', '.join(str(s.getsockname()) for s in self._server.sockets)
+        print(f"🚀 API服务已启动: {addresses}")
+
+    async def shutdown(self, timeout: float = Config.API_SHUTDOWN_TIMEOUT):
+        """优雅退出：停止接收新连接，等待进行中的请求完成"""
+        if self._shutting_down:
+            return
+        self._shutting_down = True
+        print("🛑 正在停止API服务...")
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ 等待超时，仍有 {self._inflight} 个请求未完成")
+
+        for writer in list(self._connections):
+            writer.close()
+        self.executor.shutdown(wait=False)
+        print("👋 API服务已停止")
+
+    async def serve_forever(self, host: str = Config.API_HOST, port: int = Config.API_PORT,
+                            sock: Optional[socket.socket] = None):
+        """启动服务并等待SIGINT/SIGTERM后优雅退出"""
+        await self.start(host, port, sock)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows等平台不支持add_signal_handler
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+
+        await stop.wait()
+        await self.shutdown()
+
+    # ------------------------------------------------------------------
+    # HTTP协议处理
+    # ------------------------------------------------------------------
+    @staticmethod
+    async def _readline(reader: asyncio.StreamReader) -> bytes:
+        try:
+            return await reader.readline()
+        except ValueError:
+            # 单行超过StreamReader缓冲上限
+            raise HTTPError(400, '请求行或请求头过长')
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Dict]:
+        """解析一个HTTP/1.1请求；连接关闭时返回None"""
+        request_line = await self._readline(reader)
+        if not request_line:
+            return None
+
+        try:
+            method, target, version = request_line.decode('latin-1').strip().split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, '请求行格式错误')
+
+        headers = {}
+        while True:
+            line = await self._readline(reader)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        body = b''
+        try:
+            length = int(headers.get('content-length', '0') or 0)
+        except ValueError:
+            raise HTTPError(400, 'Content-Length 格式错误')
+        if length < 0:
+            raise HTTPError(400, 'Content-Length 不能为负数')
+        if length > Config.API_MAX_BODY_BYTES:
+            raise HTTPError(413, '请求体过大')
+        if length:
+            body = await reader.readexactly(length)
+
+        path = target.split('?', 1)[0]
+        keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+        return {'method': method.upper(), 'path': path, 'headers': headers,
+                'body': body, 'keep_alive': keep_alive}
+
+    async def _write_response(self, writer: asyncio.StreamWriter, status: int,
+                              payload, keep_alive: bool = False, content_type: str = 'application/json'):
+        """写出完整响应"""
+        if isinstance(payload, (dict, list)):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        elif isinstance(payload, str):
+            body = payload.encode('utf-8')
+        else:
+            body = payload
+
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理单个TCP连接，支持keep-alive"""
+        self._connections.add(writer)
+        try:
+            while not self._shutting_down:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._write_response(writer, e.status, {'error': e.message})
+                    break
+                if request is None:
+                    break
+
+                self._inflight += 1
+                self._idle.clear()
+                try:
+                    keep_alive = await self._dispatch(request, writer)
+                finally:
+                    self._inflight -= 1
+                    if self._inflight == 0:
+                        self._idle.set()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, request: Dict, writer: asyncio.StreamWriter) -> bool:
+        """路由请求，返回连接是否保持"""
+        method, path = request['method'], request['path']
+        keep_alive = request['keep_alive'] and not self._shutting_down
+
+        try:
+            if path == '/healthz':
+                self._require_method(method, 'GET')
+                await self._write_response(writer, 200, {'status': 'ok'}, keep_alive)
+                return keep_alive
+
+            if path == '/readyz':
+                self._require_method(method, 'GET')
+                ready = self._ready.is_set() and not self._shutting_down
+                payload = {'ready': ready}
+                if self._load_error:
+                    payload['error'] = self._load_error
+                await self._write_response(writer, 200 if ready else 503, payload, keep_alive)
+                return keep_alive
+
+            if path == '/metrics':
+                self._require_method(method, 'GET')
+                await self._write_response(writer, 200, metrics.render_prometheus(), keep_alive,
+                                           content_type='text/plain; version=0.0.4; charset=utf-8')
+                return keep_alive
+
+            if path == '/v1/metrics':
+                self._require_method(method, 'GET')
+                await self._write_response(writer, 200, metrics.snapshot(), keep_alive)
+                return keep_alive
+
+            self._require_ready()
+
+            if path == '/v1/query':
+                self._require_method(method, 'POST')
+                await self._write_response(writer, 200, await self._handle_query(request), keep_alive)
+                return keep_alive
+
+            if path == '/v1/query/stream':
+                self._require_method(method, 'POST')
+                await self._handle_query_stream(request, writer)
+                return False
+
+            if path == '/v1/quick-actions':
+                self._require_method(method, 'GET')
+                actions = self.agent.get_quick_actions()
+                payload = [dict(action, index=i) for i, action in enumerate(actions)]
+                await self._write_response(writer, 200, payload, keep_alive)
+                return keep_alive
+
+            if path.startswith('/v1/quick-actions/'):
+                self._require_method(method, 'POST')
+                payload = await self._handle_quick_action(request, path.rsplit('/', 1)[-1])
+                await self._write_response(writer, 200, payload, keep_alive)
+                return keep_alive
+
+            if path == '/v1/cache/stats':
+                self._require_method(method, 'GET')
+                payload = dict(self.agent.cache.get_cache_stats())
+                response_cache = self.agent.llm_client.response_cache
+                payload['response_cache'] = response_cache.get_stats() if response_cache is not None else None
+                await self._write_response(writer, 200, payload, keep_alive)
+                return keep_alive
+
+            if path == '/v1/embedding/stats':
+                self._require_method(method, 'GET')
+                store = self.agent.vector_store
+                if store.batcher is not None:
+                    payload = store.batcher.get_stats()
+                elif hasattr(store.model, 'get_stats'):
+                    payload = store.model.get_stats()  # 独立向量化进程中的批处理统计
+                else:
+                    payload = {'enabled': False}
+                await self._write_response(writer, 200, payload, keep_alive)
+                return keep_alive
+
+            if path == '/v1/llm/stats':
+                self._require_method(method, 'GET')
+                llm_client = self.agent.llm_client
+                payload = {
+                    'circuit_breaker': llm_client.resilience.breaker.state,
+                    'hedging': llm_client.hedger.get_stats(),
+                }
+                await self._write_response(writer, 200, payload, keep_alive)
+                return keep_alive
+
+            if path == '/v1/usage':
+                self._require_method(method, 'GET')
+                await self._write_response(writer, 200, usage_tracker.get_stats(), keep_alive)
+                return keep_alive
+
+            if path.startswith('/v1/sessions/'):
+                self._require_method(method, 'DELETE')
+                session_id = path.rsplit('/', 1)[-1]
+                self.sessions.delete(session_id)
+                deleted = self.agent.sessions.delete(session_id)
+                await self._write_response(writer, 200 if deleted else 404, {'deleted': deleted}, keep_alive)
+                return keep_alive
+
+            raise HTTPError(404, f'未知路径: {path}')
+
+        except HTTPError as e:
+            await self._write_response(writer, e.status, {'error': e.message}, keep_alive)
+            return keep_alive
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as e:
+            print(f"❌ 请求处理失败 {method} {path}: {e}")
+            await self._write_response(writer, 500, {'error': str(e)})
+            return False
+
+    def _require_method(self, method: str, expected: str):
+        if method != expected:
+            raise HTTPError(405, f'仅支持 {expected}')
+
+    def _require_ready(self):
+        if not self._ready.is_set():
+            raise HTTPError(503, self._load_error or '服务正在加载模型与知识库')
+
+    def _parse_json(self, request: Dict) -> Dict:
+        try:
+            data = json.loads(request['body'] or b'{}')
+        except ValueError:
+            raise HTTPError(400, '请求体不是合法的JSON')
+        if not isinstance(data, dict):
+            raise HTTPError(400, '请求体必须是JSON对象')
+        return data
+
+    def _parse_query(self, request: Dict) -> Tuple[str, Optional[str]]:
+        data = self._parse_json(request)
+        query = data.get('query')
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, '缺少query字段')
+        return query.strip(), data.get('session_id')
+
+    # ------------------------------------------------------------------
+    # 业务接口
+    # ------------------------------------------------------------------
+    async def _run_in_session(self, session_id: str, session: Dict, func, *args):
+        """在线程池中执行阻塞调用；同一会话先在事件循环中排队，轮到时才占用工作线程"""
+        def call():
+            with usage_scope(session_id=session_id):
+                return func(*args)
+
+        loop = asyncio.get_running_loop()
+        async with session['lock']:
+            return await loop.run_in_executor(self.executor, call)
+
+    async def _handle_query(self, request: Dict) -> Dict:
+        query, session_id = self._parse_query(request)
+        session_id, session = self.sessions.get_or_create(session_id)
+
+        started = time.perf_counter()
+        answer = await self._run_in_session(session_id, session, self.agent.query, query, None, session_id)
+        return {
+            'session_id': session_id,
+            'answer': answer,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            'session_usage': usage_tracker.get_session_stats(session_id),
+        }
+
+    async def _handle_quick_action(self, request: Dict, index: str) -> Dict:
+        actions = self.agent.get_quick_actions()
+        try:
+            action = actions[int(index)]
+        except (ValueError, IndexError):
+            raise HTTPError(404, f'快捷功能不存在: {index}')
+
+        data = self._parse_json(request)
+        session_id, session = self.sessions.get_or_create(data.get('session_id'))
+
+        started = time.perf_counter()
+        answer = await self._run_in_session(
+            session_id, session, self.agent.query_with_cache, action['query'], None, 0, session_id
+        )
+        return {
+            'session_id': session_id,
+            'title': action['title'],
+            'answer': answer,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            'session_usage': usage_tracker.get_session_stats(session_id),
+        }
+
+    async def _handle_query_stream(self, request: Dict, writer: asyncio.StreamWriter):
+        """SSE流式问答：event: session / delta / done"""
+        query, session_id = self._parse_query(request)
+        session_id, session = self.sessions.get_or_create(session_id)
+
+        head = (
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: text/event-stream; charset=utf-8\r\n"
+            "Cache-Control: no-cache\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode('latin-1'))
+        writer.write(self._sse('session', {'session_id': session_id}))
+        await writer.drain()
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        done = object()
+
+        def produce():
+            # 在工作线程中迭代生成器，通过事件循环把增量文本送回
+            try:
+                with usage_scope(session_id=session_id):
+                    for delta in self.agent.query_stream(query, session_id=session_id):
+                        if cancelled.is_set():
+                            break
+                        loop.call_soon_threadsafe(queue.put_nowait, delta)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, HTTPError(500, str(e)))
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        started = time.perf_counter()
+        async with session['lock']:
+            producer = loop.run_in_executor(self.executor, produce)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is done:
+                        break
+                    if isinstance(item, HTTPError):
+                        writer.write(self._sse('error', {'error': item.message}))
+                    else:
+                        writer.write(self._sse('delta', {'text': item}))
+                    await writer.drain()
+
+                elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+                writer.write(self._sse('done', {'session_id': session_id, 'elapsed_ms': elapsed_ms}))
+                await writer.drain()
+            finally:
+                cancelled.set()
+                await producer
+
+    @staticmethod
+    def _sse(event: str, data: Dict) -> bytes:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
+
+def _bind_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    """创建监听socket；多进程模式下使用SO_REUSEPORT由内核分发连接"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+def run_worker(host: str, port: int, reuse_port: bool = False):
+    """单个工作进程入口"""
+    sock = _bind_socket(host, port, reuse_port)
+    server = AgentAPIServer()
+    asyncio.run(server.serve_forever(sock=sock))
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="教培管家 HTTP API 服务")
+    parser.add_argument('--host', default=Config.API_HOST)
+    parser.add_argument('--port', type=int, default=Config.API_PORT)
+    parser.add_argument('--workers', type=int, default=Config.API_WORKERS, help='工作进程数')
+    args = parser.parse_args(argv)
+
+    if args.workers <= 1:
+        run_worker(args.host, args.port)
+        return
+
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        print("⚠️ 当前平台不支持SO_REUSEPORT，退回单进程模式")
+        run_worker(args.host, args.port)
+        return
+
+    # 同一会话的请求会被分发到不同工作进程，对话历史需要共享存储（与 run.py 一致；子进程按环境变量读取配置）
+    os.environ.setdefault("SESSION_STORE", "sqlite")
+    if os.environ["SESSION_STORE"] == "memory":
+        print("⚠️ SESSION_STORE=memory：各工作进程只保存各自收到的对话轮次，多轮对话会丢失上下文")
+
+    # 多进程：由内核在进程间分发连接；未设置 EMBEDDING_SERVICE_SOCKET 时每个进程独立加载模型
+    # （python run.py --api --workers N 会先启动共享的向量化进程）
+    ctx = multiprocessing.get_context('spawn')
+    workers = [
+        ctx.Process(target=run_worker, args=(args.host, args.port, True), name=f'api-worker-{i}')
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    print(f"🚀 已启动 {len(workers)} 个工作进程")
+
+    def forward(signum, _frame):
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()  # 发送SIGTERM，子进程内优雅退出
+
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+
+    for worker in workers:
+        worker.join()
+    print("👋 所有工作进程已退出")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 import streamlit as st
 import time
-from agent import IntelligentAgent
+from agent import QUICK_ACTIONS
+from config import Config
+from metrics import metrics
+from usage_tracker import usage_scope, usage_tracker
+from warmup import get_warmup
 import os
+import uuid
 
 # 页面配置
 st.set_page_config(
@@ -124,10 +129,10 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# 初始化会话状态
-if 'agent' not in st.session_state:
-    st.session_state.agent = IntelligentAgent()
+# 模型与知识库在后台线程加载（进程内各会话共享），页面无需等待即可渲染
+warmup = get_warmup()
 
+# 初始化会话状态
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
@@ -137,7 +142,92 @@ if 'processing' not in st.session_state:
 if 'user_input' not in st.session_state:
     st.session_state.user_input = ""
 
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex  # 发送给大模型的对话历史按此id保存在会话存储中
+
+# 各阶段中文名称（性能面板展示用）
+STAGE_LABELS = {
+    'query_total': '整体查询',
+    'cache_lookup': '缓存查找',
+    'keyword_score': '关键词评分',
+    'llm_relevance': '大模型相关性',
+    'query_embedding': '查询向量化',
+    'search': '向量检索',
+    'context_build': '上下文构建',
+    'response_cache_lookup': '回答缓存查找',
+    'generation': '回答生成',
+    'generation_first_token': '首字延迟',
+    'cache_write': '缓存写入',
+    'startup_imports': '启动-导入依赖',
+    'startup_agent_init': '启动-加载模型与知识库',
+}
+
+def render_performance_panel():
+    """侧边栏性能面板：各阶段耗时统计"""
+    if not metrics.enabled:
+        st.caption("性能指标未开启（METRICS_ENABLED=0）")
+        return
+    
+    stages = metrics.snapshot()['stages']
+    if not stages:
+        st.caption("暂无数据，发起一次查询后显示")
+        return
+    
+    rows = []
+    for stage, stats in stages.items():
+        rows.append({
+            '阶段': STAGE_LABELS.get(stage, stage),
+            '次数': stats['count'],
+            '平均(ms)': round(stats['avg_ms'], 1),
+            'p50(ms)': round(stats['p50_ms'], 1),
+            'p95(ms)': round(stats['p95_ms'], 1),
+        })
+    st.table(rows)
+
+# 提示词组成部分中文名称
+COMPONENT_LABELS = {'system': '系统提示词', 'history': '对话历史', 'context': '检索上下文', 'query': '用户问题'}
+
+def render_usage_panel():
+    """侧边栏用量面板：本会话与全局的token用量、费用"""
+    session_stats = usage_tracker.get_session_stats(st.session_state.session_id)
+    st.markdown(
+        f"**本会话**: {session_stats['calls']} 次调用，"
+        f"输入 {session_stats['input_tokens']} / 输出 {session_stats['output_tokens']} tokens，"
+        f"约 ¥{session_stats['cost']:.4f}"
+    )
+    
+    stats = usage_tracker.get_stats()
+    if stats['stages']:
+        st.table([
+            {
+                '阶段': '相关性判断' if stage == 'relevance' else '回答生成' if stage == 'generation' else stage,
+                '调用': totals['calls'],
+                '输入tokens': totals['input_tokens'],
+                '输出tokens': totals['output_tokens'],
+                '费用(¥)': round(totals['cost'], 4),
+            }
+            for stage, totals in stats['stages'].items()
+        ])
+    
+    components = stats['prompt_components']
+    total = sum(components.values())
+    if total:
+        st.markdown("**生成提示词构成**")
+        for component, tokens in components.items():
+            st.markdown(f"- {COMPONENT_LABELS.get(component, component)}: {tokens} tokens（{tokens / total:.0%}）")
+
+def render_warmup_status():
+    """加载进度提示（未就绪时展示）"""
+    status = warmup.status()
+    if status['state'] == 'failed':
+        st.error(f"❌ 知识库加载失败: {status['error']}")
+    else:
+        st.info(f"⏳ 正在{status['step'] or '加载模型与知识库'}...（已用时 {status['elapsed_seconds']:.0f} 秒），"
+                "完成后即可开始提问")
+
 def main():
+    agent = warmup.agent if warmup.ready else None
+    
     # 侧边栏
     with st.sidebar:
         # 功能说明
@@ -153,23 +243,29 @@ def main():
         
         st.markdown("### 🚀 常见问题")
         
-        # 快捷操作
-        quick_actions = st.session_state.agent.get_quick_actions()
-        for action in quick_actions:
+        # 快捷操作（静态数据，加载期间也可选择，就绪后自动回答）
+        for action in QUICK_ACTIONS:
             if st.button(f"📋 {action['title']}", key=f"quick_{action['title']}"):
                 st.session_state.messages.append({"role": "user", "content": action['query']})
                 st.session_state.processing = True
                 st.rerun()
         
-        # 缓存统计信息
-        cache_stats = st.session_state.agent.cache.get_cache_stats()
-        st.markdown(f"**缓存状态**: {cache_stats['total_cached']} 个缓存")
-        
-        # 清空缓存按钮
-        if st.button("🗑️ 清空缓存", key="clear_cache"):
-            st.session_state.agent.cache.clear_cache()
-            st.success("缓存已清空")
-            st.rerun()
+        if agent is not None:
+            # 缓存统计信息
+            cache_stats = agent.cache.get_cache_stats()
+            st.markdown(f"**缓存状态**: {cache_stats['total_cached']} 个缓存")
+            response_cache = agent.llm_client.response_cache
+            if response_cache is not None:
+                response_stats = response_cache.get_stats()
+                st.markdown(f"**回答缓存**: {response_stats['entries']} 条，命中率 {response_stats['hit_rate']:.0%}")
+            
+            # 清空缓存按钮
+            if st.button("🗑️ 清空缓存", key="clear_cache"):
+                agent.cache.clear_cache()
+                if response_cache is not None:
+                    response_cache.clear()
+                st.success("缓存已清空")
+                st.rerun()
         
         st.markdown("---")
         
@@ -178,28 +274,32 @@ def main():
         st.markdown("### ℹ️ 系统信息")
         st.markdown(f"对话轮数: {len(st.session_state.messages) // 2}")
         
-        # API状态检查
-        try:
-            import dashscope
-            if dashscope.api_key:
-                st.success("✅ API连接正常")
-            else:
-                st.error("❌ 请设置API密钥")
-        except Exception as e:
-            st.error("❌ API配置错误")
+        # API状态检查（只检查配置，避免在界面线程中导入dashscope）
+        if Config.DASHSCOPE_API_KEY:
+            st.success("✅ API连接正常")
+        else:
+            st.error("❌ 请设置API密钥")
         
         st.markdown("---")
         st.markdown("### 📊 知识库状态")
         # 向量数据库信息
-        if hasattr(st.session_state.agent.vector_store, 'vectors'):
-            vector_count = len(st.session_state.agent.vector_store.vectors)
+        if agent is not None:
+            vector_count = len(agent.vector_store.vectors)
         
             if vector_count > 0:
-                st.success("✅ 知识库已加载")
+                st.success(f"✅ 知识库已加载（启动用时 {warmup.status()['elapsed_seconds']:.1f} 秒）")
             else:
                 st.warning("⚠️ 知识库为空")
-        else:
+        elif warmup.state == 'failed':
             st.error("❌ 知识库未初始化")
+        else:
+            st.info("⏳ 知识库加载中...")
+        
+        st.markdown("---")
+        with st.expander("⏱️ 性能监控", expanded=False):
+            render_performance_panel()
+        with st.expander("💰 Token用量", expanded=False):
+            render_usage_panel()
     
     # 主界面
     # 使用container确保主界面固定布局
@@ -220,6 +320,9 @@ def main():
             # 对话区域
             st.markdown("### 💬 智能对话")
             
+            if agent is None:
+                render_warmup_status()
+            
             # 显示对话历史
             for message in st.session_state.messages:
                 if message["role"] == "user":
@@ -241,14 +344,15 @@ def main():
                     </div>
                     """, unsafe_allow_html=True)
             
-            # 处理中的状态
-            if st.session_state.processing:
+            # 处理中的状态（Agent就绪前保留待回答的问题）
+            if st.session_state.processing and agent is not None:
                 with st.spinner("🤔 正在思考中..."):
                     # 获取最后一条用户消息
                     if st.session_state.messages:
                         last_user_message = st.session_state.messages[-1]["content"]
                         # 使用带缓存的查询方法
-                        response = st.session_state.agent.query_with_cache(last_user_message)
+                        with usage_scope(session_id=st.session_state.session_id):
+                            response = agent.query_with_cache(last_user_message, session_id=st.session_state.session_id)
                         st.session_state.messages.append({"role": "assistant", "content": response})
                         st.session_state.processing = False
                         st.rerun()
@@ -287,8 +391,14 @@ def main():
             # 操作按钮
             if st.button("🗑️ 清空对话历史", use_container_width=True):
                 st.session_state.messages = []
-                st.session_state.agent.clear_history()
+                if agent is not None:
+                    agent.clear_history(st.session_state.session_id)
                 st.rerun()
+    
+    # 加载期间定时刷新，就绪后自动切换为可用状态
+    if agent is None and warmup.state == 'loading':
+        time.sleep(1)
+        st.rerun()
        
 
 if __name__ == "__main__":
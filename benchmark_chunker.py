@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+分块器吞吐基准与一致性校验
+
+在不同规模的合成中文文本上测量 PDFProcessor 清理+分块的吞吐（MB/s），并与改写前的
+实现（ReferenceChunker，原样保留于此仅作对照）逐块比对输出，确认结果完全一致、
+吞吐不随文本规模下降（线性扩展）。
+
+用法：
+  python benchmark_chunker.py                       # 1 / 4 / 16 MB 合成文本
+  python benchmark_chunker.py --sizes-mb 1 8 --pdf  # 额外在 线下店文档.pdf 上比对
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from typing import Dict, List
+
+from config import Config
+from pdf_processor import PDFProcessor
+
+_HEADING_TEMPLATES = ['{n} 概述', '{n}.{m} {t}', '{cn}、{t}', '（{cn}）{t}', '第{n}章 {t}', '（{n}）{t}', '{t}：']
+_CN_NUMBERS = '一二三四五六七八九十'
+_TOPICS = ['选址评估', '成本控制', '现金流管理', '师资培训', '招生营销', '课程设计', '风险处理', '客户服务']
+_SENTENCE_PARTS = ['线下店', '教培机构', '租金比例', '人力成本', '续费率', '转化率', '家长满意度',
+                   '课程质量', '现金流', '营收目标', '校区运营', '市场推广', '学员管理', '品牌口碑']
+_ENDINGS = '。。。！？；;'
+
+
+class ReferenceChunker:
+    """改写前的清理与分块实现（逐行多次正则、字符串反复拼接），仅用于一致性校验与吞吐对照"""
+
+    def __init__(self, chunk_size: int = Config.CHUNK_SIZE, chunk_overlap: int = Config.CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def clean_text(self, text: str) -> str:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        text = re.sub(r'\n?=== 第\d+页 ===\n?', '\n', text)
+        text = re.sub(r'[ \t]+', ' ', text)
+        lines = [line.strip() for line in text.split('\n')]
+        text = '\n'.join(lines)
+        text = re.sub(r'\n{3,}', '\n\n', text)
+        return text.strip('\n ')
+
+    def _is_heading(self, line: str) -> bool:
+        if not line:
+            return False
+        candidate = line.strip()
+        if len(candidate) == 0:
+            return False
+        is_relatively_short = len(candidate) <= 30
+        patterns = [
+            r'^\d{1,3}(?:[\.|．]\d{1,3}){0,3}[\s、).)]+',
+            r'^[（\(]?\d{1,3}[）\)]',
+            r'^[一二三四五六七八九十百千万]+、',
+            r'^[（\(][一二三四五六七八九十百千万]+[）\)]',
+            r'^第[一二三四五六七八九十百千万0-9]+[章节部分卷]',
+        ]
+        looks_like_title_suffix = is_relatively_short and candidate.endswith((':', '：'))
+        for p in patterns:
+            if re.match(p, candidate):
+                return True
+        no_sentence_ending = not re.search(r'[。！？.!?；;]$', candidate)
+        return is_relatively_short and (looks_like_title_suffix or no_sentence_ending)
+
+    def _split_into_sections(self, text: str) -> List[Dict]:
+        lines = [line for line in text.split('\n') if line is not None]
+        sections: List[Dict] = []
+        current_title = '正文'
+        current_lines: List[str] = []
+        detected_any_heading = False
+        for line in lines:
+            if self._is_heading(line):
+                if current_lines:
+                    sections.append({'title': current_title, 'text': '\n'.join(current_lines).strip()})
+                current_title = line.strip()
+                current_lines = []
+                detected_any_heading = True
+            else:
+                current_lines.append(line)
+        if current_lines:
+            sections.append({'title': current_title, 'text': '\n'.join(current_lines).strip()})
+        if not detected_any_heading:
+            return [{'title': '全文', 'text': text.strip()}]
+        return sections
+
+    def _chunk_section(self, section_text: str, section_title: str, section_index: int) -> List[Dict]:
+        parts = re.split(r'([。！？!?；;])', section_text)
+        sentences: List[str] = []
+        for i in range(0, len(parts), 2):
+            if i < len(parts):
+                sentence = parts[i].strip()
+                if i + 1 < len(parts):
+                    sentence += parts[i + 1]
+                if sentence:
+                    sentences.append(sentence)
+        if not sentences:
+            sentences = [s for s in section_text.split('\n') if s.strip()]
+        chunks: List[Dict] = []
+        current_chunk = ''
+        chunk_id = 0
+        for sentence in sentences:
+            if len(current_chunk) + len(sentence) > self.chunk_size and current_chunk:
+                chunks.append({'text': current_chunk.strip(), 'chunk_id': chunk_id, 'length': len(current_chunk),
+                               'section_title': section_title, 'section_index': section_index})
+                chunk_id += 1
+                overlap_start = max(0, len(current_chunk) - self.chunk_overlap)
+                current_chunk = current_chunk[overlap_start:] + sentence
+            else:
+                current_chunk += sentence
+        if current_chunk.strip():
+            chunks.append({'text': current_chunk.strip(), 'chunk_id': chunk_id, 'length': len(current_chunk),
+                           'section_title': section_title, 'section_index': section_index})
+        return chunks
+
+    def split_into_chunks(self, text: str) -> List[Dict]:
+        all_chunks: List[Dict] = []
+        for idx, sec in enumerate(self._split_into_sections(text)):
+            all_chunks.extend(self._chunk_section(sec['text'], sec['title'], idx))
+        return all_chunks
+
+
+def generate_text(size_mb: float, seed: int = 0) -> str:
+    """合成类似PDF提取结果的中文文本：页面标记、各类编号标题、长短句、多余空白与空行"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    parts: List[str] = []
+    size = 0
+    page = 1
+    while size < target:
+        if rng.random() < 0.05:
+            piece = f"\n=== 第{page}页 ===\n"
+            page += 1
+        elif rng.random() < 0.12:
+            piece = rng.choice(_HEADING_TEMPLATES).format(
+                n=rng.randint(1, 20), m=rng.randint(1, 9), cn=rng.choice(_CN_NUMBERS), t=rng.choice(_TOPICS)
+            ) + rng.choice(['\n', '\r\n', ' \n'])
+        else:
+            words = ''.join(rng.choice(_SENTENCE_PARTS) for _ in range(rng.randint(2, 30)))
+            piece = words + rng.choice(_ENDINGS) + rng.choice(['', '', ' ', '\t', '\n', '\n\n\n', '  \n'])
+        parts.append(piece)
+        size += len(piece.encode('utf-8'))
+    return ''.join(parts)
+
+
+def _silent(func, *args):
+    """运行时屏蔽PDFProcessor的进度输出"""
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def run_pipeline(chunker, text: str) -> List[Dict]:
+    return _silent(lambda: chunker.split_into_chunks(chunker.clean_text(text)))
+
+
+def measure(text: str, repeat: int = 3) -> Dict:
+    """新旧实现各运行repeat次取最快一次，返回吞吐与一致性"""
+    megabytes = len(text.encode('utf-8')) / (1024 * 1024)
+    result = {'size_mb': round(megabytes, 2)}
+    outputs = {}
+    for name, chunker in (('current', PDFProcessor(Config.PDF_PATH)), ('reference', ReferenceChunker())):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            outputs[name] = run_pipeline(chunker, text)
+            best = min(best, time.perf_counter() - started)
+        result[f'{name}_seconds'] = round(best, 3)
+        result[f'{name}_mb_per_s'] = round(megabytes / best, 2)
+    result['chunks'] = len(outputs['current'])
+    result['identical'] = outputs['current'] == outputs['reference']
+    result['speedup'] = round(result['reference_seconds'] / result['current_seconds'], 2)
+    return result
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="分块器吞吐基准与一致性校验")
+    parser.add_argument('--sizes-mb', type=float, nargs='+', default=[1, 4, 16], help='合成文本大小（MB）')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pdf', action='store_true', help=f'额外在 {Config.PDF_PATH} 上比对')
+    parser.add_argument('--output', default='', help='JSON结果输出路径')
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.pdf:
+        raw = _silent(PDFProcessor(Config.PDF_PATH).extract_text)
+        if raw:
+            results.append({'source': Config.PDF_PATH, **measure(raw, args.repeat)})
+        else:
+            print(f"⚠️ 无法读取 {Config.PDF_PATH}，跳过")
+    for size in args.sizes_mb:
+        results.append({'source': 'synthetic', **measure(generate_text(size, args.seed), args.repeat)})
+
+    print(f"\n{'来源':<14}{'MB':>8}{'文本块':>9}{'改写后MB/s':>13}{'改写前MB/s':>13}{'加速':>8}  一致")
+    for r in results:
+        print(f"{r['source'][:12]:<14}{r['size_mb']:>8}{r['chunks']:>9}{r['current_mb_per_s']:>13}"
+              f"{r['reference_mb_per_s']:>13}{r['speedup']:>8}  {'✅' if r['identical'] else '❌'}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到 {args.output}")
+    if not all(r['identical'] for r in results):
+        raise SystemExit("❌ 改写后的分块结果与改写前不一致")
+
+
+if __name__ == "__main__":
+    main()
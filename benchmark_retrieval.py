@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+VectorStore 检索基准测试
+
+在合成语料（10k / 100k / 1M 向量）上测量各索引模式的：
+  构建耗时、保存/加载耗时、索引文件大小、进程RSS、单查询延迟、批量查询延迟、recall@k（以精确检索为基准）
+结果以JSON输出，便于跨提交对比。
+
+语料来源：
+  random  按种子生成的高斯簇向量
+  pkl     以现有知识库（vector_db）中的真实向量为中心加噪扰动
+
+用法：
+  python benchmark_retrieval.py --sizes 10000 100000 --queries 50 --output bench_results/retrieval.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import Config
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+CHUNKS_PER_SECTION = 8   # 合成语料中每个小节包含的文本块数
+GENERATE_BATCH = 50_000  # 分批生成向量，控制峰值内存
+SYNTHETIC_TEXT_PREFIX = '合成文本块'
+
+
+# ----------------------------------------------------------------------
+# 索引模式注册表：名称 -> {prepare, search, batch}
+#   prepare(store)              构建阶段的额外索引准备（可选）
+#   search(store, vector, k)    单查询，返回 [(chunk, score)]
+#   batch(store, vectors, k)    批量查询（可选，缺省时逐条调用search）
+# ----------------------------------------------------------------------
+INDEX_MODES: Dict[str, Dict[str, Optional[Callable]]] = {
+    'exact': {
+        'prepare': None,
+        'search': lambda store, vector, k: store.search_by_vector(vector, k),
+        'batch': None,
+    },
+    # 分层检索：先按小节中心向量选出若干小节，只在其中精确计算（中心向量随索引保存与加载）
+    'hierarchical': {
+        'prepare': lambda store: store.section_centroids(),
+        'search': lambda store, vector, k: store.search_by_vector(vector, k, hierarchical=True),
+        'batch': None,
+    },
+}
+
+
+def _pca_mode(dim: int) -> Dict[str, Optional[Callable]]:
+    """PCA降维到dim维后精确检索（投影矩阵随索引保存，加载后无需重新拟合）"""
+    return {
+        'prepare': lambda store: store.projection is not None or store.fit_projection(dim),
+        'search': lambda store, vector, k: store.search_by_vector(vector, k),
+        'batch': None,
+    }
+
+
+INDEX_MODES['pca256'] = _pca_mode(256)
+INDEX_MODES['pca128'] = _pca_mode(128)
+
+
+def register_mode(name: str, search: Callable, prepare: Callable = None, batch: Callable = None):
+    """注册一个索引模式"""
+    INDEX_MODES[name] = {'prepare': prepare, 'search': search, 'batch': batch}
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB）"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+
+def estimate_store_bytes(size: int, dim: int) -> int:
+    """估算VectorStore在内存中的占用（float32向量及其归一化副本，加列式元数据）"""
+    return size * dim * 4 * 2 + size * 64
+
+
+# ----------------------------------------------------------------------
+# 合成语料
+# ----------------------------------------------------------------------
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def load_centers(source: str, dim: int, rng: np.random.Generator, clusters: int = 256) -> np.ndarray:
+    """语料中心：真实向量或随机中心"""
+    if source == 'pkl':
+        from vector_store import VectorStore
+        store = VectorStore(load_model=False)
+        if store.load() and len(store.vectors):
+            return _normalize(np.array(store.vectors, dtype=np.float32))
+        print(f"⚠️ 未找到 {Config.VECTOR_DB_PATH} 下的知识库，改用随机中心")
+    return _normalize(rng.standard_normal((clusters, dim)).astype(np.float32))
+
+
+def generate_corpus(size: int, dim: int, source: str, noise: float, seed: int):
+    """生成合成向量与文本块元数据"""
+    rng = np.random.default_rng(seed)
+    centers = load_centers(source, dim, rng)
+    dim = centers.shape[1]
+
+    # 同一小节的文本块取自同一中心（与真实手册一致：小节内主题相近）
+    section_center = rng.integers(0, len(centers), size // CHUNKS_PER_SECTION + 1)
+    vectors = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, GENERATE_BATCH):
+        end = min(size, start + GENERATE_BATCH)
+        assignment = section_center[np.arange(start, end) // CHUNKS_PER_SECTION]
+        block = centers[assignment] + noise * rng.standard_normal((end - start, dim)).astype(np.float32)
+        vectors[start:end] = _normalize(block)
+
+    chunks = [
+        {
+            'text': f'{SYNTHETIC_TEXT_PREFIX}{i}',
+            'chunk_id': i % CHUNKS_PER_SECTION,
+            'length': 100,
+            'section_title': f'合成小节{i // CHUNKS_PER_SECTION}',
+            'section_index': i // CHUNKS_PER_SECTION,
+        }
+        for i in range(size)
+    ]
+    return vectors, chunks
+
+
+def generate_queries(vectors: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    """以语料中随机向量加噪作为查询"""
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(vectors), count)
+    queries = vectors[picks] + noise * rng.standard_normal((count, vectors.shape[1])).astype(np.float32)
+    return _normalize(queries)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block: int = 100_000) -> np.ndarray:
+    """分块精确计算余弦相似度top-k，作为recall基准"""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(vectors), block):
+        scores = queries @ vectors[start:start + block].T
+        ids = np.arange(start, start + scores.shape[1])[np.newaxis, :].repeat(len(queries), axis=0)
+        merged_scores = np.concatenate([best_scores, scores], axis=1)
+        merged_ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best_ids = np.take_along_axis(merged_ids, top, axis=1)
+    return best_ids
+
+
+def _row_ids(results) -> List[int]:
+    """由合成文本（'合成文本块{行号}'）还原行号"""
+    return [int(chunk['text'][len(SYNTHETIC_TEXT_PREFIX):]) for chunk, _ in results]
+
+
+def _latency_summary(samples: List[float]) -> Dict:
+    data = np.array(samples) * 1000
+    return {
+        'mean_ms': round(float(np.mean(data)), 3),
+        'p50_ms': round(float(np.percentile(data, 50)), 3),
+        'p95_ms': round(float(np.percentile(data, 95)), 3),
+        'p99_ms': round(float(np.percentile(data, 99)), 3),
+    }
+
+
+# ----------------------------------------------------------------------
+# 单个(规模, 模式)的基准测试
+# ----------------------------------------------------------------------
+def run_case(size: int, mode: str, args) -> Dict:
+    """在当前进程中测量一个规模/模式组合"""
+    from vector_store import VectorStore
+
+    result = {'size': size, 'mode': mode, 'dim': args.dim, 'source': args.source}
+    estimated = estimate_store_bytes(size, args.dim)
+    if estimated > args.max_memory_gb * 1024 ** 3:
+        result['skipped'] = f'预计内存 {estimated / 1024 ** 3:.1f}GB 超过上限 {args.max_memory_gb}GB'
+        return result
+
+    spec = INDEX_MODES[mode]
+    rss_start = rss_mb()
+    vectors, chunks = generate_corpus(size, args.dim, args.source, args.noise, args.seed)
+    result['dim'] = int(vectors.shape[1])
+    queries = generate_queries(vectors, args.queries, args.query_noise, args.seed)
+    truth = exact_top_k(vectors, queries, args.k)
+
+    workdir = tempfile.mkdtemp(prefix='bench_retrieval_')
+    try:
+        # 构建
+        store = VectorStore(load_model=False, db_path=workdir)
+        started = time.perf_counter()
+        store.set_vectors(chunks, vectors)
+        if spec['prepare'] is not None:
+            spec['prepare'](store)
+        result['build_seconds'] = round(time.perf_counter() - started, 3)
+        del vectors
+
+        started = time.perf_counter()
+        store.save()
+        result['save_seconds'] = round(time.perf_counter() - started, 3)
+        result['index_bytes'] = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(workdir) for name in names
+        )
+        del store, chunks
+
+        # 加载
+        store = VectorStore(load_model=False, db_path=workdir)
+        started = time.perf_counter()
+        store.load()
+        if spec['prepare'] is not None:
+            spec['prepare'](store)
+        result['load_seconds'] = round(time.perf_counter() - started, 3)
+        result['rss_mb'] = round(rss_mb(), 1)
+        result['rss_delta_mb'] = round(result['rss_mb'] - rss_start, 1)
+
+        # 单查询延迟与recall
+        search = spec['search']
+        for vector in queries[:min(3, len(queries))]:
+            search(store, vector, args.k)  # 预热
+        latencies, hits = [], 0
+        for vector, expected in zip(queries, truth):
+            started = time.perf_counter()
+            results = search(store, vector, args.k)
+            latencies.append(time.perf_counter() - started)
+            hits += len(set(_row_ids(results)) & set(expected.tolist()))
+        result['single_query'] = _latency_summary(latencies)
+        result[f'recall_at_{args.k}'] = round(hits / (len(queries) * args.k), 4)
+
+        # 批量查询延迟
+        batch = spec['batch'] or (lambda s, vs, k: [search(s, v, k) for v in vs])
+        batch_queries = queries[:args.batch_size]
+        started = time.perf_counter()
+        batch(store, batch_queries, args.k)
+        elapsed = time.perf_counter() - started
+        result['batch_query'] = {
+            'batch_size': len(batch_queries),
+            'total_ms': round(elapsed * 1000, 3),
+            'per_query_ms': round(elapsed * 1000 / len(batch_queries), 3),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return result
+
+
+def _run_case_isolated(size: int, mode: str, args) -> Dict:
+    """在独立子进程中运行，保证RSS统计互不干扰"""
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        return pool.apply(run_case, (size, mode, args))
+
+
+def _run_metadata() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="VectorStore 检索基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='语料规模（向量数）')
+    parser.add_argument('--modes', nargs='+', default=None, help=f'索引模式，可选: {", ".join(INDEX_MODES)}')
+    parser.add_argument('--source', choices=['random', 'pkl'], default='pkl', help='合成语料来源')
+    parser.add_argument('--dim', type=int, default=768, help='random来源时的向量维度')
+    parser.add_argument('--noise', type=float, default=0.05, help='语料向量相对中心的扰动幅度')
+    parser.add_argument('--query-noise', type=float, default=0.03, help='查询向量的扰动幅度')
+    parser.add_argument('--queries', type=int, default=50, help='单查询测试次数')
+    parser.add_argument('--batch-size', type=int, default=32, help='批量查询的批大小')
+    parser.add_argument('--k', type=int, default=5, help='top-k')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--max-memory-gb', type=float, default=16, help='预计内存超过该值时跳过')
+    parser.add_argument('--no-isolate', action='store_true', help='不使用子进程隔离（RSS会相互影响）')
+    parser.add_argument('--output', default='', help='JSON结果输出路径')
+    args = parser.parse_args(argv)
+
+    modes = args.modes or list(INDEX_MODES)
+    unknown = [mode for mode in modes if mode not in INDEX_MODES]
+    if unknown:
+        parser.error(f"未知索引模式: {', '.join(unknown)}")
+
+    report = {'meta': _run_metadata(), 'params': vars(args), 'results': []}
+    for size in args.sizes:
+        for mode in modes:
+            print(f"⏱️ 规模 {size:,} | 模式 {mode} ...", flush=True)
+            runner = run_case if args.no_isolate else _run_case_isolated
+            result = runner(size, mode, args)
+            report['results'].append(result)
+            if 'skipped' in result:
+                print(f"   ⚠️ 跳过: {result['skipped']}")
+            else:
+                print(f"   构建 {result['build_seconds']}s | 加载 {result['load_seconds']}s | "
+                      f"RSS {result['rss_mb']}MB | 单查询p50 {result['single_query']['p50_ms']}ms | "
+                      f"recall@{args.k} {result[f'recall_at_{args.k}']}")
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"💾 结果已保存到 {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
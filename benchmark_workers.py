@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+多进程部署的内存对比
+
+  standalone  N个工作进程各自加载向量模型（torch）与索引（原有方式）
+  shared      1个向量化进程 + N个工作进程：工作进程经Unix socket获取查询向量，索引以内存映射共享
+
+每个工作进程创建 VectorStore、加载索引并执行若干次检索（触达模型与索引页），全部就绪后由父进程读取
+/proc/<pid>/smaps_rollup 中的 RSS 与 PSS。RSS 把共享页重复计入每个进程，合计会高估；
+PSS 把共享页按共享进程数分摊，合计即为部署的实际内存占用。
+
+用法：
+  python benchmark_workers.py --workers 4
+  python benchmark_workers.py --workers 2 4 8 --output bench_results/workers.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from config import Config
+
+SAMPLE_QUERIES = [
+    '线下店选址有什么注意事项？',
+    '租金占营收的比例控制在多少合适？',
+    '如何提高学员续费率？',
+    '遇到家长投诉应该怎么处理？',
+    '新校区开业前需要做哪些准备？',
+]
+
+
+def process_memory(pid: int) -> Dict[str, float]:
+    """进程的RSS与PSS（MB）；不支持smaps_rollup的系统上PSS记为RSS"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in ('Rss', 'Pss'):
+                    values[name.lower()] = int(rest.split()[0]) / 1024
+    except OSError:
+        pass
+    if 'rss' not in values:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    values['rss'] = int(line.split()[1]) / 1024
+    values.setdefault('pss', values['rss'])
+    return values
+
+
+def _worker(socket_path: str, queries: List[str], ready, release):
+    """工作进程：加载索引与（远程或本地）向量模型，检索后保持驻留直到父进程测量完成"""
+    Config.EMBEDDING_SERVICE_SOCKET = socket_path
+    from vector_store import VectorStore
+    with contextlib.redirect_stdout(io.StringIO()):
+        store = VectorStore()
+        loaded = store.load()
+        for query in queries:
+            store.search(query, top_k=5)
+    ready.put((os.getpid(), loaded))
+    release.wait()
+
+
+def measure(mode: str, workers: int, queries: List[str], socket_path: str) -> Dict:
+    """启动一种部署方式并测量各进程内存"""
+    ctx = multiprocessing.get_context('spawn')
+    service: Optional[subprocess.Popen] = None
+    processes = []
+    started = time.perf_counter()
+    try:
+        if mode == 'shared':
+            from embedding_service import wait_until_ready
+            service = subprocess.Popen([sys.executable, 'embedding_service.py', '--socket', socket_path],
+                                       stdout=subprocess.DEVNULL)
+            if not wait_until_ready(socket_path, process=service):
+                raise RuntimeError('向量化进程启动失败')
+
+        ready, release = ctx.Queue(), ctx.Event()
+        processes = [ctx.Process(target=_worker, args=(socket_path if mode == 'shared' else '', queries,
+                                                       ready, release))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        pids = []
+        for _ in processes:
+            pid, loaded = ready.get(timeout=600)
+            if not loaded:
+                raise RuntimeError('工作进程未能加载知识库索引，请先运行 python rebuild_knowledge_base.py')
+            pids.append(pid)
+        ready_seconds = time.perf_counter() - started
+
+        worker_memory = [process_memory(pid) for pid in pids]
+        service_memory = process_memory(service.pid) if service is not None else {'rss': 0.0, 'pss': 0.0}
+        release.set()
+        return {
+            'mode': mode,
+            'workers': workers,
+            'ready_seconds': round(ready_seconds, 1),
+            'worker_rss_mb': round(sum(m['rss'] for m in worker_memory) / workers, 1),
+            'worker_pss_mb': round(sum(m['pss'] for m in worker_memory) / workers, 1),
+            'service_rss_mb': round(service_memory['rss'], 1),
+            'total_rss_mb': round(sum(m['rss'] for m in worker_memory) + service_memory['rss'], 1),
+            'total_pss_mb': round(sum(m['pss'] for m in worker_memory) + service_memory['pss'], 1),
+        }
+    finally:
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        if service is not None:
+            service.terminate()
+            service.wait(timeout=10)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="多进程部署的内存对比（各自加载模型 vs 共享向量化进程）")
+    parser.add_argument('--workers', type=int, nargs='+', default=[4], help='工作进程数')
+    parser.add_argument('--modes', nargs='+', default=['standalone', 'shared'], choices=['standalone', 'shared'])
+    parser.add_argument('--output', default='', help='JSON结果输出路径')
+    args = parser.parse_args(argv)
+
+    socket_path = os.path.join(tempfile.mkdtemp(prefix='bench_workers_'), 'embedding.sock')
+    results = []
+    for workers in args.workers:
+        for mode in args.modes:
+            print(f"⏱️ {mode}: {workers} 个工作进程...")
+            results.append(measure(mode, workers, SAMPLE_QUERIES, socket_path))
+
+    print(f"\n{'方式':<12}{'进程':>6}{'就绪(s)':>9}{'单进程RSS':>11}{'单进程PSS':>11}"
+          f"{'向量化进程':>11}{'RSS合计':>10}{'PSS合计':>10}")
+    for r in results:
+        print(f"{r['mode']:<12}{r['workers']:>6}{r['ready_seconds']:>9}{r['worker_rss_mb']:>11}"
+              f"{r['worker_pss_mb']:>11}{r['service_rss_mb']:>11}{r['total_rss_mb']:>10}{r['total_pss_mb']:>10}")
+    print("（单位MB；PSS按共享进程数分摊共享页，PSS合计为实际内存占用）")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
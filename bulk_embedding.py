@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+构建知识库时的批量向量化
+
+VectorStore.add_chunks 默认对全部文本块调用一次 model.encode，只用一个进程。大规模重建时：
+  1. 按token长度排序后切分批次，同一批次内长度相近，padding最少
+  2. 批次分发到多进程池，每个进程固定torch线程数（并尽量绑定到互不重叠的CPU核），避免线程争抢
+  3. 超过模型最大序列长度（text2vec-base-chinese为128）的文本会被截断，超出部分的计算白白浪费，
+     构建前统计并提示
+
+用法：
+  python bulk_embedding.py                       # 检查现有知识库文本块的长度分布与截断情况
+  python bulk_embedding.py --repeat 50 --compare # 以知识库文本放大50倍，对比单进程encode与批量向量化
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from metrics import metrics
+from token_counter import get_token_counter
+
+DEFAULT_MAX_SEQ_LENGTH = 128
+SPECIAL_TOKENS = 2  # [CLS] 与 [SEP]
+
+# 工作进程内的模型（每个进程加载一次）
+_worker_model = None
+
+
+def model_source() -> str:
+    """向量模型的加载路径：优先本地目录，否则为在线模型名"""
+    if os.path.isdir(Config.EMBEDDING_MODEL_PATH):
+        return Config.EMBEDDING_MODEL_PATH
+    return Config.EMBEDDING_MODEL_NAME
+
+
+def model_max_seq_length(model=None) -> int:
+    """模型的最大序列长度：已加载的模型直接读取，否则读本地 sentence_bert_config.json"""
+    if model is not None and getattr(model, 'max_seq_length', None):
+        return int(model.max_seq_length)
+    config_file = os.path.join(Config.EMBEDDING_MODEL_PATH, 'sentence_bert_config.json')
+    if os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return int(json.load(f).get('max_seq_length', DEFAULT_MAX_SEQ_LENGTH))
+    return DEFAULT_MAX_SEQ_LENGTH
+
+
+def token_lengths(texts: List[str]) -> np.ndarray:
+    """各文本编码后的token数（含特殊token）"""
+    counter = get_token_counter()
+    return np.fromiter((counter.count(text) + SPECIAL_TOKENS for text in texts),
+                       dtype=np.int64, count=len(texts))
+
+
+def length_report(lengths: np.ndarray, max_seq_length: int) -> Dict:
+    """超长文本统计：被截断的文本数与被丢弃的token占比"""
+    over = lengths > max_seq_length
+    total = int(lengths.sum())
+    dropped = int((lengths[over] - max_seq_length).sum())
+    return {
+        'texts': int(len(lengths)),
+        'max_seq_length': max_seq_length,
+        'truncated_texts': int(over.sum()),
+        'truncated_ratio': round(float(over.mean()), 4) if len(lengths) else 0.0,
+        'dropped_token_ratio': round(dropped / total, 4) if total else 0.0,
+        'p50_tokens': int(np.percentile(lengths, 50)) if len(lengths) else 0,
+        'p95_tokens': int(np.percentile(lengths, 95)) if len(lengths) else 0,
+    }
+
+
+def warn_truncation(report: Dict):
+    if report['truncated_texts']:
+        print(f"⚠️ {report['truncated_texts']}/{report['texts']} 个文本块超过模型最大长度 "
+              f"{report['max_seq_length']} token（p95 {report['p95_tokens']}），超出部分会被截断，"
+              f"约 {report['dropped_token_ratio']:.1%} 的token不参与向量化；可考虑调小 CHUNK_SIZE")
+
+
+def bucket_batches(lengths: np.ndarray, batch_size: int) -> List[np.ndarray]:
+    """按长度排序后切分批次，返回各批次的原始下标"""
+    order = np.argsort(lengths, kind='stable')
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def padded_tokens(lengths: np.ndarray, batches: List[np.ndarray]) -> int:
+    """按批次内最长文本padding后的总token数"""
+    return int(sum(len(batch) * lengths[batch].max() for batch in batches if len(batch)))
+
+
+def _pin_worker(model_path: str, threads: int, cores):
+    """工作进程初始化：固定线程数、绑定CPU核并加载模型"""
+    global _worker_model
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[name] = str(threads)
+    if cores is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cores.get())
+        except (OSError, ValueError):
+            pass
+    import torch
+    torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_path)
+
+
+def _encode_batch(task: Tuple[int, List[str]]) -> Tuple[int, np.ndarray]:
+    batch_id, texts = task
+    vectors = _worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+    return batch_id, np.asarray(vectors, dtype=np.float32)
+
+
+class BulkEmbedder:
+    """长度分桶 + 多进程的批量向量化"""
+
+    def __init__(self, model=None, processes: int = Config.BULK_EMBED_PROCESSES,
+                 threads_per_process: int = Config.BULK_EMBED_THREADS,
+                 batch_size: int = Config.BULK_EMBED_BATCH_SIZE,
+                 min_texts_for_pool: int = Config.BULK_EMBED_MIN_TEXTS,
+                 model_path: str = None):
+        self.model = model
+        self.threads = max(1, threads_per_process)
+        self.processes = processes or max(1, (os.cpu_count() or 1) // self.threads)
+        self.batch_size = max(1, batch_size)
+        self.min_texts_for_pool = min_texts_for_pool
+        self.model_path = model_path or model_source()
+        self.stats: Dict = {}
+
+    def _use_pool(self, count: int) -> bool:
+        # 每个进程都要加载一次模型（数秒），文本较少时单进程更快
+        return self.processes > 1 and count >= self.min_texts_for_pool
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """向量化全部文本，返回与输入顺序一致的 (n, dim) float32 矩阵"""
+        started = time.perf_counter()
+        lengths = token_lengths(texts)
+        max_seq_length = model_max_seq_length(self.model)
+        report = length_report(lengths, max_seq_length)
+        warn_truncation(report)
+
+        # 截断后的实际长度决定padding
+        effective = np.minimum(lengths, max_seq_length)
+        batches = bucket_batches(effective, self.batch_size)
+        input_order = [np.arange(start, min(start + self.batch_size, len(texts)))
+                       for start in range(0, len(texts), self.batch_size)]
+
+        if self._use_pool(len(texts)):
+            results = self._encode_pool(texts, batches)
+            processes = self.processes
+        else:
+            results = self._encode_local(texts, batches)
+            processes = 1
+
+        vectors = None
+        for batch, batch_vectors in zip(batches, results):
+            if vectors is None:
+                vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+            vectors[batch] = batch_vectors
+        if vectors is None:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+
+        elapsed = time.perf_counter() - started
+        metrics.observe('bulk_embedding', elapsed)
+        self.stats = {
+            **report,
+            'processes': processes,
+            'threads_per_process': self.threads if processes > 1 else None,
+            'batches': len(batches),
+            'padding_efficiency': round(float(effective.sum()) / max(1, padded_tokens(effective, batches)), 4),
+            'padding_efficiency_unsorted': round(
+                float(effective.sum()) / max(1, padded_tokens(effective, input_order)), 4),
+            'seconds': round(elapsed, 3),
+            'texts_per_second': round(len(texts) / elapsed, 1) if elapsed else 0.0,
+        }
+        print(f"✅ 批量向量化完成: {len(texts)} 个文本，{processes} 个进程，{len(batches)} 个批次，"
+              f"用时 {elapsed:.1f}s（{self.stats['texts_per_second']} 个/秒，"
+              f"padding利用率 {self.stats['padding_efficiency']:.0%}）")
+        return vectors
+
+    def _encode_local(self, texts: List[str], batches: List[np.ndarray]) -> List[np.ndarray]:
+        if self.model is None:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.model_path)
+        results = []
+        for i, batch in enumerate(batches, 1):
+            batch_texts = [texts[j] for j in batch]
+            results.append(np.asarray(
+                self.model.encode(batch_texts, batch_size=len(batch_texts), show_progress_bar=False),
+                dtype=np.float32
+            ))
+            _print_progress(i, len(batches))
+        return results
+
+    def _encode_pool(self, texts: List[str], batches: List[np.ndarray]) -> List[np.ndarray]:
+        ctx = multiprocessing.get_context('spawn')
+        cores = None
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+        if len(available) >= self.processes * self.threads:
+            # 每个进程分到互不重叠的一组CPU核
+            cores = ctx.Queue()
+            for i in range(self.processes):
+                cores.put(set(available[i * self.threads:(i + 1) * self.threads]))
+
+        results: List[Optional[np.ndarray]] = [None] * len(batches)
+        tasks = [(i, [texts[j] for j in batch]) for i, batch in enumerate(batches)]
+        print(f"🚀 启动 {self.processes} 个向量化进程（每进程 {self.threads} 线程）")
+        with ctx.Pool(self.processes, initializer=_pin_worker,
+                      initargs=(self.model_path, self.threads, cores)) as pool:
+            for done, (batch_id, vectors) in enumerate(pool.imap_unordered(_encode_batch, tasks), 1):
+                results[batch_id] = vectors
+                _print_progress(done, len(tasks))
+        return results
+
+
+def _print_progress(done: int, total: int):
+    step = max(1, total // 10)
+    if done == total or done % step == 0:
+        print(f"  向量化进度 {done}/{total} 批次", flush=True)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="批量向量化：长度统计与吞吐对比")
+    parser.add_argument('--repeat', type=int, default=1, help='将知识库文本重复N次作为测试语料')
+    parser.add_argument('--processes', type=int, default=Config.BULK_EMBED_PROCESSES, help='进程数（0为自动）')
+    parser.add_argument('--threads', type=int, default=Config.BULK_EMBED_THREADS, help='每进程线程数')
+    parser.add_argument('--batch-size', type=int, default=Config.BULK_EMBED_BATCH_SIZE)
+    parser.add_argument('--compare', action='store_true', help='同时运行单进程 model.encode 作为对照')
+    args = parser.parse_args(argv)
+
+    from vector_store import VectorStore
+    store = VectorStore(load_model=False)
+    if not store.load():
+        return
+    texts = list(store.chunks.texts()) * max(1, args.repeat)
+
+    report = length_report(token_lengths(texts), model_max_seq_length())
+    print(f"\n📏 文本块token长度: p50 {report['p50_tokens']}，p95 {report['p95_tokens']}，"
+          f"超过 {report['max_seq_length']} 的有 {report['truncated_texts']}/{report['texts']} 个")
+    if args.repeat <= 1 and not args.compare:
+        warn_truncation(report)
+        return
+
+    embedder = BulkEmbedder(processes=args.processes, threads_per_process=args.threads,
+                            batch_size=args.batch_size, min_texts_for_pool=0)
+    vectors = embedder.encode(texts)
+    print(json.dumps(embedder.stats, ensure_ascii=False, indent=2))
+
+    if args.compare:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_source())
+        started = time.perf_counter()
+        baseline = np.asarray(model.encode(texts, show_progress_bar=False), dtype=np.float32)
+        elapsed = time.perf_counter() - started
+        print(f"\n📊 单进程 model.encode: {elapsed:.1f}s（{len(texts) / elapsed:.1f} 个/秒），"
+              f"批量向量化加速 {elapsed / embedder.stats['seconds']:.2f}x，"
+              f"向量最大差异 {float(np.abs(vectors - baseline).max()):.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+构建知识库时的近似重复文本块去重
+
+在 PDFProcessor 分块之后、VectorStore.add_chunks 向量化之前执行：
+  1. 文本规范化后取字符n-gram（shingle）
+  2. 计算MinHash签名，按LSH分段分桶找出候选对
+  3. 候选对用shingle集合的Jaccard相似度精确核验，超过阈值的并为一组
+  4. 每组保留一个代表文本块（最长者），其余块的来源信息合并到 sources 字段
+
+用法：
+  python chunk_dedup.py                # 检查现有知识库中的近似重复比例
+  python chunk_dedup.py --threshold 0.7
+"""
+
+import argparse
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+from config import Config
+
+# 大于2^32的素数；哈希值<2^32、系数<2^31，乘积不会溢出uint64
+_PRIME = np.uint64(4294967311)
+_NORMALIZE = re.compile(r'[\s　，,。.！!？?；;：:、“”"‘’\'（）()【】\[\]《》<>·…—\-]+')
+
+
+def _normalize(text: str) -> str:
+    """去掉空白与标点、统一大小写，避免排版差异影响相似度"""
+    return _NORMALIZE.sub('', text).lower()
+
+
+def shingles(text: str, size: int) -> Set[str]:
+    """字符n-gram集合（文本短于n时整体作为一个shingle）"""
+    text = _normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHashDeduplicator:
+    """基于MinHash/LSH的近似重复检测"""
+
+    def __init__(self, threshold: float = Config.DEDUP_THRESHOLD,
+                 shingle_size: int = Config.DEDUP_SHINGLE_SIZE,
+                 num_perm: int = Config.DEDUP_NUM_PERM, bands: int = Config.DEDUP_BANDS,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm({num_perm}) 必须能被 bands({bands}) 整除")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2 ** 31 - 1, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 2 ** 31 - 1, size=num_perm).astype(np.uint64)
+
+    def signature(self, shingle_set: Set[str]) -> np.ndarray:
+        """MinHash签名：每个置换下shingle哈希的最小值"""
+        if not shingle_set:
+            return np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingle_set),
+                             dtype=np.uint64, count=len(shingle_set))
+        permuted = (hashes[:, np.newaxis] * self._a + self._b) % _PRIME
+        return permuted.min(axis=0)
+
+    def candidate_pairs(self, signatures: List[np.ndarray]) -> Set[Tuple[int, int]]:
+        """LSH：任一分段签名完全相同的文本块成为候选对"""
+        pairs = set()
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            start = band * self.rows
+            for i, signature in enumerate(signatures):
+                buckets[signature[start:start + self.rows].tobytes()].append(i)
+            for members in buckets.values():
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        pairs.add((members[x], members[y]))
+        return pairs
+
+    def find_groups(self, texts: List[str]) -> List[List[int]]:
+        """返回近似重复组（按首个成员的位置排序，每组内下标升序），未重复的文本单独成组"""
+        shingle_sets = [shingles(text, self.shingle_size) for text in texts]
+        signatures = [self.signature(s) for s in shingle_sets]
+
+        parent = list(range(len(texts)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j in self.candidate_pairs(signatures):
+            if jaccard(shingle_sets[i], shingle_sets[j]) >= self.threshold:
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for i in range(len(texts)):
+            groups[find(i)].append(i)
+        return [groups[root] for root in sorted(groups)]
+
+
+def _provenance(chunk: Dict) -> Dict:
+    return {key: chunk[key] for key in ('document', 'section_index', 'section_title', 'chunk_id')
+            if key in chunk}
+
+
+def deduplicate_chunks(chunks: List[Dict], deduplicator: MinHashDeduplicator = None) -> Tuple[List[Dict], Dict]:
+    """合并近似重复的文本块，返回 (去重后的文本块, 统计报告)
+
+    每组保留最长的文本块（内容最完整），其 sources 字段记录组内所有文本块的来源；
+    去重后的顺序与各组首次出现的位置一致。
+    """
+    deduplicator = deduplicator or MinHashDeduplicator()
+    groups = deduplicator.find_groups([chunk['text'] for chunk in chunks])
+
+    result = []
+    for group in groups:
+        members = [chunks[i] for i in group]
+        canonical = dict(max(members, key=lambda chunk: len(chunk['text'])))
+        if len(members) > 1:
+            canonical['sources'] = [source for chunk in members
+                                    for source in chunk.get('sources', [_provenance(chunk)])]
+        result.append(canonical)
+
+    removed = len(chunks) - len(result)
+    report = {
+        'input_chunks': len(chunks),
+        'output_chunks': len(result),
+        'removed_chunks': removed,
+        'duplicate_groups': sum(1 for group in groups if len(group) > 1),
+        'dedup_ratio': round(removed / len(chunks), 4) if chunks else 0.0,
+        'threshold': deduplicator.threshold,
+    }
+    return result, report
+
+
+def print_report(report: Dict):
+    print(f"🧹 近似重复去重: {report['input_chunks']} -> {report['output_chunks']} 个文本块，"
+          f"合并 {report['duplicate_groups']} 组，去重比例 {report['dedup_ratio']:.1%}"
+          f"（阈值 {report['threshold']}）")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="检查知识库中的近似重复文本块")
+    parser.add_argument('--threshold', type=float, default=Config.DEDUP_THRESHOLD, help='Jaccard相似度阈值')
+    parser.add_argument('--shingle-size', type=int, default=Config.DEDUP_SHINGLE_SIZE, help='字符n-gram长度')
+    parser.add_argument('--show', type=int, default=5, help='展示的重复组数量')
+    args = parser.parse_args(argv)
+
+    from vector_store import VectorStore
+    store = VectorStore(load_model=False)
+    if not store.load():
+        return
+
+    deduplicator = MinHashDeduplicator(threshold=args.threshold, shingle_size=args.shingle_size)
+    deduped, report = deduplicate_chunks(store.chunks, deduplicator)
+    print_report(report)
+    for chunk in [chunk for chunk in deduped if 'sources' in chunk][:args.show]:
+        titles = '、'.join(str(source.get('section_title', '')) for source in chunk['sources'])
+        print(f"  - {chunk['text'][:40]}...  来源: {titles}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import json
+import os
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# 整数列（缺失值记为-1）与字符串类别列（按词表编码为整数，缺失值-1）
+INT_COLUMNS = ('chunk_id', 'section_index', 'length')
+CATEGORY_COLUMNS = ('section_title', 'document')
+# 可用于过滤检索的列，保存时预先计算倒排（值 -> 行号列表）
+FILTER_COLUMNS = ('section_index', 'section_title', 'document')
+
+META_FILE = 'chunk_meta.npz'
+TEXT_FILE = 'chunk_texts.bin'
+EXTRAS_FILE = 'chunk_extras.json'
+
+
+class ChunkStore:
+    """列式文本块存储
+
+    元数据（chunk_id、小节、长度、文本偏移等）保存为紧凑的NumPy数组，全部文本拼接为一个
+    UTF-8文件并以内存映射方式打开，按下标访问时才解码对应行。每个进程常驻内存只与文本块数量
+    相关，与文本总量无关。
+
+    支持 len()、下标访问与迭代，访问结果为与原先相同结构的dict。
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], vocabularies: Dict[str, List[str]],
+                 offsets: np.ndarray, texts, extras: Optional[Dict[int, Dict]] = None):
+        self.columns = columns
+        self.vocabularies = vocabularies
+        self.offsets = offsets          # int64，长度 n+1，第i行文本为 texts[offsets[i]:offsets[i+1]]
+        self._texts = texts             # bytes 或 np.memmap(uint8)
+        self.extras = extras or {}      # 少数文本块的其他字段（如去重合并的来源），按行号稀疏保存
+        # 倒排：列名 -> (升序的取值, 各取值在rows中的起始位置, 按取值分组的行号)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    # ------------------------------------------------------------------
+    # 构建与持久化
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[Dict]) -> 'ChunkStore':
+        """由文本块dict列表构建（文本保存在内存中，保存后再加载即为内存映射）"""
+        chunks = list(chunks)
+        columns = {name: np.full(len(chunks), -1, dtype=np.int32)
+                   for name in INT_COLUMNS + CATEGORY_COLUMNS}
+        vocabularies: Dict[str, List[str]] = {name: [] for name in CATEGORY_COLUMNS}
+        lookup: Dict[str, Dict[str, int]] = {name: {} for name in CATEGORY_COLUMNS}
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        encoded: List[bytes] = []
+        extras: Dict[int, Dict] = {}
+        known = set(INT_COLUMNS + CATEGORY_COLUMNS) | {'text'}
+
+        for row, chunk in enumerate(chunks):
+            data = chunk['text'].encode('utf-8')
+            encoded.append(data)
+            offsets[row + 1] = offsets[row] + len(data)
+            for name in INT_COLUMNS:
+                if chunk.get(name) is not None:
+                    columns[name][row] = chunk[name]
+            for name in CATEGORY_COLUMNS:
+                if chunk.get(name) is not None:
+                    value = str(chunk[name])
+                    if value not in lookup[name]:
+                        lookup[name][value] = len(vocabularies[name])
+                        vocabularies[name].append(value)
+                    columns[name][row] = lookup[name][value]
+            other = {key: value for key, value in chunk.items() if key not in known}
+            if other:
+                extras[row] = other
+
+        return cls(columns, vocabularies, offsets, b''.join(encoded), extras)
+
+    def save(self, directory: str):
+        """写入元数据数组、文本文件与稀疏的其他字段"""
+        postings = {}
+        for name in FILTER_COLUMNS:
+            values, starts, rows = self.posting_index(name)
+            postings.update({f'post_{name}_values': values, f'post_{name}_starts': starts,
+                             f'post_{name}_rows': rows})
+        np.savez(os.path.join(directory, META_FILE), offsets=self.offsets, **postings,
+                 **{f'col_{name}': values for name, values in self.columns.items()})
+        with open(os.path.join(directory, TEXT_FILE), 'wb') as f:
+            f.write(bytes(self._texts))
+        with open(os.path.join(directory, EXTRAS_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'vocabularies': self.vocabularies,
+                       'extras': {str(row): value for row, value in self.extras.items()}},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str) -> 'ChunkStore':
+        """加载元数据，文本以只读内存映射打开"""
+        with np.load(os.path.join(directory, META_FILE)) as meta:
+            offsets = meta['offsets']
+            columns = {key[len('col_'):]: meta[key] for key in meta.files if key.startswith('col_')}
+            postings = {
+                name: (meta[f'post_{name}_values'], meta[f'post_{name}_starts'], meta[f'post_{name}_rows'])
+                for name in FILTER_COLUMNS if f'post_{name}_rows' in meta.files
+            }
+        with open(os.path.join(directory, EXTRAS_FILE), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        text_path = os.path.join(directory, TEXT_FILE)
+        # 空文件无法映射
+        texts = np.memmap(text_path, dtype=np.uint8, mode='r') if os.path.getsize(text_path) else b''
+        extras = {int(row): value for row, value in info.get('extras', {}).items()}
+        store = cls(columns, info.get('vocabularies', {}), offsets, texts, extras)
+        store.postings = postings
+        return store
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return all(os.path.exists(os.path.join(directory, name)) for name in (META_FILE, TEXT_FILE, EXTRAS_FILE))
+
+    # ------------------------------------------------------------------
+    # 访问
+    # ------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def text(self, row: int) -> str:
+        """只解码一行文本"""
+        return bytes(self._texts[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+    def __getitem__(self, row) -> Dict:
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        chunk = {'text': self.text(row)}
+        for name in INT_COLUMNS:
+            value = int(self.columns[name][row])
+            if value != -1:
+                chunk[name] = value
+        for name in CATEGORY_COLUMNS:
+            value = int(self.columns[name][row])
+            if value != -1:
+                chunk[name] = self.vocabularies[name][value]
+        if row in self.extras:
+            chunk.update(self.extras[row])
+        return chunk
+
+    def rows(self, indices: Iterable[int]) -> List[Dict]:
+        """按下标批量取出文本块"""
+        return [self[i] for i in indices]
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def texts(self) -> Iterator[str]:
+        for row in range(len(self)):
+            yield self.text(row)
+
+    # ------------------------------------------------------------------
+    # 过滤
+    # ------------------------------------------------------------------
+    def posting_index(self, column: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """列的倒排索引（未预先计算时现场构建并缓存）"""
+        if column not in self.postings:
+            values = self.columns[column]
+            rows = np.argsort(values, kind='stable').astype(np.int32)  # 同一取值内行号保持升序
+            unique, starts = np.unique(values[rows], return_index=True)
+            self.postings[column] = (unique, np.append(starts, len(rows)).astype(np.int64), rows)
+        return self.postings[column]
+
+    def posting(self, column: str, value: int) -> np.ndarray:
+        """某列取值为value（类别列为词表编号）的行号，升序"""
+        unique, starts, rows = self.posting_index(column)
+        i = int(np.searchsorted(unique, value))
+        if i < len(unique) and unique[i] == value:
+            return rows[starts[i]:starts[i + 1]]
+        return rows[:0]
+
+    def _match_values(self, column: str, spec) -> List[int]:
+        """把过滤条件转换为列中的取值（类别列转换为词表编号）"""
+        if isinstance(spec, dict):
+            if column not in CATEGORY_COLUMNS or set(spec) != {'contains'}:
+                raise ValueError(f"不支持的过滤条件: {column}={spec}")
+            keywords = spec['contains']
+            keywords = [keywords] if isinstance(keywords, str) else keywords
+            # PDF提取的文本常含康熙部首等兼容字符，统一做NFKC规范化后再匹配
+            keywords = [unicodedata.normalize('NFKC', keyword) for keyword in keywords]
+            return [i for i, value in enumerate(self.vocabularies.get(column, []))
+                    if any(keyword in unicodedata.normalize('NFKC', value) for keyword in keywords)]
+
+        values = list(spec) if isinstance(spec, (list, tuple, set)) else [spec]
+        if column in CATEGORY_COLUMNS:
+            lookup = {value: i for i, value in enumerate(self.vocabularies.get(column, []))}
+            return [lookup[str(value)] for value in values if str(value) in lookup]
+        return [int(value) for value in values]
+
+    def filter_rows(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """按过滤条件取出行号（升序）；filters为空时返回None表示不过滤
+
+        filters 形如 {'section_index': [3, 4], 'section_title': {'contains': ['财务', '成本']},
+        'document': '线下店文档.pdf'}：同一列内多个取值为“或”，不同列之间为“且”。
+        """
+        if not filters:
+            return None
+        result = None
+        for column, spec in filters.items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"不支持按 {column} 过滤，可选: {', '.join(FILTER_COLUMNS)}")
+            postings = [self.posting(column, value) for value in self._match_values(column, spec)]
+            if not postings:
+                rows = np.zeros(0, dtype=np.int32)
+            elif len(postings) == 1:
+                rows = postings[0]
+            else:
+                rows = np.unique(np.concatenate(postings))
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+        return result
+
+    def memory_bytes(self) -> int:
+        """常驻内存的元数据大小（不含内存映射的文本）"""
+        size = self.offsets.nbytes + sum(values.nbytes for values in self.columns.values())
+        if isinstance(self._texts, bytes):
+            size += len(self._texts)
+        return size
@@ -7,15 +7,136 @@ class Config:
     # 阿里云通义千问配置
     DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "")
     DASHSCOPE_MODEL = "qwen-turbo"
-    
+    # 可选：自定义DashScope接口地址（用于本地替身服务/私有网关）
+    DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL", "")
+
+    # 大模型调用的限流、重试与熔断（限流按每进程计，多进程部署时按 账号配额 / 进程数 设置）
+    LLM_REQUEST_TIMEOUT = 30          # 单次请求超时（秒）
+    LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "300"))   # 每分钟请求数，0为不限流
+    LLM_RATE_LIMIT_BURST = 10         # 令牌桶容量（允许的突发请求数）
+    LLM_RATE_LIMIT_WAIT = 10          # 等待令牌的最长时间（秒），超时按服务不可用降级
+    LLM_MAX_RETRIES = 2               # 限流/服务端错误/网络连接失败与超时的最大重试次数
+    LLM_RETRY_BASE_DELAY = 0.5        # 指数退避的基准等待（秒），实际等待在 [0, base*2^n] 内随机
+    LLM_RETRY_MAX_DELAY = 8
+    LLM_BREAKER_FAILURE_THRESHOLD = 5     # 连续失败次数达到该值后熔断
+    LLM_BREAKER_RECOVERY_SECONDS = 30     # 熔断后等待多久放行探测请求
+
+    # 单次调用的总时限（秒，含重试与对冲；流式回答按首个分片计），超时按服务不可用降级
+    LLM_DEADLINE_RELEVANCE = 5
+    LLM_DEADLINE_GENERATION = 25
+
+    # 对冲请求：超过近期延迟的某个分位数仍无响应（流式为首个分片）时再发一个相同请求，先返回者胜出
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "1") != "0"
+    LLM_HEDGE_PERCENTILE = 95     # 等待时间取近期成功请求延迟的该分位数
+    LLM_HEDGE_MIN_DELAY = 0.5     # 等待时间下限（秒）
+    LLM_HEDGE_MIN_SAMPLES = 20    # 近期样本不足时不对冲
+    LLM_HEDGE_WINDOW = 200        # 参与计算分位数的最近成功请求数
+    LLM_HEDGE_BUDGET = 0.05       # 对冲请求占请求总数的上限
+    LLM_HEDGE_BURST = 5           # 可累积的对冲额度（应对短时集中变慢）
+
     # 向量数据库配置
     VECTOR_DB_PATH = "vector_db"
+    INDEX_KEEP_VERSIONS = 3          # 重建知识库后保留的历史版本数（可回滚）
+    INDEX_RELOAD_CHECK_SECONDS = 2   # 运行中的服务检查新版本的间隔
+    
+    # 向量模型（优先使用本地目录，不存在时从在线仓库加载）
+    EMBEDDING_MODEL_PATH = "./models/shibing624_text2vec-base-chinese"
+    EMBEDDING_MODEL_NAME = "shibing624/text2vec-base-chinese"
+    
+    # 检索多样性（MMR）：从较大的候选集中选出互不重复的结果，同样的token预算带入更多不同信息
+    # 默认关闭（可按次调用 search(mmr=True)）：当前知识库的文本块之间没有重叠窗口，
+    # 开启后会用相似度更低的文本块替换高分结果；在真实查询上确认不损失召回后再默认开启
+    MMR_ENABLED = False
+    MMR_LAMBDA = 0.5             # 1为只看相关性，越小越偏向多样性
+    MMR_CANDIDATE_POOL = 20      # 参与重排的候选数量
+    
+    # 分层检索：先用小节中心向量选出最相关的若干小节，只在其中的文本块上精确计算相似度
+    # （适合小节很多的大型手册；当前知识库每个小节只有少量文本块，默认关闭）
+    HIERARCHICAL_SEARCH_ENABLED = False
+    HIERARCHICAL_TOP_SECTIONS = 8   # 进入精确计算的小节数（文本块不足top_k时继续向后扩展）
+    
+    # PCA降维：构建知识库时把768维向量投影到PCA_DIM维（如256），检索计算量与索引内存按维度线性下降；
+    # 0为不降维。当前知识库只有约200个文本块，降维收益很小，默认关闭
+    PCA_DIM = int(os.getenv("PCA_DIM", "0"))
+    
+    # 启动快照（预先计算的派生数据，启动时直接映射，来源变化后自动失效）
+    STARTUP_SNAPSHOT_ENABLED = True
+    STARTUP_SNAPSHOT_FILE = "startup_snapshot.bin"   # 位于VECTOR_DB_PATH目录下
+    
+    # 查询向量微批处理配置（并发查询合并为一次encode）
+    EMBED_BATCHING_ENABLED = True
+    EMBED_MAX_BATCH_SIZE = 32   # 单批最多合并的查询数
+    EMBED_MAX_WAIT_MS = 5       # 凑批的最长等待时间（毫秒）
+
+    # 独立向量化进程（多进程部署时各工作进程共用一个模型，经Unix socket调用）
+    EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET", "")   # 为空则在本进程加载模型
+    EMBEDDING_SERVICE_DEFAULT_SOCKET = "/tmp/csagent-embedding.sock"      # run.py 启动向量化进程时的默认路径
+    EMBEDDING_SERVICE_TIMEOUT = 30   # 单次请求超时（秒）
+
+    # 构建知识库时的批量向量化（按token长度分桶，多进程并行，每进程固定线程数）
+    BULK_EMBED_ENABLED = True
+    BULK_EMBED_PROCESSES = int(os.getenv("BULK_EMBED_PROCESSES", "0"))   # 0为自动：CPU核数 / 每进程线程数
+    BULK_EMBED_THREADS = int(os.getenv("BULK_EMBED_THREADS", "2"))       # 每进程的torch线程数
+    BULK_EMBED_BATCH_SIZE = 32
+    BULK_EMBED_MIN_TEXTS = 2000   # 文本块少于该数量时在当前进程内完成（省去各进程加载模型的开销）
     
     # 文档处理配置 - 基于PDF分析优化
     PDF_PATH = "线下店文档.pdf"
     CHUNK_SIZE = 500      # 优化：减少chunk大小，降低token消耗
     CHUNK_OVERLAP = 120    # 优化：减少重叠比例，提高响应速度
     
+    # 构建知识库时的近似重复去重（MinHash/LSH，字符n-gram的Jaccard相似度）
+    DEDUP_ENABLED = True
+    DEDUP_THRESHOLD = 0.8      # Jaccard相似度不低于该值视为重复
+    DEDUP_SHINGLE_SIZE = 5     # 字符n-gram长度
+    DEDUP_NUM_PERM = 128       # MinHash签名长度
+    DEDUP_BANDS = 16           # LSH分段数（每段 NUM_PERM / BANDS 行）
+    
+    # 上下文组装配置（按token预算装入检索结果）
+    CONTEXT_TOKEN_BUDGET = 1500   # 检索上下文的token上限，设为0则不做预算控制
+    CONTEXT_MIN_SCORE = 0.3       # 相似度低于该值的文本块不进入提示词
+    TOKENIZER_VOCAB_PATH = "./models/shibing624_text2vec-base-chinese/vocab.txt"
+    
+    # 对话历史压缩配置（助手回答压缩为要点，用户提问原样保留）
+    HISTORY_COMPACTION_ENABLED = True
+    HISTORY_TOKEN_BUDGET = 400     # 对话历史整体token上限
+    HISTORY_SUMMARY_TOKENS = 120   # 单条助手回答摘要的token上限
+    
+    # 单次往返模式：关键词无法确定相关性时不再单独调用大模型判断，而是在生成提示词中要求模型对无关问题
+    # 只输出标记，省去一次网络往返（约1~2秒）；代价是无关问题也会消耗一次完整生成提示词的输入token
+    SINGLE_ROUND_TRIP_ENABLED = os.getenv("SINGLE_ROUND_TRIP", "0") != "0"
+    
+    # 回答缓存配置（按查询+检索结果+对话历史+知识库版本缓存大模型回答）
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_MAX_ENTRIES = 2000
+    RESPONSE_CACHE_TTL = 7 * 24 * 3600   # 秒
+    
+    # 会话存储配置（按session_id保存对话历史，空闲超时自动清理）
+    SESSION_STORE = os.getenv("SESSION_STORE", "memory")   # memory：进程内LRU；sqlite：多进程共享、重启后保留
+    SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))  # 空闲超过该时长的会话过期
+    SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+    SESSION_PURGE_INTERVAL = 60    # 过期会话清理间隔（秒）
+
+    # 性能指标配置（各阶段耗时直方图，关闭后开销可忽略）
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+    
+    # 大模型用量统计配置
+    USAGE_STATS_FILE = "usage_stats.json"
+    USAGE_FLUSH_SECONDS = 30          # 累计值落盘间隔
+    USAGE_RETENTION_DAYS = 30         # 按天统计保留天数
+    LLM_PRICE_INPUT_PER_1K = 0.0003   # 输入单价（元/千token），按qwen-turbo定价
+    LLM_PRICE_OUTPUT_PER_1K = 0.0006  # 输出单价（元/千token）
+    
+    # HTTP API服务配置
+    API_HOST = os.getenv("API_HOST", "127.0.0.1")
+    API_PORT = int(os.getenv("API_PORT", "8000"))
+    API_WORKERS = int(os.getenv("API_WORKERS", "1"))          # 工作进程数
+    API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "8"))  # 每进程并发处理的查询数
+    API_MAX_SESSIONS = 1000         # 每进程保留的会话锁数上限（会话历史见 SESSION_*）
+    API_MAX_BODY_BYTES = 64 * 1024  # 请求体大小上限
+    API_SHUTDOWN_TIMEOUT = 30       # 优雅退出时等待进行中请求的秒数
+    
     # 系统提示词
     SYSTEM_PROMPT = """您是教培管家，专注线下店文档咨询。
 
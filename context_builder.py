@@ -0,0 +1,95 @@
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from token_counter import TokenCounter, get_token_counter
+
+
+class ContextAssembler:
+    """按token预算组装检索上下文
+
+    1. 丢弃相似度低于阈值的文本块（至少保留最相关的一个）
+    2. 同一小节内相邻的文本块（chunk_id连续）去掉重叠部分后合并
+    3. 按相关度从高到低装入，总token数不超过预算
+    """
+
+    HEADER = "文档内容：\n"
+
+    def __init__(self, token_budget: int = Config.CONTEXT_TOKEN_BUDGET,
+                 min_score: float = Config.CONTEXT_MIN_SCORE,
+                 max_overlap: int = Config.CHUNK_OVERLAP,
+                 counter: Optional[TokenCounter] = None):
+        self.token_budget = token_budget
+        self.min_score = min_score
+        self.max_overlap = max_overlap
+        self.counter = counter or get_token_counter()
+
+    def _merge_text(self, left: str, right: str) -> str:
+        """拼接相邻文本块，去掉 left 结尾与 right 开头的重叠部分
+
+        分块时的重叠不超过 CHUNK_OVERLAP 个字符，匹配长度以此为上限：重复性文本（表格、相同条款）中
+        更长的巧合匹配会删掉真实内容，上限内的匹配最多少去掉一些重叠（内容重复而不会丢失）。
+        """
+        limit = min(len(left), len(right), self.max_overlap)
+        for size in range(limit, 0, -1):
+            if left.endswith(right[:size]):
+                return left + right[size:]
+        return left + '\n' + right
+
+    def _group_chunks(self, context: List[Tuple[Dict, float]]) -> List[Dict]:
+        """按小节合并相邻文本块，返回 [{text, score, chunks}]"""
+        groups: List[Dict] = []
+        by_section: Dict[int, List[Tuple[Dict, float]]] = {}
+        for chunk, score in context:
+            if 'section_index' in chunk and 'chunk_id' in chunk:
+                by_section.setdefault(chunk['section_index'], []).append((chunk, score))
+            else:
+                groups.append({'text': chunk['text'], 'score': float(score), 'chunks': [chunk]})
+
+        for items in by_section.values():
+            items.sort(key=lambda item: item[0]['chunk_id'])
+            current = None
+            for chunk, score in items:
+                if current is not None and chunk['chunk_id'] == current['chunks'][-1]['chunk_id'] + 1:
+                    current['text'] = self._merge_text(current['text'], chunk['text'])
+                    current['score'] = max(current['score'], float(score))
+                    current['chunks'].append(chunk)
+                else:
+                    current = {'text': chunk['text'], 'score': float(score), 'chunks': [chunk]}
+                    groups.append(current)
+
+        groups.sort(key=lambda group: group['score'], reverse=True)
+        return groups
+
+    def select(self, context: List[Tuple[Dict, float]]) -> List[Dict]:
+        """过滤、合并并按预算挑选上下文片段"""
+        if not context:
+            return []
+
+        best = max(context, key=lambda item: item[1])
+        kept = [item for item in context if item[1] >= self.min_score] or [best]
+
+        remaining = self.token_budget - self.counter.count(self.HEADER)
+        selected: List[Dict] = []
+        for group in self._group_chunks(kept):
+            # 每段额外计入编号前缀和换行
+            tokens = self.counter.count(group['text']) + 3
+            if tokens <= remaining:
+                selected.append(group)
+                remaining -= tokens
+            elif not selected and remaining > 3:
+                # 最相关的片段超出预算时截断保留
+                group['text'] = self.counter.truncate(group['text'], remaining - 3)
+                selected.append(group)
+                remaining = 0
+        return selected
+
+    def build(self, context: List[Tuple[Dict, float]]) -> str:
+        """构建上下文文本，格式与 LLMClient._build_context 保持一致"""
+        selected = self.select(context)
+        if not selected:
+            return ""
+
+        context_text = self.HEADER
+        for i, group in enumerate(selected, 1):
+            context_text += f"{i}. {group['text']}\n"
+        return context_text
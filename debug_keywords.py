@@ -16,10 +16,10 @@ def debug_keywords():
         print(f"\n查询: {query}")
         keyword_score = client._calculate_keyword_score(query)
         llm_score = client._calculate_llm_relevance_score(query)
-        final_score = client._calculate_simple_relevance(query)
+        final_score, _ = client._calculate_simple_relevance(query)
         
         print(f"关键词分数: {keyword_score:.3f}")
-        print(f"LLM分数: {llm_score:.3f}")
+        print(f"LLM分数: {llm_score:.3f}" if llm_score is not None else "LLM分数: 调用失败")
         print(f"最终分数: {final_score:.3f}")
         print(f"判定结果: {'相关' if final_score >= 0.5 else '不相关'}")
 
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List
+
+import numpy as np
+
+from config import Config
+
+
+class _PendingEncode:
+    """等待编码的单条请求"""
+
+    __slots__ = ('text', 'enqueued_at', 'event', 'vector', 'error')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.enqueued_at = time.perf_counter()
+        self.event = threading.Event()
+        self.vector = None
+        self.error = None
+
+
+class EmbeddingBatcher:
+    """查询向量动态微批处理
+
+    并发请求各自提交一条文本，后台线程把它们聚合成一个批次调用 model.encode，
+    批次在达到 max_batch_size 或等待超过 max_wait_ms 时发出，结果分发回各调用方。
+    """
+
+    def __init__(self, model, max_batch_size: int = Config.EMBED_MAX_BATCH_SIZE,
+                 max_wait_ms: float = Config.EMBED_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._worker = None
+        self._closed = False
+
+        # 统计信息
+        self._stats_lock = threading.Lock()
+        self.batch_size_histogram = Counter()
+        self._wait_times = deque(maxlen=1000)  # 最近的排队等待时间（秒）
+        self.total_requests = 0
+        self.total_batches = 0
+        self.total_encode_seconds = 0.0
+
+    def encode(self, text: str) -> np.ndarray:
+        """编码单条文本，阻塞直到所在批次完成，返回一维向量"""
+        item = _PendingEncode(text)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher已关闭")
+            self._ensure_worker()
+            self._queue.append(item)
+            self._cond.notify()
+
+        item.event.wait()
+        if item.error is not None:
+            raise item.error
+        return item.vector
+
+    def close(self):
+        """停止后台线程（队列中剩余请求仍会处理完）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+            self._worker.start()
+
+    def _collect_batch(self) -> List[_PendingEncode]:
+        """取出一个批次：等到第一条请求后，最多再等待 max_wait 以凑满批次"""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+
+            deadline = self._queue[0].enqueued_at + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                return
+
+            started = time.perf_counter()
+            try:
+                vectors = self.model.encode([item.text for item in batch], batch_size=len(batch))
+                for item, vector in zip(batch, vectors):
+                    item.vector = vector
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            finished = time.perf_counter()
+
+            with self._stats_lock:
+                self.batch_size_histogram[len(batch)] += 1
+                self.total_requests += len(batch)
+                self.total_batches += 1
+                self.total_encode_seconds += finished - started
+                self._wait_times.extend(started - item.enqueued_at for item in batch)
+
+            for item in batch:
+                item.event.set()
+
+    def get_stats(self) -> Dict:
+        """获取批处理统计：批大小分布与排队等待时间"""
+        with self._stats_lock:
+            waits = np.array(self._wait_times) * 1000 if self._wait_times else np.zeros(1)
+            return {
+                'total_requests': self.total_requests,
+                'total_batches': self.total_batches,
+                'avg_batch_size': self.total_requests / self.total_batches if self.total_batches else 0.0,
+                'batch_size_histogram': dict(sorted(self.batch_size_histogram.items())),
+                'queue_wait_ms': {
+                    'avg': float(np.mean(waits)),
+                    'p50': float(np.percentile(waits, 50)),
+                    'p95': float(np.percentile(waits, 95)),
+                    'max': float(np.max(waits)),
+                },
+                'encode_seconds_total': self.total_encode_seconds,
+                'queue_length': len(self._queue),
+            }
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+独立的查询向量化进程（Unix socket）
+
+多进程部署时，每个工作进程各自加载 SentenceTransformer 会让模型与torch的内存随进程数成倍增长。
+这里由一个进程加载模型并监听 Unix socket，工作进程设置 EMBEDDING_SERVICE_SOCKET 后
+VectorStore 使用 RemoteEmbeddingModel（接口与 SentenceTransformer.encode 兼容），不再导入torch；
+来自各工作进程的单条查询在服务端经 EmbeddingBatcher 合并为批次。
+
+协议：每条消息为 4字节大端长度 + JSON；向量化响应的JSON头之后紧跟 float32 原始字节。
+
+用法：
+  python embedding_service.py --socket /tmp/csagent-embedding.sock
+  （通常由 python run.py --workers N 自动启动）
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+
+_LENGTH = struct.Struct('>I')
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError('向量化服务连接已关闭')
+        received += count
+    return buffer
+
+
+def _send_message(sock: socket.socket, header: Dict, payload: bytes = b''):
+    data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    sock.sendall(_LENGTH.pack(len(data)) + data + payload)
+
+
+def _recv_message(sock: socket.socket) -> Dict:
+    size = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))[0]
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f'消息过大: {size} 字节')
+    return json.loads(_recv_exact(sock, size).decode('utf-8'))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """一个客户端连接（工作进程中的一个线程），按请求-响应循环处理直到连接关闭"""
+
+    def handle(self):
+        while True:
+            try:
+                request = _recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            except ValueError as e:
+                _send_message(self.request, {'error': str(e)})
+                return
+            try:
+                header, payload = self.server.service.handle(request)
+            except Exception as e:
+                header, payload = {'error': str(e)}, b''
+            try:
+                _send_message(self.request, header, payload)
+            except OSError:
+                return
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # 默认backlog为5：多个工作进程同时建立连接时，Unix socket会直接返回EAGAIN
+    request_queue_size = 1024
+
+
+class EmbeddingService:
+    """加载向量模型并通过 Unix socket 提供向量化"""
+
+    def __init__(self, socket_path: str = Config.EMBEDDING_SERVICE_SOCKET, model=None):
+        self.socket_path = socket_path
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            from bulk_embedding import model_source
+            model = SentenceTransformer(model_source())
+        self.model = model
+        self.batcher = None
+        if Config.EMBED_BATCHING_ENABLED:
+            from embedding_batcher import EmbeddingBatcher
+            self.batcher = EmbeddingBatcher(model)
+        probe = np.asarray(model.encode(['向量维度']), dtype=np.float32)
+        self.info = {
+            'dim': int(probe.shape[1]),
+            'max_seq_length': int(getattr(model, 'max_seq_length', 0) or 0),
+            'pid': os.getpid(),
+        }
+        self._server: Optional[_Server] = None
+
+    def handle(self, request: Dict) -> Tuple[Dict, bytes]:
+        op = request.get('op')
+        if op == 'info':
+            return dict(self.info), b''
+        if op == 'stats':
+            stats = self.batcher.get_stats() if self.batcher is not None else {'enabled': False}
+            return {'stats': stats}, b''
+        if op != 'encode':
+            raise ValueError(f'未知操作: {op}')
+
+        texts: List[str] = request.get('texts') or []
+        if len(texts) == 1 and self.batcher is not None:
+            # 各工作进程的单条查询在这里合并为批次
+            vectors = self.batcher.encode(texts[0])[np.newaxis, :]
+        else:
+            vectors = self.model.encode(texts, batch_size=request.get('batch_size') or 32,
+                                        show_progress_bar=False)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(texts), self.info['dim'])
+        return {'shape': list(vectors.shape)}, vectors.tobytes()
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # 上次异常退出遗留的socket文件
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.service = self
+        os.chmod(self.socket_path, 0o600)
+        print(f"🚀 向量化服务已启动: {self.socket_path}（{self.info['dim']} 维，pid {os.getpid()}）")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            print("👋 向量化服务已停止")
+
+    def shutdown(self):
+        if self._server is not None:
+            # serve_forever 所在线程之外调用
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+
+class RemoteEmbeddingModel:
+    """通过 Unix socket 调用向量化服务，encode 与 SentenceTransformer 接口兼容
+
+    每个线程维持一条长连接；连接断开（如向量化服务重启）时重连一次后重试。
+    """
+
+    def __init__(self, socket_path: str = Config.EMBEDDING_SERVICE_SOCKET,
+                 timeout: float = Config.EMBEDDING_SERVICE_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        info = self._request({'op': 'info'})[0]
+        self.dimension = info['dim']
+        self.max_seq_length = info['max_seq_length']
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def _request(self, message: Dict) -> Tuple[Dict, bytearray]:
+        for attempt in range(2):
+            try:
+                if getattr(self._local, 'sock', None) is None:
+                    self._local.sock = self._connect()
+                sock = self._local.sock
+                _send_message(sock, message)
+                header = _recv_message(sock)
+                payload = bytearray()
+                if 'shape' in header:
+                    rows, dim = header['shape']
+                    payload = _recv_exact(sock, rows * dim * 4)
+                break
+            except (ConnectionError, OSError):
+                self._close()
+                if attempt:
+                    raise
+        if 'error' in header:
+            raise RuntimeError(f"向量化服务错误: {header['error']}")
+        return header, payload
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """编码文本，单条字符串返回一维向量，列表返回 (n, dim) 矩阵"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        header, payload = self._request({'op': 'encode', 'texts': texts, 'batch_size': batch_size})
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(header['shape'])
+        return vectors[0] if single else vectors
+
+    def get_stats(self) -> Dict:
+        """服务端的批处理统计"""
+        return self._request({'op': 'stats'})[0]['stats']
+
+
+def wait_until_ready(socket_path: str, timeout: float = 120, process=None) -> bool:
+    """等待向量化服务可以连接（模型加载需要数秒）；process退出时提前返回False"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            RemoteEmbeddingModel(socket_path, timeout=5)._close()
+            return True
+        except (OSError, RuntimeError):
+            time.sleep(0.2)
+    return False
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="独立的查询向量化进程")
+    parser.add_argument('--socket', default=Config.EMBEDDING_SERVICE_SOCKET or Config.EMBEDDING_SERVICE_DEFAULT_SOCKET,
+                        help='Unix socket路径')
+    parser.add_argument('--threads', type=int, default=0, help='torch线程数（0为默认）')
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+    service = EmbeddingService(args.socket)
+    signal.signal(signal.SIGTERM, lambda *_: service.shutdown())
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
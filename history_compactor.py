@@ -0,0 +1,141 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from config import Config
+from token_counter import TokenCounter, get_token_counter
+
+
+class HistoryCompactor:
+    """对话历史压缩
+
+    用户消息与最近一条助手回答原样保留（追问通常针对上一条回答的细节，如“第15点展开说说”）；
+    更早的助手回答压缩为抽取式要点（按与提问的重合度、位置和数字信息挑选关键句），
+    每条摘要不超过 summary_tokens，整体历史不超过 token_budget（超出时截断最近一条回答）。
+    摘要在回答完成后由后台线程增量计算，不占用下一次查询的关键路径。
+    """
+
+    _SENTENCE_SPLIT = re.compile(r'(?<=[。！？!?；;])|\n+')
+    _MARKUP = re.compile(r'^[\s#>*\-•·\d\.、）\)]+|\*\*')
+
+    def __init__(self, token_budget: int = Config.HISTORY_TOKEN_BUDGET,
+                 summary_tokens: int = Config.HISTORY_SUMMARY_TOKENS,
+                 counter: Optional[TokenCounter] = None):
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.counter = counter or get_token_counter()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-compactor')
+
+    @staticmethod
+    def _bigrams(text: str) -> set:
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def summarize(self, answer: str, question: str = "") -> str:
+        """抽取式摘要：挑选关键句并按原文顺序拼接"""
+        sentences = []
+        for raw in self._SENTENCE_SPLIT.split(answer):
+            sentence = self._MARKUP.sub('', raw.strip()).strip()
+            if len(sentence) < 4:
+                continue
+            if not re.search(r'[。！？!?；;：:]$', sentence):
+                sentence += '。'  # 标题等无结尾标点的行补句号，避免拼接后粘连
+            if sentence not in sentences:
+                sentences.append(sentence)
+        if not sentences:
+            return answer[:self.summary_tokens]
+
+        question_grams = self._bigrams(question)
+        scored = []
+        for position, sentence in enumerate(sentences):
+            grams = self._bigrams(sentence)
+            overlap = len(grams & question_grams) / (len(grams) or 1)
+            has_number = 1.0 if re.search(r'\d', sentence) else 0.0
+            lead = 1.0 / (1 + position)  # 靠前的句子通常是结论
+            scored.append((overlap * 2 + has_number * 0.5 + lead, position, sentence))
+
+        chosen = []
+        remaining = self.summary_tokens
+        for _, position, sentence in sorted(scored, reverse=True):
+            tokens = self.counter.count(sentence)
+            if tokens <= remaining:
+                chosen.append((position, sentence))
+                remaining -= tokens
+            if remaining <= 0:
+                break
+
+        if not chosen:
+            return self.counter.truncate(sentences[0], self.summary_tokens)
+        return ''.join(sentence for _, sentence in sorted(chosen))
+
+    def _summarize_message(self, message: Dict, question: str):
+        if 'summary' not in message:
+            message['summary'] = self.summarize(message['content'], question)
+
+    @staticmethod
+    def _latest_answer(history: List[Dict]) -> int:
+        """最近一条助手回答的下标，没有时返回-1"""
+        for index in range(len(history) - 1, -1, -1):
+            if history[index]['role'] != 'user':
+                return index
+        return -1
+
+    def schedule(self, history: List[Dict], wait: bool = False):
+        """回答完成后调用：为最近一条之前、尚未压缩的助手消息生成摘要
+
+        默认在后台线程中计算；历史随后要序列化保存（如sqlite会话存储）时传 wait=True 就地计算，
+        否则保存的历史不含摘要，下次查询时仍需在关键路径上计算。
+        """
+        history = list(history)
+        latest = self._latest_answer(history)
+        question = ""
+        for index, message in enumerate(history):
+            if message['role'] == 'user':
+                question = message['content']
+            elif index != latest and 'summary' not in message:
+                if wait:
+                    self._summarize_message(message, question)
+                else:
+                    self._executor.submit(self._summarize_message, message, question)
+
+    def build(self, history: List[Dict]) -> str:
+        """在token预算内构建对话历史文本（从最近的消息向前装入）"""
+        if not history:
+            return ""
+
+        header = "对话历史：\n"
+        remaining = self.token_budget - self.counter.count(header)
+        lines: List[str] = []
+        question = ""
+        questions = []
+        for message in history:
+            if message['role'] == 'user':
+                question = message['content']
+            questions.append(question)
+
+        latest = self._latest_answer(history)
+        for index in range(len(history) - 1, -1, -1):
+            message, question = history[index], questions[index]
+            if message['role'] == 'user':
+                line = f"用户: {message['content']}\n"
+            elif index == latest:
+                line = f"助手: {message['content']}\n"
+                if self.counter.count(line) > remaining:
+                    # 原文超出预算时截断，并为引出它的用户提问留出位置
+                    reserve = self.counter.count(f"用户: {question}\n") if question else 0
+                    if reserve > remaining // 2:
+                        reserve = 0
+                    limit = remaining - reserve - self.counter.count("助手: \n")
+                    line = f"助手: {self.counter.truncate(message['content'], limit)}\n"
+            else:
+                # 摘要尚未由后台生成时就地计算（抽取式，耗时为毫秒级）
+                summary = message.get('summary') or self.summarize(message['content'], question)
+                line = f"助手(要点): {summary}\n"
+            tokens = self.counter.count(line)
+            if tokens > remaining:
+                break
+            lines.append(line)
+            remaining -= tokens
+
+        if not lines:
+            return ""
+        return header + ''.join(reversed(lines))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+知识库索引的版本目录与 CURRENT 指针
+
+目录结构：
+  vector_db/
+    CURRENT                      当前版本名（整体替换写入，读到的总是完整的版本名）
+    versions/000001-20250101-120000/ 每次构建写入新的版本目录，写完后才切换指针
+    startup_snapshot.bin         启动快照（与索引版本无关）
+
+重建知识库时不会改动正在被读取的旧版本文件；运行中的 IntelligentAgent 在请求之间检测
+指针变化并切换到新索引（进行中的查询继续使用旧索引）。没有 CURRENT 文件时按旧的平铺
+布局直接读取 vector_db/ 下的文件。
+
+用法：
+  python index_versions.py                 # 列出版本
+  python index_versions.py --use <版本名>   # 回滚/切换到指定版本
+  python index_versions.py --prune         # 只保留最近 INDEX_KEEP_VERSIONS 个版本
+"""
+
+import argparse
+import os
+import shutil
+import time
+from typing import List, Optional, Tuple
+
+from config import Config
+
+CURRENT_FILE = 'CURRENT'
+VERSIONS_DIR = 'versions'
+
+
+def versions_root(root: str) -> str:
+    return os.path.join(root, VERSIONS_DIR)
+
+
+def version_path(root: str, name: str) -> str:
+    return os.path.join(versions_root(root), name)
+
+
+def current_version(root: str) -> Optional[str]:
+    """当前版本名；未发布过版本（旧的平铺布局）时返回None"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    return name if name and os.path.isdir(version_path(root, name)) else None
+
+
+def current_index_path(root: str) -> Tuple[Optional[str], str]:
+    """当前索引所在目录，返回 (版本名, 目录)"""
+    name = current_version(root)
+    return name, version_path(root, name) if name else root
+
+
+def list_versions(root: str) -> List[str]:
+    """已有版本（按名称即创建顺序升序）"""
+    if not os.path.isdir(versions_root(root)):
+        return []
+    return sorted(name for name in os.listdir(versions_root(root))
+                  if os.path.isdir(version_path(root, name)))
+
+
+def create_version_dir(root: str) -> Tuple[str, str]:
+    """创建新的空版本目录，返回 (版本名, 目录)
+
+    版本名为 递增序号-创建时间，按名称排序即为创建顺序；并发构建时序号冲突则顺延。
+    """
+    existing = [int(name.split('-', 1)[0]) for name in list_versions(root) if name.split('-', 1)[0].isdigit()]
+    sequence = max(existing, default=0) + 1
+    while True:
+        name = f"{sequence:06d}-{time.strftime('%Y%m%d-%H%M%S')}"
+        path = version_path(root, name)
+        try:
+            os.makedirs(path)
+            return name, path
+        except FileExistsError:
+            sequence += 1
+
+
+def publish(root: str, name: str):
+    """原子地把 CURRENT 指向指定版本（先写临时文件再整体替换）"""
+    if not os.path.isdir(version_path(root, name)):
+        raise ValueError(f"版本不存在: {name}")
+    tmp_file = os.path.join(root, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, os.path.join(root, CURRENT_FILE))
+
+
+def prune(root: str, keep: int = Config.INDEX_KEEP_VERSIONS) -> List[str]:
+    """删除较旧的版本，保留最近keep个（当前版本始终保留），返回删除的版本名
+
+    仍在使用旧版本的进程已把文件映射到内存，Linux/macOS下删除目录不影响其读取。
+    """
+    current = current_version(root)
+    versions = list_versions(root)
+    removed = []
+    for name in versions[:max(0, len(versions) - max(1, keep))]:
+        if name == current:
+            continue
+        shutil.rmtree(version_path(root, name), ignore_errors=True)
+        removed.append(name)
+    return removed
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="知识库索引版本管理")
+    parser.add_argument('--use', default='', help='把 CURRENT 切换到指定版本')
+    parser.add_argument('--prune', action='store_true', help='删除较旧的版本')
+    parser.add_argument('--keep', type=int, default=Config.INDEX_KEEP_VERSIONS, help='--prune 时保留的版本数')
+    args = parser.parse_args(argv)
+
+    root = Config.VECTOR_DB_PATH
+    if args.use:
+        publish(root, args.use)
+        print(f"✅ 当前版本已切换为 {args.use}，运行中的服务将在下一次请求时加载")
+    if args.prune:
+        for name in prune(root, args.keep):
+            print(f"🗑️ 已删除版本 {name}")
+
+    current = current_version(root)
+    versions = list_versions(root)
+    if not versions:
+        print(f"📦 {root} 下尚无版本目录（使用平铺布局）")
+    for name in versions:
+        print(f"{'*' if name == current else ' '} {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,201 @@
-import dashscope
-from dashscope import Generation
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Tuple
 from config import Config
+from context_builder import ContextAssembler
+from history_compactor import HistoryCompactor
+from response_cache import ResponseCache
+from startup_snapshot import get_snapshot, model_fingerprint, text_fingerprint
+from metrics import metrics
+from token_counter import get_token_counter
+from usage_tracker import usage_tracker
+from llm_resilience import LLMUnavailableError, ResilientCaller
+from llm_hedging import Hedger
 import hashlib
+import itertools
 import json
 import os
+import threading
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+# 相关领域的代表性问题，其向量用于相似度判断（预先计算后存入启动快照）
+DOMAIN_QUERIES = [
+    "线下店选址标准",
+    "教培机构运营管理",
+    "线下店成本控制",
+    "教培机构财务管理",
+    "线下店装修设计",
+    "教培机构师资培训",
+    "线下店营销推广",
+    "教培机构客户服务",
+    "线下店风险控制",
+    "教培机构课程设计",
+    "线下店团队建设",
+    "教培机构多店复制"
+]
+
+# 相关性判断关键词（模块级常量，避免每次查询重建列表；重复项参与计数，保持原有评分）
+RELEVANT_KEYWORDS = [
+    # 核心业务关键词
+    '线下店', '教培', '教育', '培训', '机构', '选址', '装修', '运营',
+    '财务', '成本', '现金流', '盈利', '风险', '投诉', '师资',
+    '创业者', '负责人', '经理', '教练', '管家', '医生', 'Word',
+    'word','Excel','excel','PPT','ppt','PPTX','pptx','PDF','pdf',
+    '创业', '加盟', '直营', '联营', '加盟店', '直营店', '联营店', '加盟店管理',
+    '推荐','辅导','方法','课程','教学','学员','招生','营销','推广',
+    '服务','管理','团队','建设','文化','激励','沟通','协作',
+    '风险','控制','合规','安全','质量','标准','流程','制度',
+    '扩张','复制','连锁','品牌','统一','标准化','规模化',
+    
+    # 扩展业务关键词
+    '店铺', '门店', '店面', '营业', '经营', '管理', '运营',
+    '收入', '支出', '利润', '亏损', '预算', '投资', '回报',
+    '人员', '员工', '招聘', '培训', '考核', '绩效', '薪资',
+    '客户', '学员', '家长', '满意度', '投诉', '服务', '体验',
+    '市场', '竞争', '定位', '策略', '计划', '目标', '指标',
+    '设备', '设施', '环境', '装修', '设计', '布局', '空间',
+    '课程', '教学', '教材', '教案', '评估', '测试', '成绩',
+    '宣传', '广告', '推广', '营销', '销售', '转化', '成交',
+    '法律', '合同', '协议', '条款', '责任', '义务', '权利',
+    '数据', '分析', '统计', '报告', '监控', '预警', '改进'
+]
+
+# 回退的相关性检查关键词
+FALLBACK_KEYWORDS = [
+    '线下店', '教培', '教育', '培训', '机构', '选址', '装修', '运营',
+    '财务', '成本', '现金流', '盈利', '风险', '投诉', '师资',
+    '创业者', '负责人', '经理', '教练', '管家', '医生', 'Word',
+    'word','Excel','excel','PPT','ppt','PPTX','pptx','PDF','pdf',
+    '创业', '加盟', '直营', '联营', '加盟店', '直营店', '联营店', '加盟店管理',
+    '推荐','辅导','方法','课程','教学','学员','招生','营销','推广',
+    '服务','管理','团队','建设','文化','激励','沟通','协作',
+    '风险','控制','合规','安全','质量','标准','流程','制度',
+    '扩张','复制','连锁','品牌','统一','标准化','规模化',
+    '线下店','教培','教育','培训','机构',
+    '选址','装修','运营','财务','成本',
+    '师资', '员工', '招聘', '培训', '考核',
+    '学员', '家长', '满意度', '投诉', '服务',
+    '营销', '推广', '宣传', '广告', '销售',
+    '风险', '控制', '合规', '安全', '法律',
+]
+
+
+# 相关性评分：关键词与大模型判断加权平均，不低于阈值视为相关
+KEYWORD_WEIGHT = 0.6
+RELEVANCE_THRESHOLD = 0.5
+
+# 单次往返模式下，生成提示词要求模型对无关问题只输出该标记
+OUT_OF_SCOPE_MARKER = "[[OUT_OF_SCOPE]]"
+OUT_OF_SCOPE_INSTRUCTION = f"如果用户问题与线下店教培机构运营无关，只输出{OUT_OF_SCOPE_MARKER}，不要输出其他任何内容；相关则直接回答。"
+
+
+def is_out_of_scope_answer(text: str) -> bool:
+    """回答是否为模型给出的无关问题标记"""
+    return text.lstrip().startswith(OUT_OF_SCOPE_MARKER)
+
+
+# 大模型不可用（熔断中或本地限流超时）且没有可用缓存时的回答
+SERVICE_BUSY_MESSAGE = "当前咨询人数较多，服务暂时繁忙，请稍后再试。"
+ERROR_PREFIXES = ("API调用失败", "生成回答时出错")
+
+
+def is_error_response(text: str) -> bool:
+    """回答是否为调用失败或降级提示（此类回答不应写入缓存）"""
+    return text == SERVICE_BUSY_MESSAGE or text.startswith(ERROR_PREFIXES)
+
+
+class _StreamStart:
+    """流式请求的首个分片与剩余分片；status_code取自首个分片，首个分片之前的失败按同一策略重试"""
+
+    def __init__(self, first, rest, started: float, prompt_components: Dict[str, int] = None):
+        self.first = first
+        self.rest = rest
+        self.started = started
+        self.prompt_components = prompt_components
+        self.status_code = getattr(first, 'status_code', 200) if first is not None else 200
+
+    def discard(self):
+        """对冲落败：关闭流式连接，按首个分片记录已产生的用量"""
+        close = getattr(self.rest, 'close', None)
+        if close is not None:
+            close()
+        if self.status_code == 200:
+            usage_tracker.record('generation', self.first, time.perf_counter() - self.started,
+                                 prompt_components=self.prompt_components)
+
+
+def domain_embeddings_fingerprint() -> str:
+    """领域向量的来源指纹：向量模型 + 领域问题列表"""
+    return text_fingerprint([model_fingerprint()] + DOMAIN_QUERIES)
+
 
 class LLMClient:
-    def __init__(self):
-        dashscope.api_key = Config.DASHSCOPE_API_KEY
+    # 回答生成参数
+    GENERATION_PARAMS = {
+        'max_tokens': 2048,  # 减少token数量，提高响应速度
+        'temperature': 0.6,  # 降低温度，提高响应一致性
+        'top_p': 0.9,        # 提高top_p，增加响应多样性
+    }
+    # 各阶段调用的默认总时限（秒）
+    DEADLINES = {
+        'relevance': Config.LLM_DEADLINE_RELEVANCE,
+        'generation': Config.LLM_DEADLINE_GENERATION,
+    }
+    
+    def __init__(self, generation=None, embedding_model=None):
         self.model = Config.DASHSCOPE_MODEL
+        # 生成接口，默认使用dashscope.Generation，可注入本地替身用于测试
+        if generation is None:
+            # 延迟导入，注入替身时无需加载dashscope
+            import dashscope
+            from dashscope import Generation
+            dashscope.api_key = Config.DASHSCOPE_API_KEY
+            if Config.DASHSCOPE_BASE_URL:
+                dashscope.base_http_api_url = Config.DASHSCOPE_BASE_URL
+            generation = Generation
+        self.generation = generation
+        # 本地限流、带退避的重试与熔断（熔断中相关性判断只看关键词，生成只返回缓存或繁忙提示）
+        self.resilience = ResilientCaller()
+        # 慢请求对冲（按近期延迟分位数决定何时再发一个相同请求）
+        self.hedger = Hedger(self.resilience)
+        # 按token预算合并、裁剪检索结果，减少重复内容
+        self.context_assembler = ContextAssembler() if Config.CONTEXT_TOKEN_BUDGET > 0 else None
+        # 对话历史压缩，避免每次追问都重复发送完整的历史回答
+        self.history_compactor = HistoryCompactor() if Config.HISTORY_COMPACTION_ENABLED else None
+        # 回答缓存（键包含检索结果、对话历史与知识库版本）
+        self.response_cache = ResponseCache() if Config.RESPONSE_CACHE_ENABLED else None
         self.relevance_cache = {}  # 相关性判断缓存
         self.cache_file = "relevance_cache.json"
+        self._cache_lock = threading.Lock()  # 多线程服务下保护缓存读写
         self._load_relevance_cache()
         
-        # 初始化向量模型用于相似度计算
+        # 初始化向量模型用于相似度计算（可复用知识库的向量模型，避免重复加载）
         try:
-            self.embedding_model = SentenceTransformer('shibing624/text2vec-base-chinese')
-            self.relevant_domain_queries = [
-                "线下店选址标准",
-                "教培机构运营管理",
-                "线下店成本控制",
-                "教培机构财务管理",
-                "线下店装修设计",
-                "教培机构师资培训",
-                "线下店营销推广",
-                "教培机构客户服务",
-                "线下店风险控制",
-                "教培机构课程设计",
-                "线下店团队建设",
-                "教培机构多店复制"
-            ]
-            self.domain_embeddings = self.embedding_model.encode(self.relevant_domain_queries)
+            if embedding_model is None:
+                from sentence_transformers import SentenceTransformer
+                embedding_model = SentenceTransformer(Config.EMBEDDING_MODEL_NAME)
+            self.embedding_model = embedding_model
+            self.relevant_domain_queries = DOMAIN_QUERIES
+            self.domain_embeddings = self._load_domain_embeddings()
         except Exception:
             self.embedding_model = None
             self.domain_embeddings = None
     
+    def _load_domain_embeddings(self) -> np.ndarray:
+        """领域向量：优先从启动快照映射，快照缺失或已失效时重新计算并写回"""
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return self.embedding_model.encode(self.relevant_domain_queries)
+        
+        fingerprint = domain_embeddings_fingerprint()
+        embeddings = snapshot.get('domain_embeddings', fingerprint)
+        if embeddings is None:
+            embeddings = np.asarray(self.embedding_model.encode(self.relevant_domain_queries), dtype=np.float32)
+            try:
+                snapshot.put('domain_embeddings', fingerprint, embeddings)
+            except Exception as e:
+                print(f"⚠️ 写入启动快照失败: {e}")
+        return embeddings
+    
     def _load_relevance_cache(self):
         """加载相关性判断缓存"""
         try:
@@ -50,9 +208,10 @@ class LLMClient:
     def _save_relevance_cache(self):
         """保存相关性判断缓存"""
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                # 把python对象转换成json对象生成一个fp的文件流
-                json.dump(self.relevance_cache, f, ensure_ascii=False, indent=2)
+            with self._cache_lock:
+                with open(self.cache_file, 'w', encoding='utf-8') as f:
+                    # 把python对象转换成json对象生成一个fp的文件流
+                    json.dump(self.relevance_cache, f, ensure_ascii=False, indent=2)
         except Exception:
             pass
     
@@ -75,38 +234,188 @@ class LLMClient:
         except Exception:
             return 0.0
     
-    def generate_response(self, query: str, context: List[Dict], conversation_history: List[Dict] = None) -> str:
-        """生成回答"""
+    def generate_response(self, query: str, context: List[Dict], conversation_history: List[Dict] = None,
+                          index_version: str = "", deadline: Optional[float] = None,
+                          judge_relevance: bool = False) -> str:
+        """生成回答；deadline 为总时限（秒），默认 Config.LLM_DEADLINE_GENERATION
+        
+        judge_relevance: 同时判断相关性，无关问题的回答以 OUT_OF_SCOPE_MARKER 开头
+        """
         try:
-            # 构建上下文
-            context_text = self._build_context(context)
-            history_text = self._build_history(conversation_history) if conversation_history else ""
+            prompt, cache_key, components = self._prepare_prompt(query, context, conversation_history, index_version,
+                                                                  judge_relevance)
             
-            # 构建提示词
-            prompt = self._build_prompt(query, context_text, history_text)
+            if cache_key is not None:
+                with metrics.span('response_cache_lookup'):
+                    cached_response = self.response_cache.get(cache_key)
+                if cached_response is not None:
+                    return cached_response
             
             # 调用API
-            response = Generation.call(
-                model=self.model,
-                prompt=prompt,
-                max_tokens=2048,  # 减少token数量，提高响应速度
-                temperature=0.6,   # 降低温度，提高响应一致性
-                top_p=0.9         # 提高top_p，增加响应多样性
-            )
+            with metrics.span('generation'):
+                response = self._call(
+                    'generation',
+                    prompt_components=components,
+                    deadline=deadline,
+                    prompt=prompt,
+                    **self.GENERATION_PARAMS
+                )
             
             if response.status_code == 200:
+                if cache_key is not None:
+                    self.response_cache.put(cache_key, response.output.text)
                 return response.output.text
             else:
                 return f"API调用失败: {response.message}"
-                
+        
+        except LLMUnavailableError:
+            metrics.inc('llm_fallback_total', stage='generation')
+            return SERVICE_BUSY_MESSAGE
         except Exception as e:
             return f"生成回答时出错: {str(e)}"
     
+    def generate_response_stream(self, query: str, context: List[Dict], conversation_history: List[Dict] = None,
+                                 index_version: str = "", deadline: Optional[float] = None,
+                                 judge_relevance: bool = False) -> Iterator[str]:
+        """流式生成回答，逐段返回增量文本；deadline 为首个分片的时限（秒），默认 Config.LLM_DEADLINE_GENERATION"""
+        try:
+            prompt, cache_key, components = self._prepare_prompt(query, context, conversation_history, index_version,
+                                                                  judge_relevance)
+            
+            if cache_key is not None:
+                cached_response = self.response_cache.get(cache_key)
+                if cached_response is not None:
+                    yield cached_response
+                    return
+            
+            started = time.perf_counter()
+            deadline_at = time.monotonic() + (deadline or Config.LLM_DEADLINE_GENERATION)
+            try:
+                start = self.resilience.call(
+                    'generation',
+                    lambda: self.hedger.run('generation_first_token',
+                                            lambda: self._start_stream(prompt, components, deadline_at),
+                                            deadline_at, discard=_StreamStart.discard),
+                    deadline_at
+                )
+            except LLMUnavailableError:
+                metrics.inc('llm_fallback_total', stage='generation')
+                yield SERVICE_BUSY_MESSAGE
+                return
+            if start.status_code != 200:
+                yield f"API调用失败: {start.first.message}"
+                return
+            
+            parts = []
+            response = None
+            try:
+                for response in itertools.chain([start.first] if start.first is not None else [], start.rest):
+                    if response.status_code == 200:
+                        if response.output.text:
+                            if not parts:
+                                metrics.observe('generation_first_token', time.perf_counter() - started)
+                            parts.append(response.output.text)
+                            yield response.output.text
+                    else:
+                        yield f"API调用失败: {response.message}"
+                        return
+            finally:
+                # 流式响应中最后一个分片携带完整用量
+                usage_tracker.record('generation', response, time.perf_counter() - start.started,
+                                     prompt_components=components)
+            metrics.observe('generation', time.perf_counter() - started)
+            
+            if cache_key is not None and parts:
+                self.response_cache.put(cache_key, ''.join(parts))
+                    
+        except Exception as e:
+            yield f"生成回答时出错: {str(e)}"
+    
+    def _start_stream(self, prompt: str, prompt_components: Dict[str, int], deadline_at: float) -> _StreamStart:
+        """发起一次流式请求并等到首个分片；首个分片即为错误时记录本次尝试的用量"""
+        started = time.perf_counter()
+        try:
+            responses = iter(self.generation.call(
+                model=self.model,
+                prompt=prompt,
+                stream=True,
+                incremental_output=True,  # 每次只返回新增部分
+                request_timeout=self._request_timeout(deadline_at),
+                **self.GENERATION_PARAMS
+            ))
+            first = next(responses, None)
+        except Exception:
+            usage_tracker.record('generation', None, time.perf_counter() - started, status=0,
+                                 prompt_components=prompt_components)
+            raise
+        start = _StreamStart(first, responses, started, prompt_components)
+        if start.status_code != 200:
+            usage_tracker.record('generation', first, time.perf_counter() - started,
+                                 prompt_components=prompt_components)
+        return start
+    
+    def _prepare_prompt(self, query: str, context: List[Dict], conversation_history: List[Dict] = None,
+                        index_version: str = "", judge_relevance: bool = False):
+        """组装上下文、对话历史并构建提示词，返回 (提示词, 回答缓存键, 各部分token数)"""
+        with metrics.span('context_build'):
+            context_text = self._build_context(context)
+            history_text = self._build_history(conversation_history) if conversation_history else ""
+        prompt = self._build_prompt(query, context_text, history_text, judge_relevance)
+        
+        cache_key = None
+        if self.response_cache is not None:
+            params = dict(self.GENERATION_PARAMS, judge_relevance=True) if judge_relevance else self.GENERATION_PARAMS
+            cache_key = ResponseCache.make_key(
+                query, context or [], history_text, self.model, params, index_version
+            )
+        
+        # 估算提示词各组成部分的token数，用于分析历史与检索上下文的开销
+        counter = get_token_counter()
+        components = {
+            'system': counter.count(Config.SYSTEM_PROMPT),
+            'history': counter.count(history_text),
+            'context': counter.count(context_text),
+            'query': counter.count(query),
+        }
+        return prompt, cache_key, components
+    
+    @staticmethod
+    def _request_timeout(deadline_at: float) -> float:
+        """单次请求的超时：不超过 LLM_REQUEST_TIMEOUT，也不超过距时限的剩余时间"""
+        return max(1.0, min(Config.LLM_REQUEST_TIMEOUT, deadline_at - time.monotonic()))
+    
+    def _call(self, stage: str, prompt_components: Dict[str, int] = None, deadline: Optional[float] = None,
+              **kwargs):
+        """调用生成接口（时限、对冲、限流、重试与熔断），并按阶段记录每次尝试的token用量、耗时与状态
+        
+        deadline 为总时限（秒），默认取 Config.LLM_DEADLINE_<阶段>。
+        熔断中、限流等待超时或超过时限时抛出 LLMUnavailableError。
+        """
+        deadline_at = time.monotonic() + (deadline or self.DEADLINES[stage])
+        
+        def attempt():
+            started = time.perf_counter()
+            try:
+                response = self.generation.call(model=self.model, request_timeout=self._request_timeout(deadline_at),
+                                                **kwargs)
+            except Exception:
+                usage_tracker.record(stage, None, time.perf_counter() - started, status=0,
+                                     prompt_components=prompt_components)
+                raise
+            usage_tracker.record(stage, response, time.perf_counter() - started,
+                                 prompt_components=prompt_components)
+            return response
+        
+        return self.resilience.call(stage, lambda: self.hedger.run(stage, attempt, deadline_at), deadline_at)
+    
     def _build_context(self, context: List[Dict]) -> str:
         """构建上下文文本"""
         if not context:
             return ""
         
+        if self.context_assembler is not None:
+            return self.context_assembler.build(context)
+        
         context_text = "文档内容：\n"
         for i, (chunk, score) in enumerate(context, 1):
             context_text += f"{i}. {chunk['text']}\n"
@@ -118,6 +427,9 @@ class LLMClient:
         if not history:
             return ""
         
+        if self.history_compactor is not None:
+            return self.history_compactor.build(history)
+        
         history_text = "对话历史：\n"
         for msg in history[-3:]:  # 只保留最近3轮对话，减少token消耗
             role = "用户" if msg['role'] == 'user' else "助手"
@@ -125,13 +437,19 @@ class LLMClient:
         
         return history_text
     
-    def _build_prompt(self, query: str, context: str, history: str) -> str:
+    def compact_history(self, history: List[Dict], wait: bool = False):
+        """回答完成后调用，为历史中的助手回答生成摘要（wait=False时在后台计算）"""
+        if self.history_compactor is not None:
+            self.history_compactor.schedule(history, wait)
+    
+    def _build_prompt(self, query: str, context: str, history: str, judge_relevance: bool = False) -> str:
         """构建完整提示词"""
+        instruction = f"{OUT_OF_SCOPE_INSTRUCTION}\n\n" if judge_relevance else ""
         prompt = f"""{Config.SYSTEM_PROMPT}
 
 {history}{context}
 
-用户：{query}
+{instruction}用户：{query}
 
 回答："""
         
@@ -145,62 +463,70 @@ class LLMClient:
             return self.relevance_cache[query_hash]
         
         # 简化的相关性判断
-        relevance_score = self._calculate_simple_relevance(query)
-        is_relevant = relevance_score >= 0.5  # 设置合理的阈值
-        
-        # 缓存结果
-        self.relevance_cache[query_hash] = is_relevant
-        self._save_relevance_cache()
+        relevance_score, degraded = self._calculate_simple_relevance(query)
+        is_relevant = relevance_score >= RELEVANCE_THRESHOLD
+        if degraded:
+            # 大模型不可用时的判断只看关键词，不写入缓存，恢复后重新判断
+            return is_relevant
         
+        self.remember_relevance(query, is_relevant)
         return is_relevant
     
-    def _calculate_simple_relevance(self, query: str) -> float:
-        """简化的相关性计算"""
+    def prejudge_relevance(self, query: str) -> Optional[bool]:
+        """单次往返模式的相关性预判：只看缓存与关键词，无法确定时返回None，由生成时一并判断"""
+        query_hash = self._get_query_hash(query)
+        if query_hash in self.relevance_cache:
+            return self.relevance_cache[query_hash]
+        
+        with metrics.span('keyword_score'):
+            decision = self._keyword_decision(self._calculate_keyword_score(query))
+        if decision is not None:
+            self.remember_relevance(query, decision)
+        return decision
+    
+    def remember_relevance(self, query: str, is_relevant: bool):
+        """缓存相关性判断结果"""
+        with self._cache_lock:
+            self.relevance_cache[self._get_query_hash(query)] = is_relevant
+        self._save_relevance_cache()
+    
+    @staticmethod
+    def _keyword_decision(keyword_score: float) -> Optional[bool]:
+        """大模型分数在0~1之间，关键词分数单独已能决定结果时返回该结果，否则返回None"""
+        if keyword_score * KEYWORD_WEIGHT >= RELEVANCE_THRESHOLD:
+            return True
+        if keyword_score * KEYWORD_WEIGHT + (1 - KEYWORD_WEIGHT) < RELEVANCE_THRESHOLD:
+            return False
+        return None
+    
+    def _calculate_simple_relevance(self, query: str) -> Tuple[float, bool]:
+        """简化的相关性计算，返回 (分数, 是否降级为只看关键词)"""
         scores = []
         
         # 1. 关键词匹配判断
-        keyword_score = self._calculate_keyword_score(query)
+        with metrics.span('keyword_score'):
+            keyword_score = self._calculate_keyword_score(query)
         scores.append(keyword_score)
         
         # 2. LLM语义判断
-        llm_score = self._calculate_llm_relevance_score(query)
+        with metrics.span('llm_relevance'):
+            llm_score = self._calculate_llm_relevance_score(query)
+        if llm_score is None:
+            metrics.inc('relevance_fallback_total')
+            return keyword_score, True
         scores.append(llm_score)
         
         # 加权平均 - 关键词匹配权重更高
-        weights = [0.6, 0.4]  # 关键词、LLM判断的权重
+        weights = [KEYWORD_WEIGHT, 1 - KEYWORD_WEIGHT]  # 关键词、LLM判断的权重
         final_score = sum(score * weight for score, weight in zip(scores, weights))
         
-        return final_score
+        return final_score, False
     
     def _calculate_keyword_score(self, query: str) -> float:
         """计算关键词匹配分数"""
-        relevant_keywords = [
-            # 核心业务关键词
-            '线下店', '教培', '教育', '培训', '机构', '选址', '装修', '运营',
-            '财务', '成本', '现金流', '盈利', '风险', '投诉', '师资',
-            '创业者', '负责人', '经理', '教练', '管家', '医生', 'Word',
-            'word','Excel','excel','PPT','ppt','PPTX','pptx','PDF','pdf',
-            '创业', '加盟', '直营', '联营', '加盟店', '直营店', '联营店', '加盟店管理',
-            '推荐','辅导','方法','课程','教学','学员','招生','营销','推广',
-            '服务','管理','团队','建设','文化','激励','沟通','协作',
-            '风险','控制','合规','安全','质量','标准','流程','制度',
-            '扩张','复制','连锁','品牌','统一','标准化','规模化',
-            
-            # 扩展业务关键词
-            '店铺', '门店', '店面', '营业', '经营', '管理', '运营',
-            '收入', '支出', '利润', '亏损', '预算', '投资', '回报',
-            '人员', '员工', '招聘', '培训', '考核', '绩效', '薪资',
-            '客户', '学员', '家长', '满意度', '投诉', '服务', '体验',
-            '市场', '竞争', '定位', '策略', '计划', '目标', '指标',
-            '设备', '设施', '环境', '装修', '设计', '布局', '空间',
-            '课程', '教学', '教材', '教案', '评估', '测试', '成绩',
-            '宣传', '广告', '推广', '营销', '销售', '转化', '成交',
-            '法律', '合同', '协议', '条款', '责任', '义务', '权利',
-            '数据', '分析', '统计', '报告', '监控', '预警', '改进'
-        ]
         
         query_lower = query.lower()
-        matched_keywords = sum(1 for keyword in relevant_keywords if keyword in query_lower)
+        matched_keywords = sum(1 for keyword in RELEVANT_KEYWORDS if keyword in query_lower)
         
         # 根据匹配关键词数量计算分数 - 更宽松的评分
         if matched_keywords == 0:
@@ -212,8 +538,8 @@ class LLMClient:
         else:
             return 1.0  # 多关键词满分
     
-    def _calculate_llm_relevance_score(self, query: str) -> float:
-        """使用LLM计算相关性分数"""
+    def _calculate_llm_relevance_score(self, query: str) -> Optional[float]:
+        """使用LLM计算相关性分数，调用失败或服务不可用时返回None"""
         relevance_prompt = f"""请判断以下用户查询是否与线下店教培机构运营相关。
 
 线下店教培机构相关主题包括：
@@ -233,8 +559,8 @@ class LLMClient:
 请只回答"相关"或"不相关"："""
 
         try:
-            response = Generation.call(
-                model=self.model,
+            response = self._call(
+                'relevance',
                 prompt=relevance_prompt,
                 max_tokens=10,
                 temperature=0.1,  # 低温度确保一致性
@@ -245,33 +571,16 @@ class LLMClient:
                 result = response.output.text.strip().lower()
                 return 1.0 if "相关" in result or "是" in result else 0.0
             else:
-                return 0.0
+                return None
                 
         except Exception as e:
-            return 0.0
+            return None
     
     def _fallback_relevance_check(self, query: str) -> bool:
         """回退的相关性检查（关键词匹配）"""
-        relevant_keywords = [
-            '线下店', '教培', '教育', '培训', '机构', '选址', '装修', '运营',
-            '财务', '成本', '现金流', '盈利', '风险', '投诉', '师资',
-            '创业者', '负责人', '经理', '教练', '管家', '医生', 'Word',
-            'word','Excel','excel','PPT','ppt','PPTX','pptx','PDF','pdf',
-            '创业', '加盟', '直营', '联营', '加盟店', '直营店', '联营店', '加盟店管理',
-            '推荐','辅导','方法','课程','教学','学员','招生','营销','推广',
-            '服务','管理','团队','建设','文化','激励','沟通','协作',
-            '风险','控制','合规','安全','质量','标准','流程','制度',
-            '扩张','复制','连锁','品牌','统一','标准化','规模化',
-            '线下店','教培','教育','培训','机构',
-            '选址','装修','运营','财务','成本',
-            '师资', '员工', '招聘', '培训', '考核',
-            '学员', '家长', '满意度', '投诉', '服务',
-            '营销', '推广', '宣传', '广告', '销售',
-            '风险', '控制', '合规', '安全', '法律',
-        ]
         
         query_lower = query.lower()
-        return any(keyword in query_lower for keyword in relevant_keywords)
+        return any(keyword in query_lower for keyword in FALLBACK_KEYWORDS)
 
 if __name__ == "__main__":
     # 测试LLM客户端
@@ -0,0 +1,255 @@
+import contextvars
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from config import Config
+from llm_resilience import LLMDeadlineExceeded, RETRYABLE_STATUS
+from metrics import metrics
+
+
+class LatencyWindow:
+    """最近若干次成功请求的延迟，用于估算对冲等待时间"""
+
+    def __init__(self, size: int = Config.LLM_HEDGE_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q / 100.0 * len(samples)))]
+
+
+class HedgeBudget:
+    """对冲额度：每个请求累积 ratio 个额度，每次对冲消耗1个，最多积累 burst 个
+
+    长期来看对冲请求不超过请求总数的 ratio，DashScope变慢时也不会让请求量翻倍。
+    """
+
+    def __init__(self, ratio: float = Config.LLM_HEDGE_BUDGET, burst: float = Config.LLM_HEDGE_BURST):
+        self.ratio = ratio
+        self.burst = max(1.0, burst)
+        self._credit = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._credit = min(self.burst, self._credit + self.ratio)
+
+    def refund(self):
+        """取得额度后未能发出对冲（如限流），归还额度"""
+        with self._lock:
+            self._credit = min(self.burst, self._credit + 1)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._credit >= 1:
+                self._credit -= 1
+                return True
+            return False
+
+
+class _Race:
+    """一次对冲请求中各次尝试的结果汇总；结束后才返回的尝试交给 discard 处理（如关闭流式连接）"""
+
+    def __init__(self, discard: Optional[Callable]):
+        self.results = queue.Queue()
+        self.discard = discard
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def put(self, result):
+        with self._lock:
+            if not self.closed:
+                self.results.put(result)
+                return
+        self._discard(result)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(result)
+
+    def _discard(self, result):
+        response = result[1]
+        if response is not None and self.discard is not None:
+            try:
+                self.discard(response)
+            except Exception:
+                pass
+
+
+class Hedger:
+    """对冲请求
+
+    请求在近期延迟的 LLM_HEDGE_PERCENTILE 分位数内没有响应（流式请求为首个分片）时，
+    再发一个相同的请求，先成功返回者胜出，另一个返回后即被丢弃（流式连接随即关闭）。
+    对冲受 HedgeBudget 限制，并且与普通请求一样消耗限流令牌；熔断器非关闭状态时不对冲。
+    每次调用按名称（relevance、generation、generation_first_token）分别统计延迟：
+    hedged_<名称> 为调用方实际等待的时间，unhedged_<名称> 为首个请求自身的耗时（即不对冲时的延迟），
+    两者的p99之差即对冲带来的尾延迟改善。
+    """
+
+    def __init__(self, resilience=None, enabled: bool = Config.LLM_HEDGE_ENABLED,
+                 percentile: float = Config.LLM_HEDGE_PERCENTILE,
+                 min_delay: float = Config.LLM_HEDGE_MIN_DELAY,
+                 min_samples: int = Config.LLM_HEDGE_MIN_SAMPLES,
+                 budget: HedgeBudget = None):
+        self.resilience = resilience
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget or HedgeBudget()
+        self._windows: Dict[str, LatencyWindow] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _window(self, name: str) -> LatencyWindow:
+        window = self._windows.get(name)
+        if window is None:
+            with self._lock:
+                window = self._windows.setdefault(name, LatencyWindow())
+        return window
+
+    def _count(self, name: str, key: str):
+        with self._lock:
+            counts = self._counts.setdefault(name, {'requests': 0, 'hedged': 0, 'hedge_wins': 0})
+            counts[key] += 1
+
+    def hedge_delay(self, name: str) -> Optional[float]:
+        """发出对冲请求前的等待时间；未启用或近期样本不足时返回None"""
+        if not self.enabled:
+            return None
+        window = self._window(name)
+        if len(window) < self.min_samples:
+            return None
+        return max(self.min_delay, window.percentile(self.percentile))
+
+    def _may_hedge(self, name: str) -> bool:
+        if not self.budget.withdraw():
+            metrics.inc('llm_hedge_skipped_total', stage=name, reason='budget')
+            return False
+        if self.resilience is not None and not self.resilience.try_acquire():
+            self.budget.refund()
+            metrics.inc('llm_hedge_skipped_total', stage=name, reason='rate_limited')
+            return False
+        return True
+
+    def _attempt(self, name: str, func: Callable, race: _Race, primary: bool):
+        started = time.perf_counter()
+        context = contextvars.copy_context()   # 用量统计的归属信息（usage_scope）随请求带入线程
+
+        def run():
+            try:
+                response, error = context.run(func), None
+            except Exception as e:
+                response, error = None, e
+            elapsed = time.perf_counter() - started
+            if error is None and getattr(response, 'status_code', 0) not in RETRYABLE_STATUS:
+                self._window(name).add(elapsed)
+            if primary:
+                metrics.observe(f'unhedged_{name}', elapsed)
+            race.put((primary, response, error))
+
+        threading.Thread(target=run, daemon=True, name=f'llm-{name}').start()
+
+    def run(self, name: str, func: Callable, deadline: Optional[float] = None, discard: Callable = None):
+        """执行 func()（返回DashScope响应），必要时对冲；deadline 为 time.monotonic() 时限
+
+        discard 用于处理落败请求晚到的响应。两次请求都失败时返回最后一个错误响应或抛出其异常，
+        由 ResilientCaller 决定是否重试；到达时限仍无结果时抛出 LLMDeadlineExceeded。
+        """
+        self.budget.deposit()
+        self._count(name, 'requests')
+        started = time.perf_counter()
+        delay = self.hedge_delay(name)
+        if delay is None:
+            # 不对冲时在调用线程内直接请求（单次请求的超时已按时限收紧）
+            response = func()
+            elapsed = time.perf_counter() - started
+            if getattr(response, 'status_code', 0) not in RETRYABLE_STATUS:
+                self._window(name).add(elapsed)
+            metrics.observe(f'unhedged_{name}', elapsed)
+            metrics.observe(f'hedged_{name}', elapsed)
+            return response
+
+        race = _Race(discard)
+        self._attempt(name, func, race, primary=True)
+        pending, hedged, last = 1, False, None
+        try:
+            while pending:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if not hedged:
+                    wait = delay - (time.perf_counter() - started)
+                    timeout = wait if timeout is None else min(timeout, wait)
+                try:
+                    primary, response, error = race.results.get(timeout=max(0.0, timeout) if timeout is not None
+                                                                else None)
+                except queue.Empty:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        metrics.inc('llm_deadline_exceeded_total', stage=name)
+                        raise LLMDeadlineExceeded(f'大模型请求超过时限（{name}）')
+                    hedged = True
+                    if self._may_hedge(name):
+                        self._count(name, 'hedged')
+                        metrics.inc('llm_hedge_total', stage=name)
+                        self._attempt(name, func, race, primary=False)
+                        pending += 1
+                    continue
+                pending -= 1
+                if error is None and getattr(response, 'status_code', 0) not in RETRYABLE_STATUS:
+                    if not primary:
+                        self._count(name, 'hedge_wins')
+                        metrics.inc('llm_hedge_wins_total', stage=name)
+                    return response
+                # 先返回的是错误：还有请求在途时等待它，否则交给调用方重试
+                last = (response, error)
+            response, error = last
+            if error is not None:
+                raise error
+            return response
+        finally:
+            race.close()
+            metrics.observe(f'hedged_{name}', time.perf_counter() - started)
+
+    def get_stats(self) -> Dict:
+        """各调用的对冲率、对冲胜出次数与对冲前后的p99延迟"""
+        stages = metrics.snapshot()['stages']
+        with self._lock:
+            counts = {name: dict(values) for name, values in self._counts.items()}
+        result = {}
+        for name, values in counts.items():
+            delay = self.hedge_delay(name)
+            hedged = stages.get(f'hedged_{name}', {})
+            unhedged = stages.get(f'unhedged_{name}', {})
+            result[name] = dict(
+                values,
+                hedge_rate=round(values['hedged'] / values['requests'], 4) if values['requests'] else 0.0,
+                hedge_delay_ms=round(delay * 1000, 1) if delay is not None else None,
+                p99_ms=hedged.get('p99_ms'),
+                unhedged_p99_ms=unhedged.get('p99_ms'),
+            )
+        return {
+            'enabled': self.enabled,
+            'percentile': self.percentile,
+            'budget_ratio': self.budget.ratio,
+            'stages': result,
+        }
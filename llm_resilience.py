@@ -0,0 +1,221 @@
+import random
+import socket
+import threading
+import time
+from typing import Callable, Optional
+
+from config import Config
+from metrics import metrics
+
+# 可重试的状态码：限流、服务端错误与网关超时
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+# 熔断器状态对应的仪表值
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+class LLMUnavailableError(Exception):
+    """大模型暂不可用（熔断中或本地限流等待超时），调用方应走降级逻辑"""
+
+
+class LLMDeadlineExceeded(LLMUnavailableError):
+    """请求（含重试与对冲）超过时限仍无结果"""
+
+
+# 可重试的异常：网络连接失败与超时（DashScope SDK经requests发出请求）；参数错误等其他异常直接抛出
+try:
+    from requests.exceptions import ConnectionError as _RequestsConnectionError, Timeout as _RequestsTimeout
+    _REQUESTS_ERRORS = (_RequestsConnectionError, _RequestsTimeout)
+except ImportError:
+    _REQUESTS_ERRORS = ()
+
+RETRYABLE_EXCEPTIONS = (ConnectionError, TimeoutError, socket.timeout, LLMDeadlineExceeded) + _REQUESTS_ERRORS
+
+
+class TokenBucket:
+    """令牌桶限流：每秒补充 rate 个令牌，最多积累 capacity 个（允许的突发量）"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """取一个令牌，最多等待timeout秒；rate<=0表示不限流"""
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """熔断器
+
+    closed：正常放行，连续失败达到 failure_threshold 次后转为 open；
+    open：直接拒绝，经过 recovery_seconds 后转为 half_open；
+    half_open：只放行一个探测请求，成功则恢复 closed，失败则重新 open。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = Config.LLM_BREAKER_FAILURE_THRESHOLD,
+                 recovery_seconds: float = Config.LLM_BREAKER_RECOVERY_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_seconds = recovery_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        metrics.set_gauge('circuit_breaker_state', CIRCUIT_STATES['closed'], name=name)
+
+    def _transition(self, state: str):
+        if state != self.state:
+            print(f"⚡ 熔断器 {self.name}: {self.state} -> {state}")
+            self.state = state
+            metrics.set_gauge('circuit_breaker_state', CIRCUIT_STATES[state], name=self.name)
+            metrics.inc('circuit_breaker_transitions_total', name=self.name, to=state)
+
+    def allow(self) -> bool:
+        """是否放行本次请求"""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.recovery_seconds:
+                self._transition('half_open')
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """放行后并未真正发出请求（如本地限流超时），归还半开状态的探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._transition('closed')
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition('open')
+
+
+class ResilientCaller:
+    """对生成接口的调用统一做本地限流、有限次重试（带抖动的指数退避）与熔断"""
+
+    def __init__(self, name: str = 'dashscope',
+                 rate_per_minute: float = Config.LLM_RATE_LIMIT_RPM,
+                 burst: float = Config.LLM_RATE_LIMIT_BURST,
+                 max_retries: int = Config.LLM_MAX_RETRIES,
+                 base_delay: float = Config.LLM_RETRY_BASE_DELAY,
+                 max_delay: float = Config.LLM_RETRY_MAX_DELAY,
+                 limiter_timeout: float = Config.LLM_RATE_LIMIT_WAIT):
+        self.limiter = TokenBucket(rate_per_minute / 60.0, burst)
+        self.breaker = CircuitBreaker(name)
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter_timeout = limiter_timeout
+
+    @staticmethod
+    def is_retryable(response) -> bool:
+        return getattr(response, 'status_code', 0) in RETRYABLE_STATUS
+
+    @staticmethod
+    def is_retryable_error(error: BaseException) -> bool:
+        return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次重试前的等待：[0, min(max_delay, base * 2^attempt)] 内均匀随机（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def remaining(deadline: Optional[float]) -> Optional[float]:
+        """距时限（time.monotonic()）的剩余秒数，无时限时返回None"""
+        return None if deadline is None else deadline - time.monotonic()
+
+    def try_acquire(self) -> bool:
+        """对冲请求：仅在熔断器关闭时、不等待地取一个限流令牌"""
+        return self.breaker.state == 'closed' and self.limiter.acquire(0)
+
+    def before_attempt(self, stage: str, deadline: Optional[float] = None):
+        """每次发出请求前：时限、熔断检查与限流，不可用时抛出 LLMUnavailableError"""
+        remaining = self.remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            metrics.inc('llm_deadline_exceeded_total', stage=stage)
+            raise LLMDeadlineExceeded('大模型请求超过时限')
+        if not self.breaker.allow():
+            metrics.inc('llm_rejected_total', stage=stage, reason='circuit_open')
+            raise LLMUnavailableError('大模型服务熔断中')
+        started = time.perf_counter()
+        timeout = self.limiter_timeout if remaining is None else min(self.limiter_timeout, remaining)
+        if not self.limiter.acquire(timeout):
+            self.breaker.release()
+            metrics.inc('llm_rejected_total', stage=stage, reason='rate_limited')
+            raise LLMUnavailableError('本地限流等待超时')
+        metrics.observe('llm_rate_limit_wait', time.perf_counter() - started)
+
+    def retry_or_raise(self, stage: str, attempt: int, error: Optional[BaseException] = None,
+                       deadline: Optional[float] = None) -> bool:
+        """一次尝试失败后记入熔断器；还可重试（且退避后仍在时限内）时等待退避时间并返回True"""
+        self.breaker.record_failure()
+        delay = self.backoff(attempt)
+        remaining = self.remaining(deadline)
+        if (attempt >= self.max_retries or self.breaker.state == 'open'
+                or (remaining is not None and delay >= remaining)):
+            metrics.inc('llm_failures_total', stage=stage)
+            if error is not None:
+                raise error
+            return False
+        metrics.inc('llm_retries_total', stage=stage)
+        time.sleep(delay)
+        return True
+
+    def call(self, stage: str, func: Callable, deadline: Optional[float] = None):
+        """执行 func()（返回DashScope响应）；可重试的状态码与网络/超时异常按退避策略重试
+
+        重试用尽或即将超过时限（time.monotonic()）时返回最后一次的错误响应或抛出最后一次的异常；
+        其他异常（如参数错误）不重试、不计入熔断，直接抛出。
+        """
+        attempt = 0
+        while True:
+            self.before_attempt(stage, deadline)
+            try:
+                response = func()
+            except Exception as e:
+                if not self.is_retryable_error(e):
+                    self.breaker.release()
+                    raise
+                self.retry_or_raise(stage, attempt, e, deadline)
+                attempt += 1
+                continue
+            if not self.is_retryable(response):
+                # 4xx等请求本身的问题不计入熔断
+                self.breaker.record_success()
+                return response
+            if not self.retry_or_raise(stage, attempt, deadline=deadline):
+                return response
+            attempt += 1
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+端到端压测脚本
+
+N个并发模拟用户调用 IntelligentAgent.query，统计吞吐量，并从性能指标（metrics）中读取
+各阶段（关键词评分、大模型相关性判断、查询向量化、检索、上下文组装、生成、整体）的 p50/p95/p99 延迟。
+默认使用进程内DashScope替身，无需网络。
+
+用法：
+  python load_test.py --users 16 --queries 10 --latency lognormal --latency-ms 800
+  python load_test.py --users 8 --dashscope-url http://127.0.0.1:8765/api/v1   # 走HTTP替身
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from mock_dashscope import add_mock_arguments, mock_from_args
+
+# 报告的阶段，对应 agent / llm_client / vector_store 中的 metrics.span 名称
+STAGES = ['keyword_score', 'llm_relevance', 'query_embedding', 'search', 'context_build', 'generation', 'query_total']
+
+# 非领域问题，用于覆盖拒答路径
+OFF_TOPIC_QUERIES = [
+    "今天天气怎么样？",
+    "推荐一部好看的电影",
+    "帮我写一首关于春天的诗",
+]
+
+
+def build_query_pool(agent, seed: int = 0) -> List[str]:
+    """由快捷功能问题派生查询池，加入少量非领域问题"""
+    rng = random.Random(seed)
+    base = [action['query'] for action in agent.get_quick_actions()]
+    pool = []
+    for query in base:
+        pool.append(query)
+        # 截取前半句生成变体，避免全部命中相关性缓存
+        pool.append(query[:rng.randint(12, max(13, len(query) // 2))] + "？")
+    return pool + OFF_TOPIC_QUERIES
+
+
+class LoadTester:
+    """并发模拟用户驱动Agent；各阶段耗时由Agent自身的 metrics.span 记录"""
+
+    def __init__(self, agent, users: int, queries_per_user: int, think_time_ms: float = 0, seed: int = 0):
+        self.agent = agent
+        self.users = users
+        self.queries_per_user = queries_per_user
+        self.think_time = think_time_ms / 1000.0
+        self.pool = build_query_pool(agent, seed)
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.errors = 0
+        self.rejected = 0
+
+    def _run_one(self, query: str, history: List[Dict]):
+        from agent import OUT_OF_SCOPE_MESSAGE
+        from llm_client import is_error_response
+        response = self.agent.query(query, history)
+        with self._lock:
+            self.completed += 1
+            if response == OUT_OF_SCOPE_MESSAGE:
+                self.rejected += 1
+            elif is_error_response(response):
+                self.errors += 1
+
+    def _user(self, user_id: int):
+        rng = random.Random(self.seed * 1000 + user_id)
+        history: List[Dict] = []
+        for _ in range(self.queries_per_user):
+            self._run_one(rng.choice(self.pool), history)
+            if self.think_time:
+                time.sleep(rng.expovariate(1 / self.think_time))
+
+    def run(self) -> Dict:
+        from metrics import metrics
+        metrics.enabled = True
+        metrics.reset()   # 只统计本次压测的请求
+        threads = [threading.Thread(target=self._user, args=(i,), name=f'user-{i}') for i in range(self.users)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        stages = metrics.snapshot()['stages']
+        return {
+            'users': self.users,
+            'queries_per_user': self.queries_per_user,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput_qps': round(self.completed / elapsed, 3) if elapsed else 0.0,
+            'stages_ms': {stage: stages.get(stage, {'count': 0}) for stage in STAGES},
+        }
+
+
+def print_report(report: Dict):
+    print("\n📊 压测结果")
+    print("=" * 72)
+    print(f"并发用户: {report['users']}  每用户查询: {report['queries_per_user']}  "
+          f"完成: {report['completed']}  拒答: {report['rejected']}  错误: {report['errors']}")
+    print(f"总耗时: {report['elapsed_seconds']}s  吞吐量: {report['throughput_qps']} 查询/秒")
+    print("-" * 72)
+    print(f"{'阶段':<18}{'次数':>8}{'avg':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for stage, stats in report['stages_ms'].items():
+        if not stats['count']:
+            continue
+        print(f"{stage:<18}{stats['count']:>8}{stats['avg_ms']:>10}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="教培管家端到端压测")
+    parser.add_argument('--users', type=int, default=8, help='并发模拟用户数')
+    parser.add_argument('--queries', type=int, default=10, help='每个用户的查询次数')
+    parser.add_argument('--think-time-ms', type=float, default=0, help='用户两次提问间的平均思考时间')
+    parser.add_argument('--dashscope-url', default='', help='使用HTTP接口（如本地替身服务）而非进程内替身')
+    parser.add_argument('--keep-response-cache', action='store_true', help='保留回答缓存（默认关闭以测量生成延迟）')
+    parser.add_argument('--single-round-trip', action='store_true',
+                        help='单次往返模式：相关性判断并入生成（Config.SINGLE_ROUND_TRIP_ENABLED）')
+    parser.add_argument('--json', dest='json_path', default='', help='结果另存为JSON文件')
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from config import Config
+    from llm_client import LLMClient
+    from agent import IntelligentAgent
+    from session_store import MemorySessionStore
+    from vector_store import VectorStore
+
+    # 先创建知识库，LLMClient复用其向量模型（与 IntelligentAgent 默认行为一致，只加载一次）
+    store = VectorStore()
+    if args.dashscope_url:
+        Config.DASHSCOPE_BASE_URL = args.dashscope_url
+        Config.DASHSCOPE_API_KEY = Config.DASHSCOPE_API_KEY or 'mock-key'
+        llm_client = LLMClient(embedding_model=store.model)
+    else:
+        llm_client = LLMClient(generation=mock_from_args(args), embedding_model=store.model)
+
+    # 压测使用独立的相关性缓存与用量统计文件，避免污染线上数据
+    from usage_tracker import usage_tracker
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    llm_client.cache_file = os.path.join(workdir, 'relevance_cache.json')
+    usage_tracker.stats_file = os.path.join(workdir, 'usage_stats.json')
+    llm_client.relevance_cache = {}
+    if not args.keep_response_cache:
+        llm_client.response_cache = None
+    if args.single_round_trip:
+        Config.SINGLE_ROUND_TRIP_ENABLED = True
+
+    agent = IntelligentAgent(llm_client=llm_client, session_store=MemorySessionStore(),  # 不写入线上会话库
+                             vector_store=store)
+    tester = LoadTester(agent, args.users, args.queries, args.think_time_ms, seed=args.seed or 0)
+    print(f"🚀 开始压测: {args.users} 个并发用户 x {args.queries} 次查询")
+    report = tester.run()
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已保存到 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
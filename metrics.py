@@ -0,0 +1,210 @@
+import bisect
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from config import Config
+
+# 直方图桶上界（秒），覆盖从毫秒级检索到数十秒的大模型生成
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+METRIC_PREFIX = "csagent"
+
+
+class Histogram:
+    """固定桶直方图（线程安全）"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """按桶线性插值估算分位数（与Prometheus histogram_quantile一致）"""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count > 0:
+                if i >= len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum_seconds': round(self.sum, 6),
+            'avg_ms': round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p95_ms': round(self.quantile(0.95) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3),
+        }
+
+
+class _Span:
+    """计时上下文，退出时把耗时记入对应阶段"""
+
+    __slots__ = ('registry', 'stage', 'started')
+
+    def __init__(self, registry: 'MetricsRegistry', stage: str):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.stage, time.perf_counter() - self.started)
+        if exc_type is not None:
+            self.registry.inc('stage_errors_total', stage=self.stage)
+        return False
+
+
+class _NoopSpan:
+    """关闭指标时使用的空上下文，开销仅为一次方法调用"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _label_key(labels: Dict) -> Tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+    return '{' + body + '}'
+
+
+class MetricsRegistry:
+    """进程内指标：各阶段耗时直方图、计数器与仪表值"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._stages: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._gauges: Dict[Tuple[str, Tuple], float] = {}
+        self._lock = threading.Lock()
+
+    def span(self, stage: str):
+        """阶段计时：with metrics.span('search'): ..."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    def inc(self, metric: str, value: float = 1.0, **labels):
+        """计数器累加"""
+        if not self.enabled:
+            return
+        key = (metric, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, metric: str, value: float, **labels):
+        """设置仪表值"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(metric, _label_key(labels))] = float(value)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def snapshot(self) -> Dict:
+        """JSON快照"""
+        with self._lock:
+            stages = dict(self._stages)
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        def flatten(items: Dict) -> List[Dict]:
+            return [dict(name=name, labels=dict(labels), value=value)
+                    for (name, labels), value in sorted(items.items())]
+
+        return {
+            'enabled': self.enabled,
+            'timestamp': time.time(),
+            'stages': {stage: histogram.snapshot() for stage, histogram in sorted(stages.items())},
+            'counters': flatten(counters),
+            'gauges': flatten(gauges),
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus文本格式导出"""
+        with self._lock:
+            stages = dict(self._stages)
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines: List[str] = []
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines.append(f"# HELP {name} Query pipeline stage duration in seconds.")
+        lines.append(f"# TYPE {name} histogram")
+        for stage, histogram in sorted(stages.items()):
+            with histogram._lock:
+                counts = list(histogram.counts)
+                total, total_sum = histogram.count, histogram.sum
+            labels = (('stage', stage),)
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total_sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {total}")
+
+        for kind, items in (('counter', counters), ('gauge', gauges)):
+            declared = set()
+            for (metric, labels), value in sorted(items.items()):
+                full_name = f"{METRIC_PREFIX}_{metric}"
+                if full_name not in declared:
+                    lines.append(f"# TYPE {full_name} {kind}")
+                    declared.add(full_name)
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+# 进程级默认注册表
+metrics = MetricsRegistry(enabled=Config.METRICS_ENABLED)
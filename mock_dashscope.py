@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+本地DashScope替身服务
+
+提供两种形态：
+  1. MockGeneration：与 dashscope.Generation.call 同接口的进程内替身，可直接注入 LLMClient(generation=...)
+  2. HTTP服务：兼容 /api/v1/services/aigc/text-generation/generation（含SSE流式），
+     设置 DASHSCOPE_BASE_URL=http://127.0.0.1:<端口>/api/v1 即可让真实SDK走本地替身
+
+支持可配置的延迟分布（fixed / uniform / lognormal）、流式分片速度和错误注入。
+
+用法：
+  python mock_dashscope.py --port 8765 --latency lognormal --latency-ms 800 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+
+class _Namespace:
+    """简单属性容器，模拟dashscope响应对象的属性访问"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __getitem__(self, key):
+        return self.__dict__[key]
+
+    def get(self, key, default=None):
+        return self.__dict__.get(key, default)
+
+
+class LatencyModel:
+    """延迟分布（毫秒）"""
+
+    def __init__(self, kind: str = 'fixed', mean_ms: float = 500, spread: float = 0.5,
+                 seed: Optional[int] = None):
+        self.kind = kind
+        self.mean_ms = mean_ms
+        self.spread = spread  # uniform: 相对浮动比例；lognormal: sigma
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """采样一次延迟，返回秒"""
+        with self._lock:
+            if self.kind == 'uniform':
+                ms = self._rng.uniform(self.mean_ms * (1 - self.spread), self.mean_ms * (1 + self.spread))
+            elif self.kind == 'lognormal':
+                # 以mean_ms为中位数，sigma越大长尾越明显
+                ms = self.mean_ms * self._rng.lognormvariate(0, self.spread)
+            else:
+                ms = self.mean_ms
+        return max(0.0, ms) / 1000.0
+
+
+class MockGeneration:
+    """dashscope.Generation 的进程内替身"""
+
+    RELEVANCE_MARKER = '请只回答"相关"或"不相关"'
+    # 单次往返模式的生成提示词含 llm_client.OUT_OF_SCOPE_INSTRUCTION（内含该标记），无关问题只回答该标记
+    OUT_OF_SCOPE_MARKER = '[[OUT_OF_SCOPE]]'
+    # 替身按这些词判断问题与教培机构运营无关
+    OFF_TOPIC_HINTS = ('天气', '电影', '诗', '音乐', '游戏', '旅游', '菜谱')
+    ERRORS = [
+        (429, 'Throttling.RateQuota', 'Requests rate limit exceeded, please try again later.'),
+        (500, 'InternalError', 'An internal error has occured, please try again later.'),
+        (503, 'ServiceUnavailable', 'The service is temporarily unavailable.'),
+    ]
+
+    def __init__(self, latency: LatencyModel = None, token_interval_ms: float = 20,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, timeout_seconds: float = 30,
+                 answer_chars: int = 600, seed: Optional[int] = None):
+        self.latency = latency or LatencyModel()
+        self.token_interval = token_interval_ms / 1000.0  # 流式输出每个分片的间隔
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate          # 模拟挂起的请求比例
+        self.timeout_seconds = timeout_seconds
+        self.answer_chars = answer_chars
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _roll(self) -> float:
+        with self._lock:
+            self.calls += 1
+            return self._rng.random()
+
+    def _answer_text(self, prompt: str, max_tokens: int) -> str:
+        if self.RELEVANCE_MARKER in prompt:
+            return '相关'
+        query = prompt.rsplit('用户：', 1)[-1].split('\n', 1)[0].strip()
+        if self.OUT_OF_SCOPE_MARKER in prompt and any(hint in query for hint in self.OFF_TOPIC_HINTS):
+            return self.OUT_OF_SCOPE_MARKER
+        sentence = f"针对“{query[:30]}”，建议从目标、标准、执行和复盘四个方面落实，控制成本并关注现金流。"
+        repeats = max(1, self.answer_chars // len(sentence))
+        return (sentence * repeats)[:min(self.answer_chars, max_tokens * 2)]
+
+    @staticmethod
+    def _usage(prompt: str, text: str) -> Dict:
+        return {'input_tokens': len(prompt), 'output_tokens': len(text), 'total_tokens': len(prompt) + len(text)}
+
+    def _response(self, status_code: int, text: str = '', code: str = '', message: str = '',
+                  usage: Dict = None, finish_reason: str = 'stop'):
+        return _Namespace(
+            status_code=status_code,
+            request_id=uuid.uuid4().hex,
+            code=code,
+            message=message,
+            output=_Namespace(text=text, finish_reason=finish_reason) if status_code == 200 else None,
+            usage=_Namespace(**(usage or {'input_tokens': 0, 'output_tokens': 0, 'total_tokens': 0})),
+        )
+
+    def _maybe_fail(self):
+        """按配置注入错误/挂起；返回错误响应或None"""
+        roll = self._roll()
+        if roll < self.timeout_rate:
+            time.sleep(self.timeout_seconds)
+            return self._response(504, code='RequestTimeOut', message='Request timed out.')
+        if roll < self.timeout_rate + self.error_rate:
+            status, code, message = self._rng.choice(self.ERRORS)
+            return self._response(status, code=code, message=message)
+        return None
+
+    def call(self, model: str = None, prompt: str = '', stream: bool = False,
+             incremental_output: bool = False, max_tokens: int = 2048, **kwargs):
+        """与 Generation.call 一致的调用入口"""
+        if stream:
+            return self._stream(prompt, max_tokens, incremental_output)
+
+        time.sleep(self.latency.sample())
+        error = self._maybe_fail()
+        if error is not None:
+            return error
+        text = self._answer_text(prompt, max_tokens)
+        return self._response(200, text=text, usage=self._usage(prompt, text))
+
+    def _stream(self, prompt: str, max_tokens: int, incremental_output: bool) -> Iterator:
+        time.sleep(self.latency.sample())  # 首个分片前的等待
+        error = self._maybe_fail()
+        if error is not None:
+            yield error
+            return
+
+        text = self._answer_text(prompt, max_tokens)
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)]
+        emitted = ''
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.token_interval)
+            emitted += piece
+            last = i == len(pieces) - 1
+            yield self._response(
+                200,
+                text=piece if incremental_output else emitted,
+                usage=self._usage(prompt, emitted),
+                finish_reason='stop' if last else 'null',
+            )
+
+
+class MockDashScopeServer:
+    """兼容DashScope文本生成REST接口的本地HTTP服务"""
+
+    PATH = '/api/v1/services/aigc/text-generation/generation'
+
+    def __init__(self, generation: MockGeneration = None):
+        self.generation = generation or MockGeneration()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"🧪 DashScope替身服务已启动: http://{host}:{self.port}/api/v1")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    @staticmethod
+    def _payload(response) -> Dict:
+        if response.status_code != 200:
+            return {'code': response.code, 'message': response.message, 'request_id': response.request_id}
+        return {
+            'output': {'text': response.output.text, 'finish_reason': response.output.finish_reason},
+            'usage': dict(response.usage.__dict__),
+            'request_id': response.request_id,
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            _, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', '0') or 0))
+
+            if path.split('?', 1)[0] != self.PATH:
+                await self._write_json(writer, 404, {'code': 'NotFound', 'message': path})
+                return
+
+            data = json.loads(body or b'{}')
+            params = dict(data.get('parameters') or {})
+            prompt = (data.get('input') or {}).get('prompt', '')
+            stream = (headers.get('x-dashscope-sse', '').lower() == 'enable'
+                      or 'text/event-stream' in headers.get('accept', ''))
+            params.pop('stream', None)
+            loop = asyncio.get_running_loop()
+
+            if not stream:
+                response = await loop.run_in_executor(
+                    None, lambda: self.generation.call(model=data.get('model'), prompt=prompt, **params)
+                )
+                await self._write_json(writer, response.status_code, self._payload(response))
+                return
+
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream;charset=UTF-8\r\n"
+                         b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+            iterator = self.generation.call(model=data.get('model'), prompt=prompt, stream=True, **params)
+            index = 0
+            while True:
+                response = await loop.run_in_executor(None, next, iterator, None)
+                if response is None:
+                    break
+                index += 1
+                event = 'result' if response.status_code == 200 else 'error'
+                chunk = (f"id:{index}\nevent:{event}\n:HTTP_STATUS/{response.status_code}\n"
+                         f"data:{json.dumps(self._payload(response), ensure_ascii=False)}\n\n")
+                writer.write(chunk.encode('utf-8'))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write_json(writer: asyncio.StreamWriter, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """替身相关的命令行参数（供压测脚本复用）"""
+    parser.add_argument('--latency', choices=['fixed', 'uniform', 'lognormal'], default='lognormal',
+                        help='大模型延迟分布')
+    parser.add_argument('--latency-ms', type=float, default=800, help='延迟中位数/均值（毫秒）')
+    parser.add_argument('--latency-spread', type=float, default=0.5, help='uniform浮动比例或lognormal的sigma')
+    parser.add_argument('--token-interval-ms', type=float, default=20, help='流式分片间隔（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='注入错误的比例')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='注入挂起请求的比例')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def mock_from_args(args) -> MockGeneration:
+    """根据命令行参数创建替身"""
+    return MockGeneration(
+        latency=LatencyModel(args.latency, args.latency_ms, args.latency_spread, seed=args.seed),
+        token_interval_ms=args.token_interval_ms,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed,
+    )
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="本地DashScope替身服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    async def run():
+        server = MockDashScopeServer(mock_from_args(args))
+        await server.start(args.host, args.port)
+        await server._server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\n👋 替身服务已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,32 @@
-import PyPDF2
 import re
-from typing import List, Dict
+from typing import List, Dict, Iterator, Tuple
 from config import Config
 
+# 预编译的正则（清理、标题识别、句子切分在每一行/每个小节上都会用到）
+_PAGE_MARKER = re.compile(r'\n?=== 第\d+页 ===\n?')
+_INLINE_SPACES = re.compile(r'[ \t]+')
+_HEADING_PATTERN = re.compile('|'.join([
+    r'\d{1,3}(?:[\.|．]\d{1,3}){0,3}[\s、).)]+',            # 1 / 1.1 / 1.1.1
+    r'[（\(]?\d{1,3}[）\)]',                                 # （1）
+    r'[一二三四五六七八九十百千万]+、',                             # 一、 二、 …
+    r'[（\(][一二三四五六七八九十百千万]+[）\)]',                 # （一）
+    r'第[一二三四五六七八九十百千万0-9]+[章节部分卷]',               # 第三章 / 第1节
+]))
+_SENTENCE_ENDINGS = frozenset('。！？.!?；;')
+_SENTENCE_SPLIT = re.compile(r'([。！？!?；;])')
+
+
+def _iter_sentences(text: str) -> Iterator[str]:
+    """句子切分，保留终止符，跳过空句"""
+    parts = _SENTENCE_SPLIT.split(text)
+    for i in range(0, len(parts), 2):
+        sentence = parts[i].strip()
+        if i + 1 < len(parts):
+            sentence += parts[i + 1]
+        if sentence:
+            yield sentence
+
+
 class PDFProcessor:
     def __init__(self, pdf_path: str):
         self.pdf_path = pdf_path
@@ -11,6 +35,8 @@ class PDFProcessor:
     
     def extract_text(self) -> str:
         """提取PDF文档的文本内容"""
+        import PyPDF2  # 仅构建知识库时需要，延迟导入
+        
         text = ""
         try:
             with open(self.pdf_path, 'rb') as file:
@@ -34,22 +60,28 @@ class PDFProcessor:
         """清理文本内容（保留换行，便于按小节/标题切分）"""
         print("🧹 开始清理文本...")
 
-        # 统一换行符
+        # 统一换行符、移除页面标记
         text = text.replace('\r\n', '\n').replace('\r', '\n')
-
-        # 移除页面标记
-        text = re.sub(r'\n?=== 第\d+页 ===\n?', '\n', text)
-
-        # 行内多余空白收缩，但保留换行
-        text = re.sub(r'[ \t]+', ' ', text)
-
-        # 移除两端空白的空行，并收敛连续空行为单个空行
-        # 先逐行strip，再重新拼接
-        lines = [line.strip() for line in text.split('\n')]
-        text = '\n'.join(lines)
-        text = re.sub(r'\n{3,}', '\n\n', text)
-
-        cleaned_text = text.strip('\n ')
+        text = _PAGE_MARKER.sub('\n', text)
+
+        # 一次逐行扫描：strip、行内多余空白收缩（只处理含连续空白/制表符的行），
+        # 连续空行收敛为单个空行，首尾空行去掉
+        lines: List[str] = []
+        previous_blank = True
+        for line in text.split('\n'):
+            line = line.strip()
+            if '  ' in line or '\t' in line:
+                line = _INLINE_SPACES.sub(' ', line)
+            if line:
+                lines.append(line)
+                previous_blank = False
+            elif not previous_blank:
+                lines.append('')
+                previous_blank = True
+        if lines and not lines[-1]:
+            lines.pop()
+
+        cleaned_text = '\n'.join(lines)
         print(f"✅ 文本清理完成，总长度: {len(cleaned_text)} 字符")
         return cleaned_text
 
@@ -64,100 +96,75 @@ class PDFProcessor:
         if len(candidate) == 0:
             return False
 
-        # 短行更可能是标题
-        is_relatively_short = len(candidate) <= 30
-
-        patterns = [
-            r'^\d{1,3}(?:[\.|．]\d{1,3}){0,3}[\s、).)]+',            # 1 / 1.1 / 1.1.1
-            r'^[（\(]?\d{1,3}[）\)]',                                 # （1）
-            r'^[一二三四五六七八九十百千万]+、',                             # 一、 二、 …
-            r'^[（\(][一二三四五六七八九十百千万]+[）\)]',                 # （一）
-            r'^第[一二三四五六七八九十百千万0-9]+[章节部分卷]',               # 第三章 / 第1节
-        ]
-
-        # 以冒号/：结尾的短行也多为标题
-        looks_like_title_suffix = is_relatively_short and candidate.endswith((':', '：'))
+        # 编号标题
+        if _HEADING_PATTERN.match(candidate):
+            return True
 
-        for p in patterns:
-            if re.match(p, candidate):
-                return True
-
-        # 无句末终止符号且较短，且不以句号结束，可能为标题
-        no_sentence_ending = not re.search(r'[。！？.!?；;]$', candidate)
-        return is_relatively_short and (looks_like_title_suffix or no_sentence_ending)
-
-    def _split_into_sections(self, text: str) -> List[Dict]:
-        """按标题/小节拆分文本，返回 [{title, text}]。若未检测到标题，则返回单节。"""
-        lines = [line for line in text.split('\n') if line is not None]
-        sections: List[Dict] = []
+        # 较短且不以句末符号结尾（含以冒号结尾的短行），可能为标题
+        return len(candidate) <= 30 and candidate[-1] not in _SENTENCE_ENDINGS
 
+    def _iter_sections(self, text: str) -> Iterator[Tuple[str, str]]:
+        """逐行扫描一遍，按标题切出 (标题, 正文)；未检测到标题时整体作为一节"""
         current_title = '正文'
         current_lines: List[str] = []
         detected_any_heading = False
 
-        for line in lines:
+        for line in text.split('\n'):
             if self._is_heading(line):
                 # 刷新上一节
                 if current_lines:
-                    sections.append({'title': current_title, 'text': '\n'.join(current_lines).strip()})
+                    yield current_title, '\n'.join(current_lines).strip()
                 current_title = line.strip()
                 current_lines = []
                 detected_any_heading = True
             else:
                 current_lines.append(line)
 
-        # 收尾
-        if current_lines:
-            sections.append({'title': current_title, 'text': '\n'.join(current_lines).strip()})
-
         if not detected_any_heading:
-            return [{'title': '全文', 'text': text.strip()}]
+            yield '全文', text.strip()
+        elif current_lines:
+            yield current_title, '\n'.join(current_lines).strip()
 
-        return sections
+    def _split_into_sections(self, text: str) -> List[Dict]:
+        """按标题/小节拆分文本，返回 [{title, text}]。若未检测到标题，则返回单节。"""
+        return [{'title': title, 'text': body} for title, body in self._iter_sections(text)]
 
     def _chunk_section(self, section_text: str, section_title: str, section_index: int) -> List[Dict]:
-        """在单个小节内按句子+长度进行分块，并保留重叠。"""
-        # 句子切分，保留终止符
-        parts = re.split(r'([。！？!?；;])', section_text)
-        sentences: List[str] = []
-        for i in range(0, len(parts), 2):
-            if i < len(parts):
-                sentence = parts[i].strip()
-                if i + 1 < len(parts):
-                    sentence += parts[i + 1]
-                if sentence:
-                    sentences.append(sentence)
-
-        # 如果未能按句子切出，则回退为按行
-        if not sentences:
-            sentences = [s for s in section_text.split('\n') if s.strip()]
+        """在单个小节内按句子+长度进行分块，并保留重叠。
 
+        当前块以片段列表缓存、只在输出时拼接一次，避免反复拼接与切片字符串。
+        """
         chunks: List[Dict] = []
-        current_chunk = ''
+        buffer: List[str] = []
+        buffer_length = 0
         chunk_id = 0
 
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) > self.chunk_size and current_chunk:
+        for sentence in _iter_sentences(section_text):
+            if buffer_length + len(sentence) > self.chunk_size and buffer_length:
+                current_chunk = ''.join(buffer)
                 chunks.append({
                     'text': current_chunk.strip(),
                     'chunk_id': chunk_id,
-                    'length': len(current_chunk),
+                    'length': buffer_length,
                     'section_title': section_title,
                     'section_index': section_index,
                 })
                 chunk_id += 1
 
-                # 重叠
-                overlap_start = max(0, len(current_chunk) - self.chunk_overlap)
-                current_chunk = current_chunk[overlap_start:] + sentence
+                # 重叠：保留当前块末尾 chunk_overlap 个字符
+                overlap = current_chunk[max(0, buffer_length - self.chunk_overlap):]
+                buffer = [overlap, sentence]
+                buffer_length = len(overlap) + len(sentence)
             else:
-                current_chunk += sentence
+                buffer.append(sentence)
+                buffer_length += len(sentence)
 
+        current_chunk = ''.join(buffer)
         if current_chunk.strip():
             chunks.append({
                 'text': current_chunk.strip(),
                 'chunk_id': chunk_id,
-                'length': len(current_chunk),
+                'length': buffer_length,
                 'section_title': section_title,
                 'section_index': section_index,
             })
@@ -168,14 +175,15 @@ class PDFProcessor:
         """优先按标题/小节切分，再在小节内按长度合并，保留重叠。"""
         print("✂️ 开始分割文本块（结构化优先）...")
 
-        sections = self._split_into_sections(text)
         all_chunks: List[Dict] = []
+        section_count = 0
 
-        for idx, sec in enumerate(sections):
-            section_chunks = self._chunk_section(sec['text'], sec['title'], idx)
-            all_chunks.extend(section_chunks)
+        # 小节边切分边分块，全文只扫描一遍
+        for idx, (title, body) in enumerate(self._iter_sections(text)):
+            all_chunks.extend(self._chunk_section(body, title, idx))
+            section_count += 1
 
-        print(f"✅ 文本分割完成，共生成 {len(all_chunks)} 个文本块（{len(sections)} 个小节）")
+        print(f"✅ 文本分割完成，共生成 {len(all_chunks)} 个文本块（{section_count} 个小节）")
         return all_chunks
     
     def process_document(self) -> List[Dict]:
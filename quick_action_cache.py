@@ -1,6 +1,7 @@
 import json
 import os
 import hashlib
+import threading
 from typing import Dict, Optional
 from datetime import datetime
 
@@ -9,6 +10,7 @@ class QuickActionCache:
     
     def __init__(self, cache_file: str = "quick_action_cache.json"):
         self.cache_file = cache_file
+        self._lock = threading.Lock()  # API服务多线程并发写入时保护缓存
         self.cache = self._load_cache()
     
     def _load_cache(self) -> Dict:
@@ -25,8 +27,9 @@ class QuickActionCache:
     def _save_cache(self):
         """保存缓存到文件"""
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
+            with self._lock:
+                with open(self.cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.cache, f, ensure_ascii=False, indent=2)
         except Exception as e:
             print(f"保存缓存文件失败: {e}")
     
@@ -35,11 +38,16 @@ class QuickActionCache:
         # 使用查询内容的哈希作为缓存键
         return hashlib.md5(query.encode('utf-8')).hexdigest()
     
-    def get_cached_response(self, query: str) -> Optional[str]:
-        """获取缓存的响应"""
+    def get_cached_response(self, query: str, index_version: str = None) -> Optional[str]:
+        """获取缓存的响应
+        
+        index_version: 当前知识库版本；缓存记录的生成时版本与之不同（或未记录版本）时视为失效
+        """
         cache_key = self._generate_cache_key(query)
         if cache_key in self.cache:
             cached_data = self.cache[cache_key]
+            if index_version and cached_data.get('index_version') != index_version:
+                return None
             # 检查缓存是否过期（可选，这里设置30天过期）
             if 'timestamp' in cached_data:
                 cache_time = datetime.fromisoformat(cached_data['timestamp'])
@@ -49,14 +57,17 @@ class QuickActionCache:
                 return cached_data['response']
         return None
     
-    def cache_response(self, query: str, response: str):
-        """缓存响应结果"""
+    def cache_response(self, query: str, response: str, index_version: str = None):
+        """缓存响应结果（记录生成时的知识库版本）"""
         cache_key = self._generate_cache_key(query)
-        self.cache[cache_key] = {
-            'query': query,
-            'response': response,
-            'timestamp': datetime.now().isoformat()
-        }
+        with self._lock:
+            self.cache[cache_key] = {
+                'query': query,
+                'response': response,
+                'timestamp': datetime.now().isoformat()
+            }
+            if index_version:
+                self.cache[cache_key]['index_version'] = index_version
         self._save_cache()
     
     def clear_cache(self):
@@ -8,6 +8,7 @@ import sys
 from pdf_processor import PDFProcessor
 from vector_store import VectorStore
 from config import Config
+from chunk_dedup import deduplicate_chunks, print_report as print_dedup_report
 
 def rebuild_knowledge_base():
     """重新构建知识库"""
@@ -25,6 +26,11 @@ def rebuild_knowledge_base():
     
     print(f"✅ PDF处理完成，获得 {len(chunks)} 个文本块")
     
+    # 合并近似重复的文本块
+    if Config.DEDUP_ENABLED:
+        chunks, report = deduplicate_chunks(chunks)
+        print_dedup_report(report)
+    
     # 2. 构建向量数据库
     print("\n🔍 步骤2: 构建向量数据库")
     vector_store = VectorStore()
@@ -33,9 +39,13 @@ def rebuild_knowledge_base():
         vector_store.add_chunks(chunks)
         print("✅ 向量化完成")
         
-        # 3. 保存向量数据库
+        # 3. 保存为新的版本目录并切换 CURRENT 指针（运行中的服务在下一次请求时切换到新版本）
         print("\n💾 步骤3: 保存向量数据库")
-        vector_store.save()
+        vector_store.publish()
+        
+        # 刷新启动快照（复用已加载的向量模型）
+        from startup_snapshot import build_snapshot
+        build_snapshot(vector_store.model)
         
         # 4. 测试搜索功能
         print("\n🧪 步骤4: 测试搜索功能")
@@ -59,11 +69,11 @@ def rebuild_knowledge_base():
         print("\n📊 知识库统计信息:")
         print(f"  文档块数量: {len(vector_store.chunks)}")
         print(f"  向量数量: {len(vector_store.vectors)}")
-        print(f"  向量维度: {len(vector_store.vectors[0]) if vector_store.vectors else 0}")
+        print(f"  向量维度: {vector_store.vectors.shape[1] if len(vector_store.vectors) else 0}")
         
         # 计算平均块长度
-        if vector_store.chunks:
-            avg_length = sum(len(chunk['text']) for chunk in vector_store.chunks) / len(vector_store.chunks)
+        if len(vector_store.chunks):
+            avg_length = sum(len(text) for text in vector_store.chunks.texts()) / len(vector_store.chunks)
             print(f"  平均块长度: {avg_length:.1f} 字符")
         
         print("\n✅ 知识库重建完成！")
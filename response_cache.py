@@ -0,0 +1,90 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询：全半角统一、小写、合并空白、去掉结尾标点"""
+    text = unicodedata.normalize('NFKC', query).lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip('?？。.!！~～ ')
+
+
+def chunk_key(chunk: Dict) -> str:
+    """文本块的稳定标识：小节序号 + 块序号"""
+    return f"{chunk.get('section_index', '-')}:{chunk.get('chunk_id', '-')}"
+
+
+class ResponseCache:
+    """上下文感知的回答缓存
+
+    缓存键由归一化查询、检索到的文本块id（有序）、对话历史摘要、模型与生成参数、
+    知识库版本共同决定；知识库重建后版本变化，旧条目自然失效。
+    内存LRU实现，带过期时间。
+    """
+
+    def __init__(self, max_entries: int = Config.RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = Config.RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, context: List[Tuple[Dict, float]], history_text: str,
+                 model: str, params: Dict, index_version: str) -> str:
+        """生成缓存键"""
+        payload = json.dumps({
+            'query': normalize_query(query),
+            'chunks': [chunk_key(chunk) for chunk, _ in context],
+            'history': hashlib.md5(history_text.encode('utf-8')).hexdigest(),
+            'model': model,
+            'params': params,
+            'index_version': index_version,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或过期返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['timestamp'] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['response']
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, response: str):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = {'response': response, 'timestamp': time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
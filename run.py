@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 """
 教培管家 - 智能客服Agent启动脚本
+
+用法：
+  python run.py                         # 单进程Streamlit界面
+  python run.py --workers 4             # 4个Streamlit进程（端口8501起），共用一个向量化进程与内存映射索引
+  python run.py --api --workers 4       # 4个API工作进程（同一端口），共用一个向量化进程与内存映射索引
 """
 
+import argparse
 import os
 import sys
 import subprocess
+import time
 from pathlib import Path
 
 def check_dependencies():
@@ -44,8 +51,89 @@ def check_pdf_file():
         print("✅ PDF文件已找到")
         return True
 
-def main():
+def check_index():
+    """多进程部署前确认知识库已构建，避免各工作进程同时构建"""
+    from config import Config
+    import index_versions
+    from vector_store import INDEX_FILE
+    _, index_path = index_versions.current_index_path(Config.VECTOR_DB_PATH)
+    if not os.path.exists(os.path.join(index_path, INDEX_FILE)):
+        print("❌ 未找到知识库索引，请先运行: python rebuild_knowledge_base.py")
+        return False
+    print("✅ 知识库索引已找到")
+    return True
+
+def start_embedding_service(socket_path: str) -> subprocess.Popen:
+    """启动独立的向量化进程并等待其就绪"""
+    from embedding_service import wait_until_ready
+    print(f"🧠 启动向量化进程: {socket_path}")
+    service = subprocess.Popen([sys.executable, "embedding_service.py", "--socket", socket_path])
+    if not wait_until_ready(socket_path, process=service):
+        service.terminate()
+        raise RuntimeError("向量化进程启动失败")
+    return service
+
+def run_workers(args):
+    """多进程部署：一个向量化进程 + N个工作进程，工作进程只映射索引、经Unix socket获取查询向量"""
+    env = dict(os.environ)
+    processes = []
+    if args.workers > 1 and not args.no_embedding_service:
+        processes.append(start_embedding_service(args.socket))
+        env["EMBEDDING_SERVICE_SOCKET"] = args.socket
+    
+    if args.api:
+        port = args.port or 8000
+        if args.workers > 1:
+            # 同一会话的请求会被分发到不同工作进程，对话历史需要共享存储
+            env.setdefault("SESSION_STORE", "sqlite")
+        processes.append(subprocess.Popen([
+            sys.executable, "api_server.py", "--host", args.host, "--port", str(port),
+            "--workers", str(args.workers)
+        ], env=env))
+        print(f"🚀 API服务: http://{args.host}:{port}（{args.workers} 个工作进程）")
+    else:
+        base_port = args.port or 8501
+        for i in range(args.workers):
+            processes.append(subprocess.Popen([
+                sys.executable, "-m", "streamlit", "run", "app.py",
+                "--server.port", str(base_port + i),
+                "--server.address", args.host,
+                "--server.headless", "true"
+            ], env=env))
+            print(f"🚀 Web界面 {i + 1}: http://{args.host}:{base_port + i}")
+    print("按 Ctrl+C 停止服务")
+    
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+        print("⚠️ 有进程已退出，停止其余进程")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # 先停工作进程，最后停向量化进程
+        for process in reversed(processes):
+            if process.poll() is None:
+                process.terminate()
+        for process in reversed(processes):
+            try:
+                process.wait(timeout=35)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        print("\n👋 服务已停止")
+
+def main(argv=None):
     """主函数"""
+    from config import Config
+    parser = argparse.ArgumentParser(description="教培管家启动脚本")
+    parser.add_argument('--workers', type=int, default=1, help='工作进程数（大于1时启用共享向量化进程）')
+    parser.add_argument('--api', action='store_true', help='启动HTTP API服务而非Streamlit界面')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=0, help='端口（Streamlit为起始端口，默认8501；API默认8000）')
+    parser.add_argument('--socket', default=Config.EMBEDDING_SERVICE_DEFAULT_SOCKET, help='向量化进程的Unix socket路径')
+    parser.add_argument('--no-embedding-service', action='store_true',
+                        help='不启动向量化进程，每个工作进程各自加载模型（用于对比）')
+    args = parser.parse_args(argv)
+    
     print("🎓 教培管家 - 智能客服Agent")
     print("=" * 50)
     
@@ -59,6 +147,11 @@ def main():
     if not check_pdf_file():
         return
     
+    if args.workers > 1 or args.api:
+        if check_index():
+            run_workers(args)
+        return
+    
     print("\n🚀 启动Web界面...")
     print("请在浏览器中访问显示的地址")
     print("按 Ctrl+C 停止服务")
@@ -68,8 +161,8 @@ def main():
     try:
         subprocess.run([
             sys.executable, "-m", "streamlit", "run", "app.py",
-            "--server.port", "8501",
-            "--server.address", "localhost"
+            "--server.port", str(args.port or 8501),
+            "--server.address", args.host
         ])
     except KeyboardInterrupt:
         print("\n👋 服务已停止")
@@ -0,0 +1,198 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+from config import Config
+
+
+class SessionStore:
+    """会话存储：session_id -> 对话历史
+
+    load 返回历史列表的副本，调用方追加消息后调用 save 写回。
+    shares_messages 为True时消息dict与存储共享（进程内实现），后台压缩写入的摘要无需再次保存；
+    否则 save 时序列化，摘要须在保存前生成。最近一次保存超过 ttl_seconds 的会话视为过期，
+    会话数超过 max_sessions 时淘汰最久未活跃的会话。
+    同一会话的并发请求需由调用方串行（如API服务的会话锁），否则后保存者覆盖先保存者。
+    """
+
+    shares_messages = False
+
+    def __init__(self, ttl_seconds: float = Config.SESSION_TTL_SECONDS,
+                 max_sessions: int = Config.SESSION_MAX_SESSIONS,
+                 purge_interval: float = Config.SESSION_PURGE_INTERVAL):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.purge_interval = purge_interval
+        self._purged_at = time.time()
+
+    def _expired(self, updated_at: float, now: float = None) -> bool:
+        return bool(self.ttl_seconds) and (now or time.time()) - updated_at >= self.ttl_seconds
+
+    def _maybe_purge(self):
+        """每隔 purge_interval 清理一次过期会话，不在每次保存时扫描"""
+        now = time.time()
+        if now - self._purged_at >= self.purge_interval:
+            self._purged_at = now
+            self.purge_expired()
+
+    def load(self, session_id: str) -> List[Dict]:
+        """读取会话历史，不存在或已过期时返回空列表"""
+        raise NotImplementedError
+
+    def save(self, session_id: str, history: List[Dict]):
+        """保存会话历史并刷新活跃时间"""
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        """删除会话，返回会话是否存在"""
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """删除过期会话，返回删除数量"""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict:
+        return {
+            'backend': self.backend,
+            'sessions': len(self),
+            'max_sessions': self.max_sessions,
+            'ttl_seconds': self.ttl_seconds,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """进程内LRU实现（按最近保存时间排序），进程重启后会话丢失"""
+
+    backend = 'memory'
+    shares_messages = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions: OrderedDict = OrderedDict()  # session_id -> (保存时间, 历史)
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            if self._expired(entry[0]):
+                del self._sessions[session_id]
+                return []
+            return list(entry[1])
+
+    def save(self, session_id: str, history: List[Dict]):
+        with self._lock:
+            self._sessions[session_id] = (time.time(), list(history))
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._maybe_purge()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def purge_expired(self) -> int:
+        removed = 0
+        now = time.time()
+        with self._lock:
+            # 按保存时间升序排列，遇到第一个未过期的会话即可停止
+            while self._sessions:
+                session_id, (updated_at, _) = next(iter(self._sessions.items()))
+                if not self._expired(updated_at, now):
+                    break
+                del self._sessions[session_id]
+                removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite实现：同一台机器上的多个工作进程共享会话，重启后保留
+
+    历史以JSON保存；启用WAL，读写互不阻塞。多台机器部署时把 SESSION_DB_PATH 换成
+    共享存储并不可靠，应改用集中式存储实现同一接口。
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path: str = Config.SESSION_DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'session_id TEXT PRIMARY KEY, history TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions(updated_at)')
+
+    def load(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT history, updated_at FROM sessions WHERE session_id = ?',
+                                     (session_id,)).fetchone()
+        if row is None or self._expired(row[1]):
+            return []
+        return json.loads(row[0])
+
+    def save(self, session_id: str, history: List[Dict]):
+        # 后台压缩线程可能正在为消息写入摘要，先逐条复制再序列化
+        data = json.dumps([dict(message) for message in history], ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO sessions (session_id, history, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET history = excluded.history, updated_at = excluded.updated_at',
+                (session_id, data, time.time())
+            )
+        self._maybe_purge()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,)).rowcount > 0
+
+    def purge_expired(self) -> int:
+        """删除过期会话，并按活跃时间只保留最近的 max_sessions 个"""
+        with self._lock:
+            removed = 0
+            if self.ttl_seconds:
+                removed += self._conn.execute('DELETE FROM sessions WHERE updated_at <= ?',
+                                              (time.time() - self.ttl_seconds,)).rowcount
+            removed += self._conn.execute(
+                'DELETE FROM sessions WHERE session_id IN '
+                '(SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_sessions,)
+            ).rowcount
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store(backend: str = None) -> SessionStore:
+    """按 Config.SESSION_STORE 创建会话存储"""
+    backend = (backend or Config.SESSION_STORE).lower()
+    if backend == 'sqlite':
+        return SQLiteSessionStore()
+    if backend != 'memory':
+        raise ValueError(f"未知的会话存储: {backend}（可选 memory、sqlite）")
+    return MemorySessionStore()
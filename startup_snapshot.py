@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+启动快照：预先计算的派生数据
+
+把启动时需要重复计算的派生数据（如相关性判断用的领域向量）写入知识库目录下的单个
+快照文件。文件结构为 魔数 + 头长度 + JSON头 + 按64字节对齐的原始数组，启动时用 np.memmap
+直接映射，无需重新计算或反序列化。
+
+每个分区都带有来源指纹（模型文件、源数据内容的摘要），来源变化时该分区自动失效，
+调用方重新计算后写回快照。
+
+用法：
+  python startup_snapshot.py          # 构建/刷新快照
+  python startup_snapshot.py --show   # 查看快照内容与各分区是否有效
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from config import Config
+
+MAGIC = b'CSSNAP01'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# 模型目录中参与指纹计算的配置文件（权重文件只取大小，避免读取数百MB内容）
+_MODEL_CONFIG_FILES = ('config.json', 'modules.json', 'sentence_bert_config.json',
+                       'tokenizer_config.json', 'vocab.txt', '1_Pooling/config.json')
+_MODEL_WEIGHT_FILES = ('model.safetensors', 'pytorch_model.bin')
+
+
+def text_fingerprint(parts: Iterable[str]) -> str:
+    """多段文本的摘要"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def model_fingerprint(model_path: str = Config.EMBEDDING_MODEL_PATH,
+                      model_name: str = Config.EMBEDDING_MODEL_NAME) -> str:
+    """向量模型指纹：本地模型取配置文件内容与权重大小，否则取在线模型名"""
+    if not os.path.isdir(model_path):
+        return text_fingerprint(['hub', model_name])
+    digest = hashlib.sha1()
+    for name in _MODEL_CONFIG_FILES:
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(name.encode('utf-8') + b'\x00' + f.read())
+    for name in _MODEL_WEIGHT_FILES:
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            digest.update(f"{name}:{os.path.getsize(path)}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class StartupSnapshot:
+    """快照文件的读写；数组分区以只读内存映射的形式返回"""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(Config.VECTOR_DB_PATH, Config.STARTUP_SNAPSHOT_FILE)
+        self.header: Dict = {}
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _read_header(self) -> Optional[Dict]:
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (header_len,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        if header.get('format') != FORMAT_VERSION:
+            return None
+        header['data_offset'] = _align(len(MAGIC) + 8 + header_len)
+        return header
+
+    def load(self) -> bool:
+        """读取快照头并映射各数组分区；文件不存在或格式不符时返回False"""
+        with self._lock:
+            self._loaded = True
+            self.header, self._arrays = {}, {}
+            if not os.path.exists(self.path):
+                return False
+            try:
+                header = self._read_header()
+                if header is None:
+                    print(f"⚠️ 启动快照格式不兼容，已忽略: {self.path}")
+                    return False
+                for name, section in header['sections'].items():
+                    if section['type'] == 'array':
+                        self._arrays[name] = np.memmap(
+                            self.path, dtype=section['dtype'], mode='r',
+                            offset=header['data_offset'] + section['offset'],
+                            shape=tuple(section['shape'])
+                        )
+                self.header = header
+                return True
+            except Exception as e:
+                print(f"⚠️ 读取启动快照失败: {e}")
+                return False
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def get(self, name: str, fingerprint: str):
+        """取出分区；不存在或来源指纹不一致（已失效）时返回None"""
+        self._ensure_loaded()
+        section = self.header.get('sections', {}).get(name)
+        if section is None or section['fingerprint'] != fingerprint:
+            return None
+        if section['type'] == 'array':
+            return self._arrays.get(name)
+        return section['value']
+
+    def put(self, name: str, fingerprint: str, value):
+        """写入/替换一个分区并原子地重写快照文件（数组或可JSON序列化的值）"""
+        self._ensure_loaded()
+        with self._lock:
+            sections = {}
+            for existing, section in self.header.get('sections', {}).items():
+                if existing == name:
+                    continue
+                data = np.array(self._arrays[existing]) if section['type'] == 'array' else section['value']
+                sections[existing] = (section['fingerprint'], data)
+            sections[name] = (fingerprint, value)
+            self._write(sections)
+        self.load()
+
+    def _write(self, sections: Dict):
+        header_sections = {}
+        arrays = []
+        for name, (fingerprint, value) in sorted(sections.items()):
+            if isinstance(value, np.ndarray):
+                array = np.ascontiguousarray(value)
+                header_sections[name] = {'type': 'array', 'fingerprint': fingerprint,
+                                         'dtype': array.dtype.str, 'shape': list(array.shape)}
+                arrays.append((name, array))
+            else:
+                header_sections[name] = {'type': 'json', 'fingerprint': fingerprint, 'value': value}
+
+        # 数组偏移相对于数据区起点（头部之后的第一个对齐位置）
+        offset = 0
+        for name, array in arrays:
+            header_sections[name]['offset'] = offset
+            offset = _align(offset + array.nbytes)
+        header = {'format': FORMAT_VERSION, 'created_at': time.time(), 'sections': header_sections}
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        data_offset = _align(len(MAGIC) + 8 + len(header_bytes))
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', len(header_bytes)) + header_bytes)
+            for name, array in arrays:
+                f.write(b'\x00' * (data_offset + header_sections[name]['offset'] - f.tell()))
+                f.write(array.tobytes())
+        os.replace(tmp_path, self.path)
+
+    def describe(self) -> Dict:
+        self._ensure_loaded()
+        return {
+            'path': self.path,
+            'exists': bool(self.header),
+            'size_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'created_at': self.header.get('created_at'),
+            'sections': {
+                name: {k: v for k, v in section.items() if k not in ('value', 'offset')}
+                for name, section in self.header.get('sections', {}).items()
+            },
+        }
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+_snapshot: Optional[StartupSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[StartupSnapshot]:
+    """进程级快照实例；STARTUP_SNAPSHOT_ENABLED关闭时返回None"""
+    global _snapshot
+    if not Config.STARTUP_SNAPSHOT_ENABLED:
+        return None
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = StartupSnapshot()
+    return _snapshot
+
+
+def build_snapshot(embedding_model=None) -> StartupSnapshot:
+    """计算所有派生数据并写入快照（已有效的分区不重复计算）"""
+    from llm_client import DOMAIN_QUERIES, domain_embeddings_fingerprint
+
+    snapshot = get_snapshot() or StartupSnapshot()
+    fingerprint = domain_embeddings_fingerprint()
+    if snapshot.get('domain_embeddings', fingerprint) is None:
+        if embedding_model is None:
+            from sentence_transformers import SentenceTransformer
+            embedding_model = SentenceTransformer(
+                Config.EMBEDDING_MODEL_PATH if os.path.isdir(Config.EMBEDDING_MODEL_PATH)
+                else Config.EMBEDDING_MODEL_NAME
+            )
+        started = time.perf_counter()
+        embeddings = np.asarray(embedding_model.encode(DOMAIN_QUERIES), dtype=np.float32)
+        snapshot.put('domain_embeddings', fingerprint, embeddings)
+        print(f"✅ 领域向量已写入快照（{len(DOMAIN_QUERIES)} 条，用时 {time.perf_counter() - started:.2f}s）")
+    else:
+        print("✅ 领域向量快照有效，无需重新计算")
+    return snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="构建启动快照")
+    parser.add_argument('--show', action='store_true', help='只显示快照信息，不构建')
+    args = parser.parse_args(argv)
+
+    if not args.show:
+        build_snapshot()
+
+    from llm_client import domain_embeddings_fingerprint
+    snapshot = get_snapshot() or StartupSnapshot()
+    info = snapshot.describe()
+    current = {'domain_embeddings': domain_embeddings_fingerprint()}
+    print(f"\n📦 启动快照: {info['path']}（{info['size_bytes']} 字节）")
+    for name, section in info['sections'].items():
+        valid = current.get(name) == section['fingerprint']
+        shape = f" shape={section['shape']}" if section['type'] == 'array' else ''
+        print(f"  {name}: {section['type']}{shape} {'✅ 有效' if valid else '⚠️ 已失效'}")
+
+
+if __name__ == "__main__":
+    main()
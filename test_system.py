@@ -82,6 +82,104 @@ def test_llm_client():
         print(f"❌ LLM客户端模块测试失败: {e}")
         return False
 
+def test_context_merge():
+    """测试相邻文本块合并（去重叠后应还原小节原文，重复性文本也不能丢内容）"""
+    print("🔍 测试上下文合并...")
+    try:
+        from pdf_processor import PDFProcessor, _iter_sentences
+        from context_builder import ContextAssembler
+        
+        # 表格式的重复条款，容易出现比真实重叠更长的巧合匹配
+        rows = [f"第{i % 3}类门店的租金不超过营收的百分之十五，续费率不低于百分之六十。" for i in range(60)]
+        section = "\n".join(rows[:20]) + "\n" + "学员投诉需在24小时内响应并记录处理结果。" * 8 + "\n".join(rows[20:])
+        
+        chunks = PDFProcessor("")._chunk_section(section, "测试小节", 0)
+        assembler = ContextAssembler()
+        merged = chunks[0]['text']
+        for chunk in chunks[1:]:
+            merged = assembler._merge_text(merged, chunk['text'])
+        
+        expected = ''.join(_iter_sentences(section))
+        if len(chunks) > 1 and merged == expected:
+            print(f"✅ 上下文合并测试成功，{len(chunks)} 个文本块还原为 {len(merged)} 字")
+            return True
+        else:
+            print(f"❌ 上下文合并结果与原文不一致（{len(merged)} / {len(expected)} 字）")
+            return False
+    except Exception as e:
+        print(f"❌ 上下文合并测试失败: {e}")
+        return False
+
+def test_llm_resilience():
+    """测试大模型调用重试：网络/超时异常重试，4xx与其他异常不重试，半开状态下归还探测名额"""
+    print("🔍 测试大模型调用重试与熔断...")
+    try:
+        from llm_client import LLMClient
+        from llm_resilience import ResilientCaller
+        from mock_dashscope import MockGeneration
+        
+        class ScriptedGeneration(MockGeneration):
+            """按顺序先返回预设的失败（异常或状态码），之后正常回答"""
+            def __init__(self, failures):
+                super().__init__()
+                self.failures = list(failures)
+                self.attempts = 0
+            
+            def call(self, **kwargs):
+                self.attempts += 1
+                if self.failures:
+                    failure = self.failures.pop(0)
+                    if isinstance(failure, int):
+                        return self._response(failure, code='InvalidParameter', message='Invalid parameter.')
+                    raise failure
+                return super().call(**kwargs)
+        
+        def make_client(failures):
+            client = LLMClient(generation=ScriptedGeneration(failures))
+            client.resilience = ResilientCaller(rate_per_minute=0, base_delay=0.01)
+            client.hedger.resilience = client.resilience
+            return client
+        
+        def call(client):
+            return client._call('relevance', prompt='线下店选址', max_tokens=10)
+        
+        # 网络连接失败与超时：重试后成功
+        client = make_client([ConnectionError('connection reset'), TimeoutError('read timed out')])
+        response = call(client)
+        network_ok = response.status_code == 200 and client.generation.attempts == 3
+        
+        # 4xx（请求参数错误）：不重试，也不计入熔断
+        client = make_client([400])
+        response = call(client)
+        bad_request_ok = (response.status_code == 400 and client.generation.attempts == 1
+                          and client.resilience.breaker.failures == 0)
+        
+        # 半开状态下的探测请求抛出不可重试的异常：归还探测名额，下一个请求仍可探测并恢复
+        client = make_client([ValueError('bad argument')])
+        breaker = client.resilience.breaker
+        breaker.recovery_seconds = 0
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        try:
+            call(client)
+            probe_raised = False
+        except ValueError:
+            probe_raised = True
+        released = breaker.state == 'half_open' and not breaker._probing
+        recovered = call(client).status_code == 200 and breaker.state == 'closed'
+        half_open_ok = probe_raised and released and recovered
+        
+        if network_ok and bad_request_ok and half_open_ok:
+            print("✅ 大模型调用重试与熔断测试成功")
+            return True
+        else:
+            print(f"❌ 大模型调用重试与熔断测试失败（网络异常: {network_ok}, 4xx: {bad_request_ok}, "
+                  f"半开探测: {half_open_ok}）")
+            return False
+    except Exception as e:
+        print(f"❌ 大模型调用重试与熔断测试失败: {e}")
+        return False
+
 def test_agent():
     """测试智能Agent模块"""
     print("🔍 测试智能Agent模块...")
@@ -131,6 +229,8 @@ def main():
         test_pdf_processor,
         test_vector_store,
         test_llm_client,
+        test_llm_resilience,
+        test_context_merge,
         test_agent
     ]
     
@@ -0,0 +1,112 @@
+import os
+import unicodedata
+from typing import List, Optional, Set
+
+from config import Config
+
+
+def _is_cjk(cp: int) -> bool:
+    """是否为中日韩统一表意文字（BERT按单字切分）"""
+    return (
+        0x4E00 <= cp <= 0x9FFF or 0x3400 <= cp <= 0x4DBF or 0x20000 <= cp <= 0x2A6DF
+        or 0x2A700 <= cp <= 0x2B73F or 0x2B740 <= cp <= 0x2B81F or 0x2B820 <= cp <= 0x2CEAF
+        or 0xF900 <= cp <= 0xFAFF or 0x2F800 <= cp <= 0x2FA1F
+    )
+
+
+def _is_punctuation(ch: str) -> bool:
+    cp = ord(ch)
+    if 33 <= cp <= 47 or 58 <= cp <= 64 or 91 <= cp <= 96 or 123 <= cp <= 126:
+        return True
+    return unicodedata.category(ch).startswith('P')
+
+
+class TokenCounter:
+    """基于本地模型 vocab.txt 的轻量分词计数器
+
+    复现 BertTokenizer 的基本切分（中文单字、标点、空白）与 WordPiece 最长匹配，
+    仅用于估算token数量，不依赖transformers。
+    """
+
+    def __init__(self, vocab_path: str = Config.TOKENIZER_VOCAB_PATH, max_chars_per_word: int = 100):
+        self.vocab: Set[str] = set()
+        self.max_chars_per_word = max_chars_per_word
+        if os.path.exists(vocab_path):
+            with open(vocab_path, 'r', encoding='utf-8') as f:
+                self.vocab = {line.rstrip('\n') for line in f if line.strip()}
+        else:
+            print(f"⚠️ 未找到词表 {vocab_path}，token数按字符估算")
+
+    def _basic_tokenize(self, text: str) -> List[str]:
+        """基本切分：小写化，中文与标点单独成词，按空白分割"""
+        words: List[str] = []
+        current: List[str] = []
+        for ch in text.lower():
+            cp = ord(ch)
+            if ch.isspace() or cp == 0 or cp == 0xFFFD or unicodedata.category(ch) in ('Cc', 'Cf'):
+                if current:
+                    words.append(''.join(current))
+                    current = []
+            elif _is_cjk(cp) or _is_punctuation(ch):
+                if current:
+                    words.append(''.join(current))
+                    current = []
+                words.append(ch)
+            else:
+                current.append(ch)
+        if current:
+            words.append(''.join(current))
+        return words
+
+    def _wordpiece_count(self, word: str) -> int:
+        """WordPiece贪心最长匹配，返回子词数量"""
+        if len(word) > self.max_chars_per_word:
+            return 1  # [UNK]
+        count = 0
+        start = 0
+        while start < len(word):
+            end = len(word)
+            while start < end:
+                piece = word[start:end] if start == 0 else '##' + word[start:end]
+                if piece in self.vocab:
+                    break
+                end -= 1
+            if start == end:
+                return 1  # 无法切分整体记为[UNK]
+            count += 1
+            start = end
+        return count
+
+    def count(self, text: str) -> int:
+        """估算文本的token数量（不含[CLS]/[SEP]）"""
+        if not text:
+            return 0
+        if not self.vocab:
+            return len(text)
+        return sum(1 if len(w) == 1 else self._wordpiece_count(w) for w in self._basic_tokenize(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """按token上限截断文本（二分查找字符位置）"""
+        if max_tokens <= 0:
+            return ''
+        if self.count(text) <= max_tokens:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+
+_default_counter: Optional[TokenCounter] = None
+
+
+def get_token_counter() -> TokenCounter:
+    """进程内共享的默认计数器（词表只加载一次）"""
+    global _default_counter
+    if _default_counter is None:
+        _default_counter = TokenCounter()
+    return _default_counter
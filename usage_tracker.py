@@ -0,0 +1,238 @@
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from config import Config
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:   # Windows等平台：不加文件锁（仅支持单进程写入）
+    fcntl = None
+
+# 当前调用的归属信息（会话、快捷功能），由调用方通过 usage_scope 设置
+_scope: contextvars.ContextVar = contextvars.ContextVar('usage_scope', default={})
+
+
+@contextmanager
+def usage_scope(**fields):
+    """在该范围内发生的大模型调用记入指定的会话/快捷功能
+
+    with usage_scope(session_id=sid, quick_action='选址评估指南'):
+        agent.query(...)
+    """
+    token = _scope.set({**_scope.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def response_usage(response) -> Dict[str, int]:
+    """从DashScope响应中取出token用量（兼容属性与字典两种访问方式）"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return {'input_tokens': 0, 'output_tokens': 0}
+
+    def read(name: str) -> int:
+        value = getattr(usage, name, None)
+        if value is None and hasattr(usage, 'get'):
+            value = usage.get(name)
+        return int(value or 0)
+
+    return {'input_tokens': read('input_tokens'), 'output_tokens': read('output_tokens')}
+
+
+def _empty_totals() -> Dict:
+    return {'calls': 0, 'errors': 0, 'input_tokens': 0, 'output_tokens': 0,
+            'latency_seconds': 0.0, 'cost': 0.0}
+
+
+def _accumulate(totals: Dict, record: Dict):
+    totals['calls'] += 1
+    totals['errors'] += 0 if record['status'] == 200 else 1
+    totals['input_tokens'] += record['input_tokens']
+    totals['output_tokens'] += record['output_tokens']
+    totals['latency_seconds'] += record['latency_seconds']
+    totals['cost'] += record['cost']
+
+
+def _merge(target: Dict, delta: Dict):
+    """把增量累加到目标中（嵌套字典逐层合并，数值相加）"""
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            _merge(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _empty_delta() -> Dict:
+    return {'stages': {}, 'quick_actions': {}, 'prompt_components': {}, 'daily': {}}
+
+
+def _add_record(totals: Dict, record: Dict, day: str):
+    """把一次调用记入按阶段、快捷功能、提示词组成与按天的累计值"""
+    _accumulate(totals['stages'].setdefault(record['stage'], _empty_totals()), record)
+    if record['quick_action']:
+        _accumulate(totals['quick_actions'].setdefault(record['quick_action'], _empty_totals()), record)
+    for component, tokens in record['prompt_components'].items():
+        totals['prompt_components'][component] = totals['prompt_components'].get(component, 0) + tokens
+    _accumulate(totals['daily'].setdefault(day, {}).setdefault(record['stage'], _empty_totals()), record)
+
+
+class UsageTracker:
+    """大模型调用的token用量与费用统计
+
+    每次调用记录输入/输出token、耗时与状态，按调用阶段、会话、快捷功能聚合；
+    阶段、快捷功能与按天的累计值定期持久化到JSON文件，会话维度只保存在内存中。
+    多进程部署时各进程共用同一文件：落盘时在文件锁内读取当前内容，只累加本进程上次落盘后的增量。
+    """
+
+    def __init__(self, stats_file: str = Config.USAGE_STATS_FILE,
+                 flush_interval: float = Config.USAGE_FLUSH_SECONDS,
+                 retention_days: int = Config.USAGE_RETENTION_DAYS,
+                 max_sessions: int = 1000):
+        self.stats_file = stats_file
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self._dirty = False
+
+        self.recent = deque(maxlen=200)           # 最近的单次调用明细
+        self.sessions: OrderedDict = OrderedDict()
+        self._delta = _empty_delta()              # 上次落盘后本进程新增的累计值
+        self._apply(self._load())
+
+    def _apply(self, data: Dict):
+        """以文件内容（各进程的合计）加上未落盘的增量作为当前累计值"""
+        self._totals = {key: data.get(key, {}) for key in _empty_delta()}
+        _merge(self._totals, self._delta)
+        self.stages: Dict[str, Dict] = self._totals['stages']
+        self.quick_actions: Dict[str, Dict] = self._totals['quick_actions']
+        self.prompt_components: Dict[str, int] = self._totals['prompt_components']
+        self.daily: Dict[str, Dict] = self._totals['daily']
+
+    def _load(self) -> Dict:
+        if os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"加载用量统计失败: {e}")
+        return {}
+
+    @staticmethod
+    def estimate_cost(input_tokens: int, output_tokens: int) -> float:
+        """按配置的单价（元/千token）估算费用"""
+        return (input_tokens * Config.LLM_PRICE_INPUT_PER_1K
+                + output_tokens * Config.LLM_PRICE_OUTPUT_PER_1K) / 1000
+
+    def record(self, stage: str, response=None, latency_seconds: float = 0.0,
+               status: Optional[int] = None, prompt_components: Optional[Dict[str, int]] = None) -> Dict:
+        """记录一次调用；response为DashScope响应（异常时为None）"""
+        scope = _scope.get()
+        usage = response_usage(response)
+        if status is None:
+            status = getattr(response, 'status_code', 0) if response is not None else 0
+        record = {
+            'timestamp': time.time(),
+            'stage': stage,
+            'session_id': scope.get('session_id', 'default'),
+            'quick_action': scope.get('quick_action'),
+            'status': status,
+            'input_tokens': usage['input_tokens'],
+            'output_tokens': usage['output_tokens'],
+            'latency_seconds': latency_seconds,
+            'cost': self.estimate_cost(usage['input_tokens'], usage['output_tokens']),
+            'prompt_components': prompt_components or {},
+        }
+
+        day = datetime.now().strftime('%Y-%m-%d')
+        with self._lock:
+            self.recent.append(record)
+            _add_record(self._totals, record, day)
+            _add_record(self._delta, record, day)
+
+            session = self.sessions.setdefault(record['session_id'], _empty_totals())
+            _accumulate(session, record)
+            self.sessions.move_to_end(record['session_id'])
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            self._dirty = True
+
+        metrics.inc('llm_calls_total', stage=stage, status=status)
+        metrics.inc('llm_tokens_total', record['input_tokens'], stage=stage, direction='input')
+        metrics.inc('llm_tokens_total', record['output_tokens'], stage=stage, direction='output')
+        metrics.inc('llm_cost_yuan_total', record['cost'], stage=stage)
+        for component, tokens in record['prompt_components'].items():
+            metrics.inc('prompt_tokens_total', tokens, component=component)
+
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return record
+
+    def flush(self):
+        """持久化累计值：文件锁内读取文件、累加本进程的增量后写回（按天的数据只保留最近 retention_days 天）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+            try:
+                with self._file_lock():
+                    data = self._load()
+                    merged = {key: data.get(key, {}) for key in _empty_delta()}
+                    _merge(merged, self._delta)
+                    merged['daily'] = {day: value for day, value in merged['daily'].items() if day >= cutoff}
+                    merged['updated_at'] = datetime.now().isoformat()
+                    tmp_file = f"{self.stats_file}.{os.getpid()}.tmp"
+                    with open(tmp_file, 'w', encoding='utf-8') as f:
+                        json.dump(merged, f, ensure_ascii=False, indent=2)
+                    os.replace(tmp_file, self.stats_file)
+                self._delta = _empty_delta()
+                self._apply(merged)   # 同时取回其他进程已落盘的累计值
+                self._dirty = False
+            except Exception as e:
+                print(f"保存用量统计失败: {e}")
+            self._last_flush = time.time()
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程的文件锁（不支持fcntl的平台上不加锁）"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.stats_file + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_session_stats(self, session_id: str) -> Dict:
+        with self._lock:
+            return dict(self.sessions.get(session_id, _empty_totals()))
+
+    def get_stats(self) -> Dict:
+        """汇总统计"""
+        with self._lock:
+            return {
+                'stages': {k: dict(v) for k, v in self.stages.items()},
+                'quick_actions': {k: dict(v) for k, v in self.quick_actions.items()},
+                'prompt_components': dict(self.prompt_components),
+                'sessions': len(self.sessions),
+                'recent': list(self.recent)[-20:],
+            }
+
+
+# 进程级默认统计器
+usage_tracker = UsageTracker()
+atexit.register(usage_tracker.flush)
@@ -1,84 +1,412 @@
 import os
+import json
 import pickle
+import hashlib
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Tuple
 from config import Config
+from chunk_store import ChunkStore
+from embedding_batcher import EmbeddingBatcher
+import index_versions
+from metrics import metrics
+
+# 索引文件
+INDEX_FORMAT = 2
+INDEX_FILE = 'index.json'
+VECTORS_FILE = 'vectors.npy'
+CENTROIDS_FILE = 'section_centroids.npz'   # 各小节的中心向量（分层检索用）
+PROJECTION_FILE = 'projection.npz'         # PCA降维的均值与投影矩阵（index.json中记录）
+LEGACY_DB_FILE = 'vector_db.pkl'   # 旧版：向量与文本块整体pickle
 
 class VectorStore:
-    def __init__(self, model_name: str = "./models/shibing624_text2vec-base-chinese"):
-        # 优先使用本地模型，如果不存在则使用在线模型
-        if os.path.exists(model_name):
-            self.model = SentenceTransformer(model_name)
-            print(f"✅ 使用本地模型: {model_name}")
-        else:
-            print("⚠️ 本地模型不存在，尝试使用在线模型...")
-            self.model = SentenceTransformer("shibing624/text2vec-base-chinese")
+    def __init__(self, model_name: str = Config.EMBEDDING_MODEL_PATH,
+                 load_model: bool = True, db_path: str = None):
+        # load_model=False 时不加载向量模型，只能按向量检索（用于基准测试等离线场景）
+        self.model = None
+        if load_model and Config.EMBEDDING_SERVICE_SOCKET:
+            # 多进程部署：查询向量由独立的向量化进程计算，本进程不加载模型与torch
+            from embedding_service import RemoteEmbeddingModel
+            self.model = RemoteEmbeddingModel(Config.EMBEDDING_SERVICE_SOCKET)
+            print(f"✅ 使用向量化服务: {Config.EMBEDDING_SERVICE_SOCKET}")
+        elif load_model:
+            # 延迟导入：sentence_transformers会连带加载torch，耗时数秒
+            from sentence_transformers import SentenceTransformer
+            # 优先使用本地模型，如果不存在则使用在线模型
+            if os.path.exists(model_name):
+                self.model = SentenceTransformer(model_name)
+                print(f"✅ 使用本地模型: {model_name}")
+            else:
+                print("⚠️ 本地模型不存在，尝试使用在线模型...")
+                self.model = SentenceTransformer(Config.EMBEDDING_MODEL_NAME)
+        
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.chunks = ChunkStore.from_chunks([])  # 列式存储，按下标访问时才解码文本
+        self._matrix = None     # 归一化后的float32向量矩阵（按需构建，向量变化时重置）
+        self._centroids = None  # (小节编号, 单位化的小节中心向量)，按需构建或随索引加载
+        # PCA降维：{'mean', 'components', 'explained_variance'}；启用后vectors为降维后的向量
+        self.projection = None
+        self.index_version = ""  # 知识库版本（内容摘要），用于失效相关缓存
+        # 索引根目录；已发布版本时读取 CURRENT 指向的版本目录，否则为根目录本身（旧的平铺布局）
+        self.root_path = db_path or Config.VECTOR_DB_PATH
+        self.version_name, self.db_path = index_versions.current_index_path(self.root_path)
         
-        self.vectors = []
-        self.chunks = []
-        self.db_path = Config.VECTOR_DB_PATH
+        # 并发查询的向量编码合并为批次，提高CPU吞吐（使用向量化服务时由服务端合并）
+        self.batcher = None
+        if self.model is not None and Config.EMBED_BATCHING_ENABLED and not Config.EMBEDDING_SERVICE_SOCKET:
+            self.batcher = EmbeddingBatcher(self.model)
         
         # 创建向量数据库目录
         os.makedirs(self.db_path, exist_ok=True)
     
-    def add_chunks(self, chunks: List[Dict]):
-        """添加文档块到向量数据库"""
+    def add_chunks(self, chunks: List[Dict], bulk: bool = None):
+        """添加文档块到向量数据库
+        
+        bulk: 是否使用批量向量化（按长度分桶、多进程），默认取Config.BULK_EMBED_ENABLED
+        """
         print("正在生成文本向量...")
         
         texts = [chunk['text'] for chunk in chunks]
-        vectors = self.model.encode(texts, show_progress_bar=True)
+        if Config.BULK_EMBED_ENABLED if bulk is None else bulk:
+            from bulk_embedding import BulkEmbedder
+            vectors = BulkEmbedder(model=self.model).encode(texts)
+        else:
+            vectors = self.model.encode(texts, show_progress_bar=True)
         
-        self.vectors = vectors.tolist()
-        self.chunks = chunks
+        self.set_vectors(chunks, vectors)
+        if Config.PCA_DIM:
+            self.fit_projection(Config.PCA_DIM)
         
         print(f"向量化完成，共 {len(self.vectors)} 个向量")
     
-    def search(self, query: str, top_k: int = 5) -> List[Tuple[Dict, float]]:
-        """搜索最相关的文档块"""
+    def set_vectors(self, chunks: List[Dict], vectors):
+        """直接设置文本块及其向量（向量已在外部计算好）"""
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.chunks = chunks if isinstance(chunks, ChunkStore) else ChunkStore.from_chunks(chunks)
+        self.index_version = self._compute_version(self.chunks.texts())
+        self._matrix = None
+        self._centroids = None
+        self.projection = None
+    
+    def fit_projection(self, dim: int) -> float:
+        """PCA降维：在单位向量上拟合前dim个主成分，存储的向量替换为投影后的低维向量，返回解释方差占比
+        
+        设单位向量 x = m + c（m为均值），对同一查询 q·m 为常数，按 q·x 排序等价于按 q·c 排序；
+        降维后相似度按 q·m + (qW)·(cW) 近似余弦相似度，检索分数与阈值含义不变。
+        """
+        matrix = self._normalized_matrix()
+        if dim <= 0 or matrix.ndim != 2 or dim >= matrix.shape[1] or not len(matrix):
+            return 1.0
+        block = 65536
+        mean = matrix.mean(axis=0, dtype=np.float64)
+        covariance = np.zeros((matrix.shape[1], matrix.shape[1]), dtype=np.float64)
+        for start in range(0, len(matrix), block):
+            centered = matrix[start:start + block].astype(np.float64) - mean
+            covariance += centered.T @ centered
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)   # 特征值升序
+        order = np.argsort(eigenvalues)[::-1][:dim]
+        components = np.ascontiguousarray(eigenvectors[:, order], dtype=np.float32)
+        explained = float(eigenvalues[order].sum() / max(float(eigenvalues.sum()), 1e-12))
+        
+        mean = mean.astype(np.float32)
+        projected = np.empty((len(matrix), dim), dtype=np.float32)
+        for start in range(0, len(matrix), block):
+            projected[start:start + block] = (matrix[start:start + block] - mean) @ components
+        self.vectors = projected
+        self.projection = {'mean': mean, 'components': components, 'explained_variance': explained}
+        self._matrix = None
+        self._centroids = None
+        print(f"✅ PCA降维 {components.shape[0]} -> {dim} 维，解释方差 {explained:.1%}")
+        return explained
+    
+    def search(self, query: str, top_k: int = 5, mmr: bool = None, mmr_lambda: float = None,
+               candidate_pool: int = None, filters: Dict = None,
+               hierarchical: bool = None) -> List[Tuple[Dict, float]]:
+        """搜索最相关的文档块
+        
+        mmr: 是否按最大边际相关性（MMR）去除近似重复的结果，默认取Config.MMR_ENABLED
+        mmr_lambda: 相关性与多样性的权衡，1为只看相关性，越小越偏向多样性
+        candidate_pool: MMR的候选集大小
+        filters: 元数据过滤条件（见 ChunkStore.filter_rows），只对满足条件的文本块计算相似度
+        hierarchical: 是否先按小节中心向量粗选小节，默认取Config.HIERARCHICAL_SEARCH_ENABLED
+        """
+        if hierarchical is None:
+            hierarchical = Config.HIERARCHICAL_SEARCH_ENABLED
         # 编码查询
-        query_vector = self.model.encode([query])
+        with metrics.span('query_embedding'):
+            query_vector = self._encode_query(query)
+        with metrics.span('search'):
+            if Config.MMR_ENABLED if mmr is None else mmr:
+                return self.search_mmr(query_vector[0], top_k, mmr_lambda, candidate_pool, filters,
+                                       hierarchical)
+            return self.search_by_vector(query_vector[0], top_k, filters, hierarchical)
+    
+    def _normalized_matrix(self) -> np.ndarray:
+        """单位化的向量矩阵 (n, dim)，点积即余弦相似度
         
-        # 计算相似度
-        similarities = []
-        for vector in self.vectors:
-            similarity = np.dot(query_vector[0], vector) / (
-                np.linalg.norm(query_vector[0]) * np.linalg.norm(vector)
-            )
-            similarities.append(similarity)
+        PCA降维后为投影向量本身；保存时已单位化的索引直接使用内存映射，无需复制，
+        多个工作进程共享同一份页缓存。
+        """
+        if self._matrix is None and self.projection is not None:
+            self._matrix = np.asarray(self.vectors, dtype=np.float32)
+        if self._matrix is None:
+            matrix = np.array(self.vectors, dtype=np.float32)  # 复制：vectors可能是只读内存映射
+            if matrix.ndim == 2 and len(matrix):
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix /= np.maximum(norms, 1e-12)
+            self._matrix = matrix
+        return self._matrix
+    
+    def _prepare_query(self, query_vector: np.ndarray) -> Tuple[np.ndarray, float]:
+        """单位化查询向量；PCA降维时投影到低维空间，返回 (查询向量, 相似度的常数项 q·m)"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        if self.projection is None:
+            return query, 0.0
+        return query @ self.projection['components'], float(query @ self.projection['mean'])
+    
+    def _similarities(self, query_vector: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """查询向量与文档块的余弦相似度（rows为None时计算全部，否则只计算指定行）"""
+        query, offset = self._prepare_query(query_vector)
+        matrix = self._normalized_matrix()
+        scores = (matrix if rows is None else matrix[rows]) @ query
+        return scores + np.float32(offset) if offset else scores
+    
+    def _unit_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """指定行的原始空间单位向量（PCA降维时由投影重建，用于MMR计算两两相似度）"""
+        matrix = self._normalized_matrix()[rows]
+        if self.projection is None:
+            return matrix
+        restored = matrix @ self.projection['components'].T + self.projection['mean']
+        return restored / np.maximum(np.linalg.norm(restored, axis=1, keepdims=True), 1e-12)
+    
+    def section_centroids(self) -> Tuple[np.ndarray, np.ndarray]:
+        """各小节的中心向量：小节内单位向量的均值再单位化，返回 (小节编号, 中心向量矩阵)
+        
+        小节编号与 chunks.posting('section_index', ...) 的取值一一对应（升序），
+        未标注小节的文本块（section_index=-1）合为一组。PCA降维时为投影向量的均值（不单位化），
+        与查询的点积即小节内平均相似度（去掉常数项）。
+        """
+        if self._centroids is None:
+            matrix = self._normalized_matrix()
+            sections, starts, rows = self.chunks.posting_index('section_index')
+            centroids = np.zeros((len(sections), matrix.shape[1] if matrix.ndim == 2 else 0), dtype=np.float32)
+            # 倒排中的行号已按小节分组；文本块数相同的小节一起取出 (小节数, 块数, dim) 后求和，
+            # 分批处理以免一次复制整个矩阵
+            sizes = np.diff(starts)
+            for size in np.unique(sizes):
+                same = np.flatnonzero(sizes == size)
+                step = max(1, 65536 // int(size))
+                for i in range(0, len(same), step):
+                    batch = same[i:i + step]
+                    members = rows[starts[batch][:, np.newaxis] + np.arange(size)]
+                    centroids[batch] = matrix[members].sum(axis=1)
+            if self.projection is None:
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+            else:
+                centroids /= np.maximum(sizes, 1)[:, np.newaxis]
+            self._centroids = (sections, centroids)
+        return self._centroids
+    
+    def _section_rows(self, query_vector: np.ndarray, top_k: int, top_sections: int = None) -> np.ndarray:
+        """粗选：按与小节中心的相似度取前top_sections个小节（合计文本块不足top_k时继续扩展），返回其行号"""
+        top_sections = top_sections or Config.HIERARCHICAL_TOP_SECTIONS
+        sections, centroids = self.section_centroids()
+        _, starts, rows = self.chunks.posting_index('section_index')
+        query, _ = self._prepare_query(query_vector)
+        order = self._top_indices(centroids @ query, len(sections))
+        covered = np.cumsum(np.diff(starts)[order])
+        count = max(min(top_sections, len(order)), int(np.searchsorted(covered, top_k)) + 1)
+        picked = order[:count]
+        return np.sort(np.concatenate([rows[starts[i]:starts[i + 1]] for i in picked]))
+    
+    def _score(self, query_vector: np.ndarray, filters: Dict = None, hierarchical: bool = False,
+               top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """按过滤条件（及分层检索的小节粗选）取出候选行并计算相似度，返回 (行号, 相似度)"""
+        rows = self.chunks.filter_rows(filters)
+        if hierarchical:
+            section_rows = self._section_rows(query_vector, top_k)
+            rows = section_rows if rows is None else np.intersect1d(rows, section_rows, assume_unique=True)
+        if rows is None:
+            rows = np.arange(len(self.chunks))
+            return rows, self._similarities(query_vector)
+        return rows, self._similarities(query_vector, rows)
+    
+    @staticmethod
+    def _top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+        """分数最高的k个下标（降序）"""
+        if k >= len(scores):
+            return np.argsort(-scores, kind='stable')
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        return candidates[np.argsort(-scores[candidates], kind='stable')]
+    
+    def search_by_vector(self, query_vector: np.ndarray, top_k: int = 5, filters: Dict = None,
+                         hierarchical: bool = False) -> List[Tuple[Dict, float]]:
+        """按查询向量搜索最相关的文档块"""
+        if not self.chunks or top_k <= 0:
+            return []
+        
+        # 计算相似度（有过滤条件或分层检索时只计算候选行）
+        rows, similarities = self._score(query_vector, filters, hierarchical, top_k)
+        if not len(rows):
+            return []
         
         # 获取top_k结果
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        return [(self.chunks[rows[i]], float(similarities[i])) for i in self._top_indices(similarities, top_k)]
+    
+    def search_mmr(self, query_vector: np.ndarray, top_k: int = 5, mmr_lambda: float = None,
+                   candidate_pool: int = None, filters: Dict = None,
+                   hierarchical: bool = False) -> List[Tuple[Dict, float]]:
+        """最大边际相关性检索：先取相关性最高的候选集，再逐个选出与已选结果最不重复的文档块
+        
+        每一步的得分为 lambda * 与查询的相似度 - (1 - lambda) * 与已选结果的最大相似度；
+        候选集两两相似度一次矩阵乘法算出。返回的分数仍为与查询的余弦相似度。
+        """
+        if not self.chunks or top_k <= 0:
+            return []
+        mmr_lambda = Config.MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+        candidate_pool = max(top_k, candidate_pool or Config.MMR_CANDIDATE_POOL)
         
-        results = []
-        for idx in top_indices:
-            results.append((self.chunks[idx], similarities[idx]))
+        rows, similarities = self._score(query_vector, filters, hierarchical, candidate_pool)
+        if not len(rows):
+            return []
+        top = self._top_indices(similarities, candidate_pool)
+        candidates = rows[top]
+        relevance = similarities[top]
+        candidate_vectors = self._unit_vectors(candidates)
+        pairwise = candidate_vectors @ candidate_vectors.T
         
-        return results
+        selected = [0]  # 相关性最高的候选必选
+        max_overlap = pairwise[0].copy()
+        available = np.ones(len(candidates), dtype=bool)
+        available[0] = False
+        for _ in range(min(top_k, len(candidates)) - 1):
+            scores = mmr_lambda * relevance - (1 - mmr_lambda) * max_overlap
+            scores[~available] = -np.inf
+            pick = int(np.argmax(scores))
+            selected.append(pick)
+            available[pick] = False
+            np.maximum(max_overlap, pairwise[pick], out=max_overlap)
+        
+        return [(self.chunks[candidates[i]], float(relevance[i])) for i in selected]
+    
+    @staticmethod
+    def _compute_version(texts) -> str:
+        """根据文本块内容计算知识库版本号"""
+        digest = hashlib.md5()
+        for text in texts:
+            digest.update(text.encode('utf-8'))
+            digest.update(b'\x00')
+        return digest.hexdigest()[:16]
+    
+    def _encode_query(self, query: str) -> np.ndarray:
+        """编码查询文本，返回形状为 (1, dim) 的向量"""
+        if self.batcher is not None:
+            return self.batcher.encode(query)[np.newaxis, :]
+        return self.model.encode([query])
     
     def save(self):
-        """保存向量数据库"""
-        data = {
-            'vectors': self.vectors,
-            'chunks': self.chunks
-        }
+        """保存向量数据库：向量为float32的.npy，文本块为列式存储，index.json最后写入作为完成标记
         
-        with open(os.path.join(self.db_path, 'vector_db.pkl'), 'wb') as f:
-            pickle.dump(data, f)
+        向量保存为单位化后的结果（检索只用到余弦相似度），加载后可直接映射使用。
+        """
+        np.save(os.path.join(self.db_path, VECTORS_FILE), self._normalized_matrix())
+        self.chunks.save(self.db_path)
+        sections, centroids = self.section_centroids()
+        np.savez(os.path.join(self.db_path, CENTROIDS_FILE), sections=sections, centroids=centroids)
+        meta = {
+            'format': INDEX_FORMAT,
+            'version': self.index_version,
+            'count': len(self.chunks),
+            'dim': int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0,
+            'normalized': True,
+        }
+        if self.projection is not None:
+            np.savez(os.path.join(self.db_path, PROJECTION_FILE), mean=self.projection['mean'],
+                     components=self.projection['components'])
+            meta['projection'] = {
+                'file': PROJECTION_FILE,
+                'input_dim': int(self.projection['components'].shape[0]),
+                'dim': int(self.projection['components'].shape[1]),
+                'explained_variance': round(self.projection['explained_variance'], 6),
+            }
+        tmp_file = os.path.join(self.db_path, INDEX_FILE + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, os.path.join(self.db_path, INDEX_FILE))
         
         print(f"向量数据库已保存到 {self.db_path}")
     
+    def _load_centroids(self):
+        """读取保存的小节中心向量；文件缺失或与当前小节不一致时返回None（检索时重新计算）"""
+        centroids_file = os.path.join(self.db_path, CENTROIDS_FILE)
+        if not os.path.exists(centroids_file):
+            return None
+        with np.load(centroids_file) as data:
+            sections, centroids = data['sections'], data['centroids']
+        if not np.array_equal(sections, self.chunks.posting_index('section_index')[0]):
+            return None
+        return sections, centroids
+    
+    def publish(self) -> str:
+        """保存为新的版本目录并原子切换 CURRENT 指针，返回版本名（读取旧版本的进程不受影响）"""
+        name, path = index_versions.create_version_dir(self.root_path)
+        self.db_path = path
+        self.save()
+        index_versions.publish(self.root_path, name)
+        self.version_name = name
+        removed = index_versions.prune(self.root_path)
+        print(f"✅ 已发布知识库版本 {name}" + (f"，清理旧版本 {len(removed)} 个" if removed else ""))
+        return name
+    
+    def load_latest(self):
+        """CURRENT 指向了新版本时，加载为新的VectorStore（共享向量模型与批处理器）并返回，否则返回None"""
+        name = index_versions.current_version(self.root_path)
+        if name is None or name == self.version_name:
+            return None
+        store = VectorStore(load_model=False, db_path=self.root_path)
+        if store.version_name != name or not store.load():
+            return None
+        store.model, store.batcher = self.model, self.batcher
+        # 切换前准备好检索用的矩阵，避免切换后的第一个查询承担构建开销
+        store._normalized_matrix()
+        if Config.HIERARCHICAL_SEARCH_ENABLED:
+            store.section_centroids()
+        return store
+    
     def load(self):
-        """加载向量数据库"""
-        db_file = os.path.join(self.db_path, 'vector_db.pkl')
+        """加载向量数据库（向量与文本均以内存映射方式打开）"""
+        index_file = os.path.join(self.db_path, INDEX_FILE)
+        if os.path.exists(index_file) and ChunkStore.exists(self.db_path):
+            with open(index_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.vectors = np.load(os.path.join(self.db_path, VECTORS_FILE), mmap_mode='r')
+            self.chunks = ChunkStore.load(self.db_path)
+            # 已单位化的向量直接作为检索矩阵（只读内存映射）；旧索引加载后再单位化
+            self._matrix = self.vectors if meta.get('normalized') else None
+            self.projection = None
+            if meta.get('projection'):
+                with np.load(os.path.join(self.db_path, meta['projection']['file'])) as data:
+                    self.projection = {'mean': data['mean'], 'components': data['components'],
+                                       'explained_variance': meta['projection'].get('explained_variance', 0.0)}
+            self._centroids = self._load_centroids()
+            self.index_version = meta.get('version') or self._compute_version(self.chunks.texts())
+            print(f"向量数据库已加载，共 {len(self.vectors)} 个向量")
+            return True
         
+        # 兼容旧版pickle格式：加载后转换为新格式保存，下次启动直接映射
+        db_file = os.path.join(self.db_path, LEGACY_DB_FILE)
         if os.path.exists(db_file):
             with open(db_file, 'rb') as f:
                 data = pickle.load(f)
             
-            self.vectors = data['vectors']
-            self.chunks = data['chunks']
+            self.set_vectors(data['chunks'], data['vectors'])
+            self.index_version = data.get('version') or self.index_version
             print(f"向量数据库已加载，共 {len(self.vectors)} 个向量")
+            try:
+                self.save()
+                print("已转换为列式存储格式")
+            except OSError as e:
+                print(f"⚠️ 转换向量数据库格式失败: {e}")
             return True
         else:
             print("向量数据库文件不存在")
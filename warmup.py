@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+启动预热与导入耗时分析
+
+AgentWarmup 在后台线程中导入重量级依赖（torch、sentence_transformers、dashscope）并创建
+IntelligentAgent，界面可以立即渲染并展示加载进度，就绪后再开放问答。
+
+用法：
+  python warmup.py                 # 各模块导入耗时报告（每个模块在独立子进程中冷启动测量）
+  python warmup.py --warmup        # 额外测量完整预热（导入 + 模型与知识库加载）
+"""
+
+import argparse
+import importlib
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from config import Config
+from metrics import metrics
+
+# 预热时提前导入的重量级依赖
+HEAVY_MODULES = ['torch', 'sentence_transformers', 'dashscope']
+
+# 导入耗时报告默认分析的模块
+PROFILE_MODULES = ['config', 'agent', 'llm_client', 'vector_store', 'pdf_processor',
+                   'sentence_transformers', 'dashscope', 'streamlit']
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)')
+
+
+class AgentWarmup:
+    """后台加载Agent，提供就绪状态与各步骤耗时"""
+
+    def __init__(self, agent_factory: Optional[Callable] = None,
+                 heavy_modules: List[str] = HEAVY_MODULES):
+        self._agent_factory = agent_factory
+        self.heavy_modules = heavy_modules
+        self.agent = None
+        self.state = 'pending'          # pending / loading / ready / failed
+        self.step = ''                  # 当前步骤说明（界面展示用）
+        self.steps: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> 'AgentWarmup':
+        """启动后台加载（重复调用无副作用）"""
+        with self._lock:
+            if self.state != 'pending':
+                return self
+            self.state = 'loading'
+            self.started_at = time.time()
+        threading.Thread(target=self._run, name='agent-warmup', daemon=True).start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def _timed(self, step: str, label: str, func: Callable):
+        self.step = label
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        self.steps[step] = elapsed
+        metrics.observe(f'startup_{step}', elapsed)
+        return result
+
+    def _import_heavy_modules(self):
+        for name in self.heavy_modules:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                # 缺失的依赖由后续创建Agent时报告
+                print(f"⚠️ 预热导入 {name} 失败: {e}")
+
+    def _create_agent(self):
+        if self._agent_factory is None:
+            from agent import IntelligentAgent
+            self._agent_factory = IntelligentAgent
+        return self._agent_factory()
+
+    def _run(self):
+        try:
+            self._timed('imports', '导入依赖库', self._import_heavy_modules)
+            self.agent = self._timed('agent_init', '加载模型与知识库', self._create_agent)
+            self.state = 'ready'
+            self._ready.set()
+            print(f"✅ 预热完成，用时 {time.time() - self.started_at:.1f}s")
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            print(f"❌ 预热失败: {e}")
+        finally:
+            self.finished_at = time.time()
+            self.step = ''
+
+    def status(self) -> Dict:
+        """加载状态：state、当前步骤、已用时间与各步骤耗时"""
+        end = self.finished_at or time.time()
+        return {
+            'state': self.state,
+            'step': self.step,
+            'elapsed_seconds': round(end - self.started_at, 3) if self.started_at else 0.0,
+            'steps': {k: round(v, 3) for k, v in self.steps.items()},
+            'error': self.error,
+        }
+
+
+_warmup: Optional[AgentWarmup] = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup() -> AgentWarmup:
+    """进程级预热实例（Streamlit各会话共享同一个Agent），首次调用时开始加载"""
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            # 使用独立向量化进程时本进程不加载torch
+            heavy = ['dashscope'] if Config.EMBEDDING_SERVICE_SOCKET else HEAVY_MODULES
+            _warmup = AgentWarmup(heavy_modules=heavy).start()
+    return _warmup
+
+
+def profile_import(module: str, top_n: int = 3) -> Dict:
+    """在全新子进程中用 -X importtime 测量模块的冷启动导入耗时"""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          capture_output=True, text=True)
+    wall = time.perf_counter() - started
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((match.group(3), int(match.group(2))))
+    target = next((cum for name, cum in entries if name == module), 0)
+
+    # 按顶层包聚合，取各包耗时最大的一次导入
+    packages: Dict[str, int] = {}
+    for name, cumulative in entries:
+        root = name.split('.')[0]
+        if root != module:
+            packages[root] = max(packages.get(root, 0), cumulative)
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top_n]
+
+    error = ''
+    if proc.returncode != 0:
+        error = (proc.stderr.strip().splitlines() or ['未知错误'])[-1]
+    return {
+        'module': module,
+        'ok': proc.returncode == 0,
+        'import_ms': round(target / 1000, 1),
+        'process_ms': round(wall * 1000, 1),
+        'slowest': [(name, round(us / 1000, 1)) for name, us in slowest],
+        'error': error,
+    }
+
+
+def print_profile_report(results: List[Dict]):
+    print("\n📊 模块导入耗时（冷启动，每个模块独立子进程）")
+    print("=" * 72)
+    print(f"{'模块':<24}{'导入(ms)':>12}{'进程(ms)':>12}  最慢依赖")
+    for result in results:
+        if not result['ok']:
+            print(f"{result['module']:<24}{'-':>12}{result['process_ms']:>12}  ❌ {result['error']}")
+            continue
+        slowest = ', '.join(f"{name} {ms}" for name, ms in result['slowest'])
+        print(f"{result['module']:<24}{result['import_ms']:>12}{result['process_ms']:>12}  {slowest}")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="启动耗时分析")
+    parser.add_argument('modules', nargs='*', default=PROFILE_MODULES, help='要分析的模块')
+    parser.add_argument('--top', type=int, default=3, help='每个模块列出的最慢依赖数')
+    parser.add_argument('--warmup', action='store_true', help='额外测量完整预热耗时')
+    args = parser.parse_args(argv)
+
+    print_profile_report([profile_import(module, args.top) for module in args.modules])
+
+    if args.warmup:
+        print("\n🔥 完整预热")
+        print("-" * 72)
+        warmup = AgentWarmup().start()
+        while warmup.state == 'loading':
+            time.sleep(0.1)
+        status = warmup.status()
+        for step, seconds in status['steps'].items():
+            print(f"{step:<24}{seconds * 1000:>12.1f} ms")
+        print(f"{'total':<24}{status['elapsed_seconds'] * 1000:>12.1f} ms  状态: {status['state']}")
+        if status['error']:
+            print(f"❌ {status['error']}")
+
+
+if __name__ == "__main__":
+    main()